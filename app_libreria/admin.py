@@ -1,10 +1,233 @@
 ﻿from django.contrib import admin
-from .models import Categoria, Libro, Proveedor, Inventario, CarritoItem, Pedido
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+from .models import (
+    ActivosManager, Categoria, Libro, Proveedor, Inventario, CarritoItem, Pedido, DetallePedido, Reserva, Sucursal, ExistenciaSucursal,
+    MovimientoStock,
+)
+from . import borrado
+from .reservas import liberar
+from .sucursales import fijar
+
+# =======================================================
+# ADMIN DE DJANGO PREPARADO PARA TABLAS GRANDES
+# =======================================================
+# - list_select_related: sin una consulta extra por renglón para las FK.
+# - autocomplete_fields: los <select> de FK ya no cargan todos los usuarios/libros.
+#   Sus resultados se paginan con el `ordering` del admin del modelo destino.
+# - show_full_result_count=False + PaginadorEstimado: sin COUNT(*) sobre toda la tabla.
+
+
+def estimar_filas(model):
+    """Número aproximado de renglones sin recorrer la tabla."""
+    tabla = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [tabla])
+            fila = cursor.fetchone()
+            if fila and fila[0] > 0:
+                return fila[0]
+        elif connection.vendor == 'sqlite':
+            # Lo llena ANALYZE (housekeeping); el primer número de cada índice es su cantidad de
+            # filas y el mayor es el de la tabla (los índices parciales cubren menos)
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone():
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [tabla])
+                filas = [int(stat.split()[0]) for stat, in cursor.fetchall()]
+                if filas and max(filas) > 0:
+                    return max(filas)
+        # Sin estadísticas: la llave primaria es autoincremental y MAX(id) es una búsqueda en el índice
+        cursor.execute(f'SELECT MAX({connection.ops.quote_name(model._meta.pk.column)}) FROM {connection.ops.quote_name(tabla)}')
+        return cursor.fetchone()[0] or 0
+
+
+class PaginadorEstimado(Paginator):
+    """Usa una estimación cuando el listado no tiene filtros; con filtros cuenta de verdad.
+
+    El filtro de borrado lógico de ActivosManager no cuenta como filtro del
+    listado: se estima el total y se restan los marcados como eliminados, que
+    son pocos y se cuentan sobre un índice parcial.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None:
+            return super().count
+        model = self.object_list.model
+        if not query.where:
+            return estimar_filas(model)
+        if isinstance(model._default_manager, ActivosManager) and query.where == model._default_manager.all().query.where:
+            return max(estimar_filas(model) - model._base_manager.filter(eliminado=True).count(), 0)
+        return super().count
+
+
+class AdminTablaGrande(admin.ModelAdmin):
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+    list_per_page = 50
+
+
+class AdminBorradoLogico:
+    """Borrar desde el admin solo marca las filas (borrado.py); la cascada la hace purge_deleted.
+
+    La confirmación (de uno o con la acción delete_selected) tampoco recorre
+    los renglones relacionados: ninguno se borra en este momento.
+    """
+
+    def get_deleted_objects(self, objs, request):
+        objs = list(objs)
+        return [str(obj) for obj in objs], {self.opts.verbose_name_plural: len(objs)}, set(), []
+
 
 # Registramos los modelos para que aparezcan en el panel de administrador
-admin.site.register(Categoria)
-admin.site.register(Libro)
-admin.site.register(Proveedor)
-admin.site.register(Inventario)
-admin.site.register(CarritoItem)
-admin.site.register(Pedido)
\ No newline at end of file
+@admin.register(Categoria)
+class CategoriaAdmin(AdminBorradoLogico, admin.ModelAdmin):
+    list_display = ('nombre', 'color')
+    search_fields = ('nombre',)
+    ordering = ('nombre',)
+
+    def delete_model(self, request, obj):
+        borrado.eliminar_categoria(obj.pk)
+
+    def delete_queryset(self, request, queryset):
+        for categoria_id in queryset.values_list('pk', flat=True):
+            borrado.eliminar_categoria(categoria_id)
+
+
+@admin.register(Proveedor)
+class ProveedorAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'contacto', 'telefono', 'email', 'dias_entrega')
+    search_fields = ('nombre',)
+    ordering = ('nombre',)
+
+
+@admin.register(Libro)
+class LibroAdmin(AdminBorradoLogico, AdminTablaGrande):
+    list_display = ('titulo', 'autor', 'categoria', 'proveedor', 'precio', 'isbn')
+    list_select_related = ('categoria', 'proveedor')
+    list_filter = ('categoria',)
+    # '=' y '^' permiten a la base usar los índices de isbn, título y autor
+    search_fields = ('=isbn', '^titulo', '^autor')
+    autocomplete_fields = ('categoria', 'proveedor')
+    date_hierarchy = 'fecha_publicacion'
+    ordering = ('titulo', 'id')  # Recorre libro_titulo_idx; el id desempata
+
+    def delete_model(self, request, obj):
+        borrado.eliminar_libros([obj.pk])
+
+    def delete_queryset(self, request, queryset):
+        borrado.eliminar_libros(list(queryset.values_list('pk', flat=True)))
+
+
+@admin.register(Inventario)
+class InventarioAdmin(AdminTablaGrande):
+    list_display = ('libro', 'cantidad', 'reservado', 'stock_minimo', 'pedido_sugerido', 'ultima_actualizacion')
+    list_select_related = ('libro',)
+    search_fields = ('=libro__isbn', '^libro__titulo')
+    autocomplete_fields = ('libro',)
+    date_hierarchy = 'ultima_actualizacion'
+    # cantidad y reservado son los totales de las sucursales (se capturan en Existencias por sucursal)
+    readonly_fields = ('libro', 'cantidad', 'reservado', 'demanda_diaria', 'pedido_sugerido')
+
+    def has_add_permission(self, request):
+        return False  # Se crea al dar de alta la primera existencia del libro
+
+    def has_delete_permission(self, request, obj=None):
+        return False  # Sin sus existencias los totales quedarían desalineados
+
+    def save_model(self, request, obj, form, change):
+        obj.save(update_fields=['stock_minimo', 'ultima_actualizacion'])
+
+
+@admin.register(Sucursal)
+class SucursalAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'prioridad', 'activa', 'cantidad', 'reservado')
+    list_editable = ('prioridad', 'activa')
+    search_fields = ('nombre',)
+
+
+@admin.register(ExistenciaSucursal)
+class ExistenciaSucursalAdmin(AdminTablaGrande):
+    list_display = ('libro', 'sucursal', 'cantidad', 'reservado', 'stock_minimo', 'ultima_actualizacion')
+    list_select_related = ('libro', 'sucursal')
+    list_filter = ('sucursal',)
+    search_fields = ('=libro__isbn', '^libro__titulo')
+    autocomplete_fields = ('libro',)
+    readonly_fields = ('reservado',)
+
+    def get_readonly_fields(self, request, obj=None):
+        # Cambiar de libro o sucursal una fila existente rompería los totales de ambos
+        return self.readonly_fields + (('libro', 'sucursal') if obj else ())
+
+    def save_model(self, request, obj, form, change):
+        obj.pk = fijar(obj.sucursal_id, obj.libro_id, obj.cantidad, obj.stock_minimo).pk
+
+
+@admin.register(MovimientoStock)
+class MovimientoStockAdmin(AdminTablaGrande):
+    # Bitácora de solo lectura: los movimientos los escribe sucursales.py
+    list_display = ('fecha', 'libro', 'sucursal', 'tipo', 'cantidad')
+    list_select_related = ('libro', 'sucursal')
+    list_filter = ('tipo', 'sucursal')
+    search_fields = ('=libro__isbn',)
+    date_hierarchy = 'fecha'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Reserva)
+class ReservaAdmin(AdminTablaGrande):
+    # Solo lectura: las reservas las escribe reservas.py y mueven los totales de las sucursales
+    list_display = ('clave', 'libro', 'sucursal', 'cantidad', 'expira')
+    list_select_related = ('libro', 'sucursal')
+    search_fields = ('=clave', '=libro__isbn')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    # Borrarlas sí se puede (un carrito atorado), pero soltando sus unidades
+    def delete_model(self, request, obj):
+        liberar([obj.clave], ids=[obj.pk])
+
+    def delete_queryset(self, request, queryset):
+        claves, ids = set(), []
+        for pk, clave in queryset.values_list('pk', 'clave'):
+            claves.add(clave)
+            ids.append(pk)
+        liberar(claves, ids=ids)
+
+
+@admin.register(CarritoItem)
+class CarritoItemAdmin(AdminTablaGrande):
+    list_display = ('usuario', 'libro', 'cantidad', 'actualizado')
+    list_select_related = ('usuario', 'libro')
+    search_fields = ('=usuario__username', '=libro__isbn')
+    autocomplete_fields = ('usuario', 'libro')
+
+
+class DetallePedidoInline(admin.TabularInline):
+    model = DetallePedido
+    extra = 0
+    autocomplete_fields = ('libro',)
+
+
+@admin.register(Pedido)
+class PedidoAdmin(AdminTablaGrande):
+    list_display = ('id', 'usuario', 'sucursal', 'total', 'fecha')
+    list_select_related = ('usuario', 'sucursal')
+    search_fields = ('=id', '=usuario__username')
+    autocomplete_fields = ('usuario',)
+    date_hierarchy = 'fecha'
+    inlines = (DetallePedidoInline,)
@@ -0,0 +1,208 @@
+import hashlib
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.views.decorators.http import require_GET
+
+from .models import Libro, Categoria, Inventario, LibroSimilar
+from .catalogo import version_catalogo, obtener_catalogo
+from .autocompletar import sugerencias
+
+try:
+    import orjson
+except ImportError:  # Opcional: si no está, usamos json de la biblioteca estándar
+    orjson = None
+
+# =======================================================
+# API JSON DE LA TIENDA
+# =======================================================
+
+MAX_LIMITE = 200
+MAX_IDS = 500
+
+CAMPOS_LIBRO = ('id', 'titulo', 'autor', 'categoria_id', 'proveedor_id', 'editorial', 'descripcion',
+                'precio', 'paginas', 'isbn', 'fecha_publicacion', 'imagen_url')
+CAMPOS_LIBRO_DEFAULT = ('id', 'titulo', 'autor', 'categoria_id', 'precio', 'isbn', 'imagen_url')
+CAMPOS_CATEGORIA = ('id', 'nombre', 'descripcion', 'color')
+CAMPOS_INVENTARIO = ('libro_id', 'cantidad', 'reservado', 'stock_minimo', 'ultima_actualizacion')
+
+
+class ErrorAPI(Exception):
+    pass
+
+
+def _serializar_extra(valor):
+    if isinstance(valor, Decimal):
+        return str(valor)
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    raise TypeError(f'No se puede serializar {type(valor).__name__}')
+
+
+def _json(datos):
+    if orjson is not None:
+        return orjson.dumps(datos, default=_serializar_extra)
+    return json.dumps(datos, separators=(',', ':'), ensure_ascii=False, default=_serializar_extra).encode()
+
+
+def _etag(request):
+    # Cualquier cambio de Libro/Categoria/Inventario sube la versión del catálogo (ver signals.py),
+    # así que versión + parámetros identifican la respuesta sin tocar la base
+    firma = hashlib.md5(request.get_full_path().encode(), usedforsecurity=False).hexdigest()[:16]
+    return f'"{version_catalogo()}-{firma}"'
+
+
+def endpoint_catalogo(vista=None, *, con_etag=True):
+    """Maneja ETag/304, errores de parámetros y la serialización de la respuesta.
+
+    con_etag=False para respuestas que cambian sin subir la versión del
+    catálogo (las reservas de stock se mueven con UPDATE, sin señales).
+    """
+    if vista is None:
+        return lambda v: endpoint_catalogo(v, con_etag=con_etag)
+
+    @require_GET
+    def envoltura(request, *args, **kwargs):
+        etag = _etag(request) if con_etag else None
+        if etag and etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+        else:
+            try:
+                datos = vista(request, *args, **kwargs)
+            except ErrorAPI as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            response = HttpResponse(_json(datos), content_type='application/json')
+        if etag:
+            response['ETag'] = etag
+            response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+        else:
+            response['Cache-Control'] = 'no-cache'
+        return response
+    envoltura.__name__ = vista.__name__
+    envoltura.__doc__ = vista.__doc__
+    return envoltura
+
+
+def _campos(request, permitidos, default):
+    """?fields=id,titulo -> tupla validada para values()."""
+    texto = request.GET.get('fields')
+    if not texto:
+        return default
+    campos = tuple(dict.fromkeys(c.strip() for c in texto.split(',') if c.strip()))
+    invalidos = [c for c in campos if c not in permitidos]
+    if invalidos:
+        raise ErrorAPI(f"Campos no válidos: {', '.join(invalidos)}")
+    return campos
+
+
+def _lista(request, nombre, convertir=str):
+    texto = request.GET.get(nombre)
+    if not texto:
+        return None
+    try:
+        valores = [convertir(v.strip()) for v in texto.split(',') if v.strip()]
+    except ValueError:
+        raise ErrorAPI(f'Valor no válido en {nombre}')
+    if len(valores) > MAX_IDS:
+        raise ErrorAPI(f'Máximo {MAX_IDS} valores en {nombre}')
+    return valores
+
+
+def _entero(request, nombre, default, minimo=0, maximo=None):
+    try:
+        valor = int(request.GET.get(nombre, default))
+    except ValueError:
+        raise ErrorAPI(f'{nombre} debe ser un número entero')
+    valor = max(valor, minimo)
+    return min(valor, maximo) if maximo else valor
+
+
+def _pagina(queryset, request, campos, clave='id'):
+    """Paginación por llave (keyset): ?despues=<ultimo id>&limite=N, sin OFFSET."""
+    limite = _entero(request, 'limite', 50, 1, MAX_LIMITE)
+    despues = _entero(request, 'despues', 0)
+    columnas = campos if clave in campos else (clave,) + campos
+    filas = list(queryset.filter(**{f'{clave}__gt': despues}).order_by(clave).values(*columnas)[:limite + 1])
+    siguiente = filas[limite - 1][clave] if len(filas) > limite else None
+    filas = filas[:limite]
+    if clave not in campos:
+        for fila in filas:
+            del fila[clave]
+    return {'resultados': filas, 'siguiente': siguiente}
+
+
+# 1. AUTOCOMPLETADO DEL BUSCADOR (sin consultas: índice en memoria)
+@require_GET
+def autocompletar(request):
+    texto = request.GET.get('q', '')[:100]
+    try:
+        limite = min(max(int(request.GET.get('limite', 8)), 1), 20)
+    except ValueError:
+        limite = 8
+    resultados = [
+        {'id': l.id, 'titulo': l.titulo, 'autor': l.autor, 'categoria_id': l.categoria_id}
+        for l in sugerencias(texto, limite)
+    ]
+    response = JsonResponse({'q': texto, 'resultados': resultados})
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
+
+
+# 2. LIBROS: ?fields=, ?ids=1,2 o ?isbn=a,b (una consulta), ?categoria=, paginación por llave
+@endpoint_catalogo
+def libros(request):
+    campos = _campos(request, CAMPOS_LIBRO, CAMPOS_LIBRO_DEFAULT)
+    ids = _lista(request, 'ids', int)
+    isbns = _lista(request, 'isbn')
+    if ids is not None or isbns is not None:
+        queryset = Libro.objects.filter(id__in=ids) if ids is not None else Libro.objects.filter(isbn__in=isbns)
+        return {'resultados': list(queryset.order_by('id').values(*campos))}
+
+    queryset = Libro.objects.all()
+    if 'categoria' in request.GET:
+        queryset = queryset.filter(categoria_id=_entero(request, 'categoria', 0))
+    return _pagina(queryset, request, campos)
+
+
+# 3. CATEGORÍAS
+@endpoint_catalogo
+def categorias(request):
+    campos = _campos(request, CAMPOS_CATEGORIA, CAMPOS_CATEGORIA)
+    return {'resultados': list(Categoria.objects.order_by('id').values(*campos))}
+
+
+# 4. DISPONIBILIDAD DE INVENTARIO: ?libros=1,2,3
+@endpoint_catalogo(con_etag=False)
+def inventario(request):
+    campos = _campos(request, CAMPOS_INVENTARIO, ('libro_id', 'cantidad', 'reservado'))
+    libro_ids = _lista(request, 'libros', int)
+    queryset = Inventario.objects.filter(libro__eliminado=False)
+    if libro_ids is not None:
+        filas = list(queryset.filter(libro_id__in=libro_ids).order_by('libro_id').values(*campos))
+        datos = {'resultados': filas}
+    else:
+        datos = _pagina(queryset, request, campos, clave='libro_id')
+    if 'cantidad' in campos and 'reservado' in campos:
+        for fila in datos['resultados']:
+            fila['unidades_disponibles'] = max(fila['cantidad'] - fila['reservado'], 0)
+            fila['disponible'] = fila['unidades_disponibles'] > 0
+    return datos
+
+
+# 5. LIBROS PARECIDOS POR CONTENIDO (precalculados con manage.py similares; una lectura por índice)
+# Sin ETag: el cálculo nocturno cambia los vecinos sin subir la versión del catálogo
+@endpoint_catalogo(con_etag=False)
+def similares(request, libro_id):
+    limite = _entero(request, 'limite', 10, 1, 50)
+    catalogo = obtener_catalogo()
+    resultados = []
+    filas = LibroSimilar.objects.filter(libro_id=libro_id).order_by('posicion').values_list('similar_id', 'puntaje')
+    for similar_id, puntaje in filas[:limite]:
+        libro = catalogo.libro(similar_id)
+        if libro is not None:
+            resultados.append({'id': libro.id, 'titulo': libro.titulo, 'autor': libro.autor,
+                               'categoria_id': libro.categoria_id, 'precio': libro.precio,
+                               'puntaje': round(puntaje, 4)})
+    return {'libro_id': libro_id, 'resultados': resultados}
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class AppLibreriaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app_libreria'
+
+    def ready(self):
+        # Conecta los receptores que mantienen al día las estructuras en memoria
+        from . import signals  # noqa: F401
+
+        from .arranque import calentamiento_activo, calentar_sin_base
+        if calentamiento_activo():
+            calentar_sin_base()
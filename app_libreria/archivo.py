@@ -0,0 +1,190 @@
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Sum
+
+from .models import DB_ARCHIVO, Pedido, DetallePedido, PedidoArchivado, DetallePedidoArchivado
+
+# =======================================================
+# ARCHIVO HISTÓRICO DE PEDIDOS EN UNA BASE APARTE
+# =======================================================
+# Los pedidos viejos se mueven a DATABASES['archivo'] para que la base
+# principal (carritos, catálogo, pedidos recientes) se quede chica y sus
+# índices quepan en memoria. Solo se lee el archivo al pedirlo
+# explícitamente: PedidoArchivado.objects siempre va a esa base y nada del
+# camino caliente lo usa.
+
+MODELOS_ARCHIVO = {PedidoArchivado._meta.label_lower, DetallePedidoArchivado._meta.label_lower}
+
+# Origen -> destino; las columnas coinciden una a una
+PARES = [(Pedido, PedidoArchivado), (DetallePedido, DetallePedidoArchivado)]
+
+
+class ArchivoRouter:
+    """Los modelos *Archivado viven en 'archivo'; todo lo demás en 'default'."""
+
+    def _base(self, model):
+        return DB_ARCHIVO if model._meta.label_lower in MODELOS_ARCHIVO else 'default'
+
+    def db_for_read(self, model, **hints):
+        # Explícito también para 'default': sin esto, pedido_archivado.usuario
+        # buscaría al usuario en la base del objeto (la de archivo)
+        return self._base(model)
+
+    def db_for_write(self, model, **hints):
+        return self._base(model)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if model_name is None:
+            return None
+        es_archivo = f'{app_label}.{model_name}' in MODELOS_ARCHIVO
+        return db == DB_ARCHIVO if es_archivo else db == 'default'
+
+
+class ErrorVerificacion(Exception):
+    pass
+
+
+def archivo_configurado():
+    return DB_ARCHIVO in settings.DATABASES
+
+
+def archivo_listo():
+    """Configurado y con tablas (migrate --database=archivo)."""
+    if not archivo_configurado():
+        return False
+    try:
+        return PedidoArchivado._meta.db_table in connections[DB_ARCHIVO].introspection.table_names()
+    except DatabaseError:
+        return False
+
+
+def _columnas(model):
+    return [f.column for f in model._meta.concrete_fields]
+
+
+def _nombres(model):
+    return [f.attname for f in model._meta.concrete_fields]
+
+
+def _resumen(model, pedido_ids, using):
+    """(filas, suma de dinero) para verificar la copia."""
+    if model in (Pedido, PedidoArchivado):
+        queryset = model._base_manager.using(using).filter(id__in=pedido_ids)
+        return queryset.count(), queryset.aggregate(s=Sum('total'))['s'] or 0
+    queryset = model._base_manager.using(using).filter(pedido_id__in=pedido_ids)
+    return queryset.count(), queryset.aggregate(s=Sum('precio_unitario'))['s'] or 0
+
+
+def _ambas_sqlite():
+    return all(connections[a].vendor == 'sqlite' for a in ('default', DB_ARCHIVO))
+
+
+class Archivador:
+    """Mueve pedidos por lotes. Con SQLite adjunta el archivo (ATTACH) y cada lote
+    es una sola transacción sobre los dos ficheros: o se movió completo o no se movió."""
+
+    def __init__(self, lote=500, pausa=0.1):
+        self.lote = lote
+        self.pausa = pausa
+        self.adjuntado = False
+
+    def __enter__(self):
+        if _ambas_sqlite():
+            nombre = str(settings.DATABASES[DB_ARCHIVO]['NAME'])
+            Path(nombre).parent.mkdir(parents=True, exist_ok=True)
+            with connections['default'].cursor() as cursor:
+                cursor.execute('ATTACH DATABASE %s AS archivo', [nombre])
+            self.adjuntado = True
+        return self
+
+    def __exit__(self, *exc):
+        if self.adjuntado:
+            with connections['default'].cursor() as cursor:
+                cursor.execute('DETACH DATABASE archivo')
+
+    def siguientes(self, antes_de):
+        return list(
+            Pedido.objects.filter(fecha__lt=antes_de).order_by('fecha', 'id').values_list('id', flat=True)[:self.lote]
+        )
+
+    def mover(self, pedido_ids):
+        """Mueve un lote y regresa {modelo_destino: filas}."""
+        mover = self._mover_adjuntado if self.adjuntado else self._mover_orm
+        esperado = mover(pedido_ids)
+        return {destino: filas for destino, (filas, _) in esperado.items()}
+
+    def _esperado(self, pedido_ids):
+        return {destino: _resumen(origen, pedido_ids, 'default') for origen, destino in PARES}
+
+    def _mover_adjuntado(self, pedido_ids):
+        marcas = ', '.join(['%s'] * len(pedido_ids))
+        with transaction.atomic(using='default'), connections['default'].cursor() as cursor:
+            esperado = self._esperado(pedido_ids)
+            for origen, destino in PARES:
+                columnas = ', '.join(_columnas(destino))
+                filtro = 'id' if origen is Pedido else 'pedido_id'
+                # OR IGNORE: un lote que quedó a medias (WAL + caída) se puede repetir
+                cursor.execute(
+                    f'INSERT OR IGNORE INTO archivo.{destino._meta.db_table} ({columnas}) '
+                    f'SELECT {columnas} FROM main.{origen._meta.db_table} WHERE {filtro} IN ({marcas})',
+                    pedido_ids,
+                )
+            # Verificación dentro de la misma transacción: si no cuadra no se borra nada
+            for origen, destino in PARES:
+                filtro = 'id' if origen is Pedido else 'pedido_id'
+                dinero = 'total' if origen is Pedido else 'precio_unitario'
+                cursor.execute(
+                    f'SELECT COUNT(*), COALESCE(SUM({dinero}), 0) FROM archivo.{destino._meta.db_table} '
+                    f'WHERE {filtro} IN ({marcas})', pedido_ids,
+                )
+                self._verificar(destino, esperado[destino], cursor.fetchone())
+            cursor.execute(f'DELETE FROM main.{DetallePedido._meta.db_table} WHERE pedido_id IN ({marcas})', pedido_ids)
+            cursor.execute(f'DELETE FROM main.{Pedido._meta.db_table} WHERE id IN ({marcas})', pedido_ids)
+        return esperado
+
+    def _mover_orm(self, pedido_ids):
+        # Otros motores: primero se confirma la copia, luego se borra del origen.
+        # Si algo falla entre medias, repetir el lote es seguro (ignore_conflicts).
+        esperado = self._esperado(pedido_ids)
+        with transaction.atomic(using=DB_ARCHIVO):
+            PedidoArchivado.objects.bulk_create(
+                [PedidoArchivado(**f) for f in Pedido.objects.filter(id__in=pedido_ids).values(*_nombres(Pedido))],
+                ignore_conflicts=True,
+            )
+            DetallePedidoArchivado.objects.bulk_create(
+                [DetallePedidoArchivado(**f) for f in DetallePedido.objects.filter(pedido_id__in=pedido_ids).values(*_nombres(DetallePedido))],
+                ignore_conflicts=True,
+            )
+        for _, destino in PARES:
+            self._verificar(destino, esperado[destino], _resumen(destino, pedido_ids, DB_ARCHIVO))
+        Pedido.objects.filter(id__in=pedido_ids).delete()  # Sus líneas se van en cascada
+        return esperado
+
+    def _verificar(self, destino, esperado, obtenido):
+        filas, dinero = obtenido
+        if (filas, round(float(dinero), 2)) != (esperado[0], round(float(esperado[1]), 2)):
+            raise ErrorVerificacion(
+                f'{destino._meta.db_table}: se esperaban {esperado[0]} filas (${esperado[1]}) '
+                f'y el archivo tiene {filas} (${dinero})'
+            )
+
+    def archivar(self, antes_de, max_lotes=None, al_terminar_lote=None):
+        totales = {destino: 0 for _, destino in PARES}
+        lotes = 0
+        while max_lotes is None or lotes < max_lotes:
+            ids = self.siguientes(antes_de)
+            if not ids:
+                break
+            for destino, filas in self.mover(ids).items():
+                totales[destino] += filas
+            lotes += 1
+            if al_terminar_lote:
+                al_terminar_lote(lotes, totales)
+            time.sleep(self.pausa)
+        return totales
@@ -0,0 +1,135 @@
+import asyncio
+import gc
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.template import engines
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+# =======================================================
+# ARRANQUE DE WORKERS: CALENTAMIENTO Y PRELOAD
+# =======================================================
+# Un worker recién creado compila plantillas y URLs y construye el catálogo
+# en sus primeras peticiones. Aquí se hace antes de atender a nadie:
+#
+# 1. AppLibreriaConfig.ready(): plantillas y resolver de URLs (sin base de
+#    datos; Django advierte si se consulta durante la inicialización).
+# 2. wsgi.py / asgi.py, ya con la app cargada: catálogo e índice de
+#    autocompletado.
+#
+# Solo en procesos servidor: wsgi.py y asgi.py ponen LIBRERIA_CALENTAR=1
+# antes de cargar Django, así migrate y los demás comandos no pagan esto.
+#
+# Preload (gunicorn --preload con LIBRERIA_PRELOAD=1): todo lo anterior
+# ocurre una vez en el proceso maestro y los workers lo heredan con fork.
+# Antes de forkear se cierran las conexiones (no deben compartirse entre
+# procesos) y gc.freeze() saca esos objetos del recolector para que no los
+# toque y las páginas de memoria sigan compartidas.
+
+
+def calentamiento_activo():
+    return os.environ.get('LIBRERIA_CALENTAR') == '1' and getattr(settings, 'ARRANQUE_CALENTAR', True)
+
+
+def _nombres_plantillas(directorios):
+    for directorio in directorios:
+        directorio = Path(directorio)
+        if directorio.is_dir():
+            for archivo in directorio.rglob('*.html'):
+                yield archivo.relative_to(directorio).as_posix()
+
+
+def _directorios_django(engine):
+    for loader in engine.template_loaders:
+        # El cached.Loader envuelve a los que realmente saben de directorios
+        for interno in getattr(loader, 'loaders', [loader]):
+            if hasattr(interno, 'get_dirs'):
+                yield from interno.get_dirs()
+
+
+def precompilar_plantillas():
+    """Compila todas las plantillas de cada motor y las deja en su caché."""
+    compiladas = 0
+    for backend in engines.all():
+        if hasattr(backend, 'env'):  # Jinja2
+            nombres = backend.env.list_templates(extensions=['html'])
+            compilar = backend.env.get_template
+        else:
+            nombres = set(_nombres_plantillas(_directorios_django(backend.engine)))
+            compilar = backend.engine.get_template
+        for nombre in nombres:
+            try:
+                compilar(nombre)
+                compiladas += 1
+            except Exception as e:
+                # Una plantilla rota no debe tumbar el arranque; fallará igual al usarla
+                logger.warning('No se pudo precompilar %s con %s: %s', nombre, backend.name, e)
+    return compiladas
+
+
+def resolver_urls():
+    resolver = get_resolver()
+    # reverse_dict llena los índices de reverse(); resolve() compila los patrones
+    len(resolver.reverse_dict)
+    resolver.resolve('/')
+    return len(resolver.url_patterns)
+
+
+def calentar_sin_base():
+    inicio = time.perf_counter()
+    plantillas = precompilar_plantillas()
+    rutas = resolver_urls()
+    return {'plantillas': plantillas, 'rutas': rutas, 'segundos': time.perf_counter() - inicio}
+
+
+def calentar_caches():
+    from .autocompletar import sugerencias
+    from .catalogo import obtener_catalogo
+
+    inicio = time.perf_counter()
+    catalogo = obtener_catalogo()
+    sugerencias('a')  # Construye el índice de prefijos
+    return {'libros': len(catalogo.libros), 'segundos': time.perf_counter() - inicio}
+
+
+def _sin_loop(funcion):
+    """Uvicorn importa asgi.py dentro de su loop, donde el ORM no se puede usar."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return funcion()
+
+    def en_hilo():
+        try:
+            return funcion()
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=1) as hilo:
+        return hilo.submit(en_hilo).result()
+
+
+def preparar_fork():
+    connections.close_all()
+    gc.collect()
+    gc.freeze()
+
+
+def despues_de_cargar():
+    """Lo llaman wsgi.py y asgi.py justo después de crear la aplicación."""
+    if not calentamiento_activo():
+        return
+    try:
+        _sin_loop(calentar_caches)
+    except Exception:
+        # Sin base todavía (p. ej. antes de migrar): el catálogo se arma en la primera petición
+        logger.warning('No se pudo precalentar el catálogo', exc_info=True)
+    if os.environ.get('LIBRERIA_PRELOAD') == '1':
+        preparar_fork()
@@ -0,0 +1,151 @@
+import heapq
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+from threading import Lock
+
+from django.db.models import Sum
+
+from .models import DetallePedido
+from .catalogo import obtener_catalogo
+
+# =======================================================
+# ÍNDICE DE PREFIJOS PARA EL AUTOCOMPLETADO DEL BUSCADOR
+# =======================================================
+# Lista ordenada de (clave_normalizada, libro_id) sobre títulos y autores.
+# Cada palabra del título también es clave, así "sole" encuentra
+# "Cien años de soledad". Se sincroniza con el snapshot del catálogo: si
+# cambiaron pocos libros solo se mueven sus claves; si no, se reconstruye.
+#
+# Los resultados van por unidades vendidas entre TODAS las coincidencias. Los
+# prefijos cortos son los que más coinciden ("a" abarca casi el catálogo), así
+# que para ellos se guarda su top ya ordenado y se rehace solo cuando cambian
+# libros con esas claves; los largos coinciden con pocos y se ordenan al vuelo.
+
+PALABRAS_VACIAS = {'de', 'del', 'la', 'las', 'el', 'los', 'y', 'en', 'a', 'un', 'una', 'the', 'of'}
+LARGO_PRECALCULADO = 2  # Prefijos de hasta este largo guardan su top ordenado
+TOP_POR_PREFIJO = 20  # El `limite` máximo de /api/autocomplete/
+UMBRAL_RECONSTRUIR = 0.1  # Fracción de libros cambiados a partir de la cual conviene reconstruir
+
+
+def normalizar(texto):
+    """Minúsculas, sin acentos ni signos: 'Poesía ¡Ñandú!' -> 'poesia nandu'."""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = ''.join(c if c.isalnum() else ' ' for c in texto.lower())
+    return ' '.join(texto.split())
+
+
+def claves_de(libro):
+    claves = set()
+    for campo in (libro.titulo, libro.autor):
+        palabras = normalizar(campo).split()
+        for i, palabra in enumerate(palabras):
+            if i == 0 or palabra not in PALABRAS_VACIAS:
+                claves.add(' '.join(palabras[i:]))
+    return claves
+
+
+def prefijos_cortos(claves):
+    return {clave[:n] for clave in claves for n in range(1, LARGO_PRECALCULADO + 1)}
+
+
+class IndicePrefijos:
+    def __init__(self):
+        self.version = None
+        self.libros = {}
+        self.claves = []
+        self.claves_por_libro = {}
+        self.popularidad = {}
+        self.mejores = {}
+
+    def _quitar(self, lista, libro_id):
+        for clave in self.claves_por_libro.pop(libro_id, ()):
+            i = bisect_left(lista, (clave, libro_id))
+            if i < len(lista) and lista[i] == (clave, libro_id):
+                del lista[i]
+
+    def _agregar(self, lista, libro):
+        claves = claves_de(libro)
+        self.claves_por_libro[libro.id] = claves
+        for clave in claves:
+            insort(lista, (clave, libro.id))
+
+    def _top(self, libros, ids, n):
+        return heapq.nsmallest(n, ids, key=lambda i: (-self.popularidad.get(i, 0), libros[i].titulo, i))
+
+    def _coincidencias(self, claves, libros, prefijo):
+        """Ids de los libros con alguna clave que empieza con `prefijo`."""
+        ids = set()
+        i = bisect_left(claves, (prefijo,))
+        while i < len(claves) and claves[i][0].startswith(prefijo):
+            if claves[i][1] in libros:
+                ids.add(claves[i][1])
+            i += 1
+        return ids
+
+    def reconstruir(self, snapshot):
+        self.popularidad = dict(
+            DetallePedido.objects.filter(libro_id__isnull=False)
+            .values('libro_id').annotate(n=Sum('cantidad')).values_list('libro_id', 'n')
+        )
+        self.claves_por_libro = {l.id: claves_de(l) for l in snapshot.libros.values()}
+        self.libros = snapshot.libros
+        self.claves = sorted((c, libro_id) for libro_id, cs in self.claves_por_libro.items() for c in cs)
+        por_prefijo = defaultdict(set)
+        for clave, libro_id in self.claves:
+            for n in range(1, LARGO_PRECALCULADO + 1):
+                por_prefijo[clave[:n]].add(libro_id)
+        self.mejores = {p: tuple(self._top(self.libros, ids, TOP_POR_PREFIJO)) for p, ids in por_prefijo.items()}
+        self.version = snapshot.version
+
+    def sincronizar(self, snapshot):
+        if self.version == snapshot.version:
+            return
+        anteriores, nuevos = self.libros, snapshot.libros
+        cambiados = [i for i, l in nuevos.items() if anteriores.get(i) != l]
+        borrados = [i for i in anteriores if i not in nuevos]
+        if self.version is None or len(cambiados) + len(borrados) > UMBRAL_RECONSTRUIR * max(len(nuevos), 1):
+            self.reconstruir(snapshot)
+            return
+        # Se edita una copia y se publica de una vez: las búsquedas en curso no ven estados a medias
+        claves = list(self.claves)
+        afectados = set()
+        for libro_id in borrados:
+            afectados |= prefijos_cortos(self.claves_por_libro.get(libro_id, ()))
+            self._quitar(claves, libro_id)
+        for libro_id in cambiados:
+            afectados |= prefijos_cortos(self.claves_por_libro.get(libro_id, ()))
+            self._quitar(claves, libro_id)
+            self._agregar(claves, nuevos[libro_id])
+            afectados |= prefijos_cortos(self.claves_por_libro[libro_id])
+        mejores = dict(self.mejores)
+        for prefijo in afectados:
+            mejores[prefijo] = tuple(self._top(nuevos, self._coincidencias(claves, nuevos, prefijo), TOP_POR_PREFIJO))
+        self.libros = nuevos
+        self.claves = claves
+        self.mejores = mejores
+        self.version = snapshot.version
+
+    def buscar(self, texto, limite=8):
+        prefijo = normalizar(texto)
+        if not prefijo:
+            return []
+        claves, libros = self.claves, self.libros
+        if len(prefijo) <= LARGO_PRECALCULADO:
+            ids = self.mejores.get(prefijo, ())
+        else:
+            ids = self._top(libros, self._coincidencias(claves, libros, prefijo), limite)
+        return [libros[i] for i in ids if i in libros][:limite]
+
+
+_indice = IndicePrefijos()
+_lock = Lock()
+
+
+def sugerencias(texto, limite=8):
+    snapshot = obtener_catalogo()
+    if _indice.version != snapshot.version:
+        with _lock:
+            _indice.sincronizar(snapshot)
+    return _indice.buscar(texto, limite)
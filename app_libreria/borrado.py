@@ -0,0 +1,36 @@
+from django.db import transaction
+
+from .models import Libro, Categoria, UsuarioEliminado
+from .catalogo import invalidar_catalogo
+from .prerender import registrar_cambios
+
+# =======================================================
+# BORRADO LÓGICO (INSTANTÁNEO) — LA PURGA REAL LA HACE purge_deleted
+# =======================================================
+# Borrar en cascada desde la vista cargaba en Python todos los renglones
+# relacionados y bloqueaba SQLite. Aquí solo se marcan filas con UPDATE.
+
+
+def eliminar_libros(libro_ids):
+    with transaction.atomic():
+        marcados = Libro.objects.filter(id__in=libro_ids).update(eliminado=True)
+        registrar_cambios(Libro.todos.filter(id__in=libro_ids).values_list('categoria_id', flat=True).distinct())
+        transaction.on_commit(invalidar_catalogo)
+    return marcados
+
+
+def eliminar_categoria(categoria_id):
+    # Sus libros dejan de verse junto con ella
+    with transaction.atomic():
+        Categoria.objects.filter(id=categoria_id).update(eliminado=True)
+        marcados = Libro.objects.filter(categoria_id=categoria_id).update(eliminado=True)
+        registrar_cambios([categoria_id], portada=True)
+        transaction.on_commit(invalidar_catalogo)
+    return marcados
+
+
+def eliminar_usuario(usuario):
+    # Inactivo ya no puede iniciar sesión y sus sesiones dejan de ser válidas
+    with transaction.atomic():
+        type(usuario).objects.filter(pk=usuario.pk).update(is_active=False)
+        UsuarioEliminado.objects.get_or_create(usuario=usuario)
@@ -0,0 +1,204 @@
+import json
+import secrets
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CarritoItem
+from .catalogo import obtener_catalogo
+from .reservas import clave_carrito, clave_usuario, liberar, transferir
+
+# =======================================================
+# CARRITO HÍBRIDO: LIGERO (SESIÓN / COOKIE FIRMADA) + BASE DE DATOS
+# =======================================================
+# CARRITO_MODO = 'ligero' -> todos los carritos viven en la sesión o en una
+#                            cookie firmada hasta el momento de pagar.
+# CARRITO_MODO = 'db'     -> los usuarios autenticados usan CarritoItem; los
+#                            anónimos usan el carrito ligero y se fusiona al
+#                            iniciar sesión.
+# CARRITO_ALMACEN elige dónde se guarda el carrito ligero: 'cookie' (sin
+# escrituras en la base) o 'sesion'.
+#
+# El carrito ligero lleva un token aleatorio (llave '_') que identifica sus
+# reservas de stock (ver reservas.py).
+
+COOKIE_CARRITO = 'carrito'
+SESION_CARRITO = 'carrito'
+SALT_CARRITO = 'app_libreria.carrito'
+MAX_LINEAS = 100  # Una cookie no debe pasar de ~4 KB
+
+
+def modo_carrito():
+    return getattr(settings, 'CARRITO_MODO', 'ligero')
+
+
+def almacen_carrito():
+    return getattr(settings, 'CARRITO_ALMACEN', 'cookie')
+
+
+class LineaCarrito:
+    """Renglón del carrito con la misma forma que CarritoItem para las plantillas."""
+
+    __slots__ = ('libro', 'cantidad')
+
+    def __init__(self, libro, cantidad):
+        self.libro = libro
+        self.cantidad = cantidad
+
+    def subtotal(self):
+        return self.libro.precio * self.cantidad
+
+
+class CarritoLigero:
+    """Carrito compacto {libro_id: cantidad} guardado fuera de la base de datos."""
+
+    def __init__(self, request):
+        self.request = request
+        self.modificado = False
+        if almacen_carrito() == 'sesion':
+            datos = request.session.get(SESION_CARRITO, {})
+        else:
+            datos = request.get_signed_cookie(COOKIE_CARRITO, default=None, salt=SALT_CARRITO)
+            try:
+                datos = json.loads(datos) if datos else {}
+            except ValueError:
+                datos = {}
+        self.lineas = {}
+        self.token = None
+        if isinstance(datos, dict):
+            token = datos.get('_')
+            self.token = token if isinstance(token, str) and token.isascii() and len(token) <= 32 else None
+            for libro_id, cantidad in datos.items():
+                try:
+                    libro_id, cantidad = int(libro_id), int(cantidad)
+                except (TypeError, ValueError):
+                    continue
+                if cantidad > 0:
+                    self.lineas[libro_id] = cantidad
+
+    def __len__(self):
+        return len(self.lineas)
+
+    def puede_agregar(self, libro_id):
+        return libro_id in self.lineas or len(self.lineas) < MAX_LINEAS
+
+    def clave_reserva(self):
+        if self.token is None:
+            self.token = secrets.token_urlsafe(16)
+            self.modificado = True
+        return clave_carrito(self.token)
+
+    def agregar(self, libro_id, cantidad=1):
+        if not self.puede_agregar(libro_id):
+            return False
+        self.lineas[libro_id] = self.lineas.get(libro_id, 0) + cantidad
+        self.modificado = True
+        return True
+
+    def vaciar(self):
+        if self.lineas:
+            self.lineas = {}
+            self.modificado = True
+
+    def guardar(self, response):
+        """Persiste los cambios; con cookie necesita la respuesta que se va a enviar."""
+        if not self.modificado:
+            return
+        datos = {str(k): v for k, v in self.lineas.items()}
+        if datos and self.token:
+            datos['_'] = self.token
+        if almacen_carrito() == 'sesion':
+            if datos:
+                self.request.session[SESION_CARRITO] = datos
+            else:
+                self.request.session.pop(SESION_CARRITO, None)
+        elif datos:
+            response.set_signed_cookie(
+                COOKIE_CARRITO, json.dumps(datos, separators=(',', ':')), salt=SALT_CARRITO,
+                max_age=settings.SESSION_COOKIE_AGE, httponly=True, samesite='Lax',
+            )
+        else:
+            response.delete_cookie(COOKIE_CARRITO)
+        self.modificado = False
+
+
+def usa_carrito_ligero(request):
+    return not request.user.is_authenticated or modo_carrito() == 'ligero'
+
+
+def clave_reserva(request, carrito):
+    """Dueño de las reservas de lo que se agregue ahora al carrito."""
+    if usa_carrito_ligero(request):
+        return carrito.clave_reserva()
+    return clave_usuario(request.user.pk)
+
+
+def claves_reserva(request, carrito):
+    """Todas las claves con reservas de este comprador (para pagar)."""
+    claves = [clave_carrito(carrito.token)] if carrito.token else []
+    if request.user.is_authenticated:
+        claves.append(clave_usuario(request.user.pk))
+    return claves
+
+
+def lineas_del_carrito(request, carrito):
+    """Junta los renglones de CarritoItem del usuario con los del carrito ligero."""
+    catalogo = obtener_catalogo()
+    cantidades = {}
+    if request.user.is_authenticated:
+        for libro_id, cantidad in CarritoItem.objects.filter(usuario=request.user).values_list('libro_id', 'cantidad'):
+            cantidades[libro_id] = cantidades.get(libro_id, 0) + cantidad
+    for libro_id, cantidad in carrito.lineas.items():
+        cantidades[libro_id] = cantidades.get(libro_id, 0) + cantidad
+
+    lineas = []
+    for libro_id, cantidad in cantidades.items():
+        libro = catalogo.libro(libro_id)
+        if libro is not None:  # Libros borrados desde que se agregaron
+            lineas.append(LineaCarrito(libro, cantidad))
+    return lineas
+
+
+def contar_carrito(request, carrito=None):
+    """Número de libros distintos en el carrito (lo que muestra el badge)."""
+    if carrito is None:
+        carrito = CarritoLigero(request)
+    if not request.user.is_authenticated:
+        return len(carrito)
+    ids = set(CarritoItem.objects.filter(usuario=request.user).values_list('libro_id', flat=True))
+    return len(ids | carrito.lineas.keys())
+
+
+def agregar_en_db(usuario, libro_id, cantidad=1):
+    actualizados = CarritoItem.objects.filter(usuario=usuario, libro_id=libro_id).update(
+        cantidad=F('cantidad') + cantidad, actualizado=timezone.now())
+    if not actualizados:
+        CarritoItem.objects.get_or_create(usuario=usuario, libro_id=libro_id, defaults={'cantidad': cantidad})
+
+
+def fusionar_al_iniciar_sesion(request, response):
+    """En modo 'db' pasa el carrito anónimo a CarritoItem al iniciar sesión."""
+    if modo_carrito() != 'db':
+        return
+    carrito = CarritoLigero(request)
+    if not carrito.lineas:
+        return
+    catalogo = obtener_catalogo()
+    for libro_id, cantidad in carrito.lineas.items():
+        if catalogo.libro(libro_id) is not None:
+            agregar_en_db(request.user, libro_id, cantidad)
+    if carrito.token:
+        transferir(clave_carrito(carrito.token), clave_usuario(request.user.pk))
+    carrito.vaciar()
+    carrito.guardar(response)
+
+
+def descartar_carrito(carrito, response):
+    """Al cerrar sesión: suelta las reservas del carrito ligero y lo borra de la cookie o la sesión."""
+    if carrito.token:
+        liberar([clave_carrito(carrito.token)])
+    # Aunque no tenga renglones: una cookie con solo el token también se borra
+    carrito.lineas = {}
+    carrito.modificado = True
+    carrito.guardar(response)
@@ -0,0 +1,130 @@
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+from threading import Lock
+from typing import NamedTuple, Optional
+
+from django.core.cache import cache
+
+from .models import Libro, Categoria
+
+# =======================================================
+# SNAPSHOT DEL CATÁLOGO EN MEMORIA (POR PROCESO)
+# =======================================================
+# El catálogo (categorías, libros y precios) cambia muy poco y se lee en cada
+# visita. Cada worker guarda una copia inmutable y la reemplaza completa
+# cuando alguna señal avisa de un cambio. Las existencias no van aquí: cambian
+# con cada venta y se leen de Inventario. La versión vive en la caché
+# compartida (settings.CACHES) para que todos los procesos se enteren.
+#
+# La versión es un valor nuevo en cada cambio, no un contador: si la caché
+# descarta la llave, la siguiente versión no puede coincidir con la de un
+# snapshot viejo que algún worker todavía tenga.
+
+VERSION_KEY = 'catalogo:version'
+
+
+class CategoriaRecord(NamedTuple):
+    id: int
+    nombre: str
+    descripcion: str
+    color: str
+
+
+class LibroRecord(NamedTuple):
+    id: int
+    titulo: str
+    autor: str
+    categoria_id: int
+    proveedor_id: Optional[int]
+    editorial: str
+    descripcion: str
+    precio: Decimal
+    isbn: str
+    imagen_url: str
+
+
+class CatalogoSnapshot:
+    """Vista inmutable del catálogo indexada por id, categoría e ISBN."""
+
+    __slots__ = ('version', 'categorias', 'categorias_por_nombre', 'libros',
+                 'libros_por_categoria', 'libros_por_isbn')
+
+    def __init__(self, version, categorias, libros):
+        self.version = version
+        self.categorias = {c.id: c for c in categorias}
+        self.categorias_por_nombre = {c.nombre: c for c in categorias}
+        self.libros = {l.id: l for l in libros}
+
+        por_categoria = defaultdict(list)
+        for libro in libros:
+            por_categoria[libro.categoria_id].append(libro)
+        self.libros_por_categoria = {k: tuple(v) for k, v in por_categoria.items()}
+        self.libros_por_isbn = {l.isbn: l for l in libros if l.isbn}
+
+    def categoria(self, categoria_id):
+        return self.categorias.get(categoria_id)
+
+    def categorias_con_nombre(self, nombres):
+        # Respeta el orden de la lista pedida, igual que la portada
+        return [self.categorias_por_nombre[n] for n in nombres if n in self.categorias_por_nombre]
+
+    def libro(self, libro_id):
+        return self.libros.get(libro_id)
+
+    def libro_por_isbn(self, isbn):
+        return self.libros_por_isbn.get(isbn)
+
+    def libros_de_categoria(self, categoria_id):
+        return self.libros_por_categoria.get(categoria_id, ())
+
+
+_snapshot = None
+_lock = Lock()
+
+
+def _nueva_version():
+    return uuid.uuid4().hex[:16]
+
+
+def version_catalogo():
+    """Versión vigente del catálogo, igual en todos los procesos (la guarda la caché compartida)."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _nueva_version(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _construir(version):
+    categorias = [
+        CategoriaRecord(id, nombre, descripcion or '', color)
+        for id, nombre, descripcion, color
+        in Categoria.objects.order_by('id').values_list('id', 'nombre', 'descripcion', 'color')
+    ]
+    campos = ('id', 'titulo', 'autor', 'categoria_id', 'proveedor_id', 'editorial',
+              'descripcion', 'precio', 'isbn', 'imagen_url')
+    libros = [LibroRecord(*fila) for fila in Libro.objects.order_by('id').values_list(*campos)]
+    return CatalogoSnapshot(version, categorias, libros)
+
+
+def obtener_catalogo():
+    """Devuelve el snapshot vigente, reconstruyéndolo si otro proceso lo invalidó."""
+    global _snapshot
+    version = version_catalogo()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    with _lock:
+        if _snapshot is None or _snapshot.version != version:
+            # Se asigna de una sola vez: los lectores ven el viejo o el nuevo, nunca uno a medias
+            _snapshot = _construir(version)
+        return _snapshot
+
+
+def invalidar_catalogo():
+    """Sube la versión compartida; cada worker reconstruye en su siguiente lectura."""
+    global _snapshot
+    cache.set(VERSION_KEY, _nueva_version(), None)
+    _snapshot = None
@@ -0,0 +1,109 @@
+import re
+
+try:
+    import brotli
+except ImportError:  # Opcional: sin él solo se ofrece gzip
+    brotli = None
+
+# =======================================================
+# COMPRESIÓN Y MINIFICACIÓN DE RESPUESTAS
+# =======================================================
+# Funciones puras que usan CompresionMiddleware, prerender_catalog y
+# bench_compression.
+
+TIPOS_COMPRIMIBLES = {
+    'text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript',
+    'application/json', 'application/xml', 'image/svg+xml',
+}
+
+
+# --- Negociación (Accept-Encoding) ---
+
+def codificaciones_aceptadas(cabecera):
+    """'gzip, br;q=0.8, *;q=0' -> {'gzip': 1.0, 'br': 0.8, '*': 0.0}"""
+    aceptadas = {}
+    for parte in cabecera.split(','):
+        nombre, _, parametros = parte.partition(';')
+        nombre = nombre.strip().lower()
+        if not nombre:
+            continue
+        q = 1.0
+        for parametro in parametros.split(';'):
+            clave, _, valor = parametro.partition('=')
+            if clave.strip().lower() == 'q':
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        aceptadas[nombre] = q
+    return aceptadas
+
+
+def elegir_codificacion(cabecera, permitir_br=True):
+    """'br', 'gzip' o None. Con la misma q gana br: comprime más el HTML."""
+    aceptadas = codificaciones_aceptadas(cabecera)
+    comodin = aceptadas.get('*', 0.0)
+    mejor, mejor_q = None, 0.0
+    for codificacion in (['br'] if brotli and permitir_br else []) + ['gzip']:
+        q = aceptadas.get(codificacion, comodin)
+        if q > mejor_q:
+            mejor, mejor_q = codificacion, q
+    return mejor
+
+
+# --- Minificación ---
+# Solo se toca el espacio en blanco entre etiquetas (el navegador lo colapsa
+# igual) y el CSS de los <style>. Etiquetas, atributos, <pre>, <textarea> y
+# <script> quedan intactos.
+
+_BLOQUES = re.compile(r'<(pre|textarea|script|style)\b[^>]*>.*?</\1\s*>', re.S | re.I)
+_ETIQUETAS = re.compile(r'(<[^>]*>)')
+_COMENTARIOS_HTML = re.compile(r'<!--(?!\[if|<!|\s*\[endif).*?-->', re.S)
+_SALTOS = re.compile(r'\s*\n\s*')
+_ESPACIOS = re.compile(r'[^\S\n]{2,}|[^\S\n ]')
+# Cadenas y url(...) sin comillas se copian tal cual; los comentarios se quitan
+_PROTEGIDOS_CSS = re.compile(r'''("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|\burl\([^)"']*\)|/\*.*?\*/)''', re.S | re.I)
+_BLANCOS_CSS = re.compile(r'\s+')
+_ESPACIOS_CSS = re.compile(r'\s*([{};,>])\s*')
+
+
+def _texto(segmento):
+    segmento = _COMENTARIOS_HTML.sub('', segmento)
+    partes = _ETIQUETAS.split(segmento)
+    # Las posiciones pares son texto entre etiquetas; las impares, etiquetas
+    partes[::2] = [_ESPACIOS.sub(' ', _SALTOS.sub('\n', t)) for t in partes[::2]]
+    return ''.join(partes)
+
+
+def _espacios_css(css):
+    css = _ESPACIOS_CSS.sub(r'\1', _BLANCOS_CSS.sub(' ', css))
+    return css.replace(';}', '}')
+
+
+def minificar_css(css):
+    partes, texto = [], ''
+    # Las posiciones pares son CSS; las impares, cadenas, url(...) o comentarios
+    for i, parte in enumerate(_PROTEGIDOS_CSS.split(css)):
+        if i % 2 == 0:
+            texto += parte
+        elif not parte.startswith('/*'):
+            partes += [_espacios_css(texto), parte]
+            texto = ''
+    partes.append(_espacios_css(texto))
+    return ''.join(partes).strip()
+
+
+def minificar_html(html):
+    partes = []
+    posicion = 0
+    for bloque in _BLOQUES.finditer(html):
+        partes.append(_texto(html[posicion:bloque.start()]))
+        contenido = bloque.group(0)
+        if bloque.group(1).lower() == 'style':
+            apertura = contenido.index('>') + 1
+            cierre = contenido.lower().rindex('</style')
+            contenido = contenido[:apertura] + minificar_css(contenido[apertura:cierre]) + contenido[cierre:]
+        partes.append(contenido)
+        posicion = bloque.end()
+    partes.append(_texto(html[posicion:]))
+    return ''.join(partes)
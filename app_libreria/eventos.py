@@ -0,0 +1,126 @@
+import asyncio
+import json
+from functools import partial
+from threading import Lock
+
+from django.db import transaction
+from django.urls import reverse
+
+from .models import Inventario
+
+# =======================================================
+# EVENTOS EN VIVO DEL INVENTARIO (SERVER-SENT EVENTS)
+# =======================================================
+# Hub publicar/suscribir dentro del proceso: las señales y las reservas
+# publican los cambios de Inventario y cada pestaña del panel abierta recibe
+# solo las filas que cambiaron, sin volver a consultar la lista completa.
+#
+# Cada suscriptor guarda {libro_id: último evento}: una pestaña lenta no
+# acumula una cola infinita, solo recibe el estado más reciente de cada fila.
+# Es por proceso: con varios workers cada uno avisa de sus propias escrituras.
+
+HEARTBEAT_SEGUNDOS = 15
+RETRY_MS = 5000
+
+
+class Suscripcion:
+    __slots__ = ('loop', 'pendientes', 'aviso')
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.pendientes = {}
+        self.aviso = asyncio.Event()
+
+    def _entregar(self, clave, tipo, datos):
+        # Corre en el loop del suscriptor
+        self.pendientes[clave] = (tipo, datos)
+        self.aviso.set()
+
+    async def siguientes(self, timeout):
+        try:
+            await asyncio.wait_for(self.aviso.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self.aviso.clear()
+        lote, self.pendientes = self.pendientes, {}
+        return list(lote.values())
+
+
+class HubInventario:
+    def __init__(self):
+        self._suscripciones = set()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._suscripciones)
+
+    def suscribir(self):
+        suscripcion = Suscripcion(asyncio.get_running_loop())
+        with self._lock:
+            self._suscripciones.add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            self._suscripciones.discard(suscripcion)
+
+    def publicar(self, clave, tipo, datos):
+        """Se puede llamar desde cualquier hilo (vistas síncronas, comandos...)."""
+        with self._lock:
+            suscripciones = list(self._suscripciones)
+        for s in suscripciones:
+            try:
+                s.loop.call_soon_threadsafe(s._entregar, clave, tipo, datos)
+            except RuntimeError:  # Loop ya cerrado
+                self.cancelar(s)
+
+
+hub = HubInventario()
+
+
+def publicar_inventario(libro_ids):
+    """Lee el estado actual de esas filas (una consulta) y lo publica."""
+    filas = Inventario.objects.filter(libro_id__in=libro_ids).values(
+        'id', 'libro_id', 'libro__titulo', 'cantidad', 'reservado', 'stock_minimo',
+    )
+    for fila in filas:
+        hub.publicar(fila['libro_id'], 'inventario', {
+            'id': fila['id'],
+            'libro_id': fila['libro_id'],
+            'titulo': fila['libro__titulo'],
+            'cantidad': fila['cantidad'],
+            'reservado': fila['reservado'],
+            'stock_minimo': fila['stock_minimo'],
+            'bajo': fila['cantidad'] <= fila['stock_minimo'],
+            'url_editar': reverse('admin_inventario_edit', args=[fila['id']]),
+        })
+
+
+def avisar_cambios(libro_ids):
+    # Sin pestañas abiertas no cuesta nada; si las hay, se publica tras el commit
+    if len(hub) and libro_ids:
+        transaction.on_commit(partial(publicar_inventario, list(libro_ids)))
+
+
+def avisar_borrado(inventario_id, libro_id):
+    if len(hub):
+        transaction.on_commit(partial(hub.publicar, libro_id, 'inventario-borrado', {'id': inventario_id}))
+
+
+def _mensaje(tipo, datos):
+    return f'event: {tipo}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n'
+
+
+async def flujo_sse(suscripcion):
+    """Generador asíncrono para StreamingHttpResponse."""
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        while True:
+            lote = await suscripcion.siguientes(HEARTBEAT_SEGUNDOS)
+            if not lote:
+                # Comentario SSE: mantiene viva la conexión a través de proxies
+                yield ': ping\n\n'
+                continue
+            yield ''.join(_mensaje(tipo, datos) for tipo, datos in lote)
+    finally:
+        hub.cancelar(suscripcion)
@@ -7,7 +7,9 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
 from django.core.validators import MinLengthValidator, EmailValidator
-from .models import Libro, Resena, Categoria, Proveedor
+from django.urls import reverse_lazy
+from .models import Libro, Categoria, Proveedor, Inventario, Sucursal
+from .precios import PRECIO_MINIMO, REDONDEOS
 
 class RegisterForm(UserCreationForm):
     email = forms.EmailField(
@@ -161,28 +163,6 @@ class CheckoutForm(forms.Form):
         
         return cleaned_data
 
-class ReviewForm(forms.ModelForm):
-    calificacion = forms.ChoiceField(
-        choices=[(i, '★' * i) for i in range(1, 6)],
-        widget=forms.RadioSelect(attrs={
-            'class': 'form-check-input'
-        }),
-        label='Calificación'
-    )
-    
-    comentario = forms.CharField(
-        widget=forms.Textarea(attrs={
-            'class': 'form-control',
-            'rows': 4,
-            'placeholder': 'Comparte tu experiencia con este libro...'
-        }),
-        label='Tu reseña'
-    )
-    
-    class Meta:
-        model = Resena
-        fields = ['calificacion', 'comentario']
-
 class LibroForm(forms.ModelForm):
     categoria = forms.ModelChoiceField(
         queryset=Categoria.objects.all(),
@@ -232,6 +212,127 @@ class LibroForm(forms.ModelForm):
             raise forms.ValidationError('El precio debe ser mayor a 0')
         return precio
 
+class RepreciarForm(forms.Form):
+    categoria = forms.ModelChoiceField(
+        queryset=Categoria.objects.all(),
+        required=False,
+        empty_label='Todas las categorías',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    
+    proveedor = forms.ModelChoiceField(
+        queryset=Proveedor.objects.all(),
+        required=False,
+        empty_label='Todos los proveedores',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    
+    autor = forms.CharField(
+        required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Nombre exacto del autor'})
+    )
+    
+    tipo = forms.ChoiceField(
+        choices=[('porcentaje', 'Porcentaje (%)'), ('fijo', 'Cantidad fija ($)')],
+        widget=forms.Select(attrs={'class': 'form-control'}),
+        label='Tipo de cambio'
+    )
+    
+    valor = forms.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}),
+        help_text='Negativo para bajar precios (p. ej. -10 = 10% de descuento).'
+    )
+    
+    redondeo = forms.ChoiceField(
+        choices=REDONDEOS,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    
+    minimo = forms.DecimalField(
+        required=False,
+        min_value=0,
+        max_digits=10,
+        decimal_places=2,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}),
+        label='Precio mínimo'
+    )
+    
+    maximo = forms.DecimalField(
+        required=False,
+        min_value=PRECIO_MINIMO,
+        max_digits=10,
+        decimal_places=2,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}),
+        label='Precio máximo'
+    )
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('tipo') == 'porcentaje' and cleaned_data.get('valor') is not None:
+            if cleaned_data['valor'] <= -100:
+                self.add_error('valor', 'El descuento no puede ser del 100% o más')
+        minimo, maximo = cleaned_data.get('minimo'), cleaned_data.get('maximo')
+        if minimo is not None and maximo is not None and minimo > maximo:
+            self.add_error('maximo', 'El precio máximo debe ser mayor o igual al mínimo')
+        return cleaned_data
+
+class ExistenciaForm(forms.ModelForm):
+    # La cantidad es la de una sucursal; Inventario guarda el total de todas
+    sucursal = forms.ModelChoiceField(
+        queryset=Sucursal.objects.filter(activa=True),
+        empty_label=None,
+        widget=forms.Select(attrs={
+            'class': 'form-control'
+        })
+    )
+    
+    movimiento = forms.ChoiceField(
+        choices=[('ajuste', 'Conteo físico (la sucursal queda con esta cantidad)'),
+                 ('entrada', 'Entrada de mercancía (se suma a lo que hay)')],
+        widget=forms.Select(attrs={
+            'class': 'form-control'
+        })
+    )
+    
+    cantidad = forms.IntegerField(
+        min_value=0,
+        widget=forms.NumberInput(attrs={
+            'class': 'form-control',
+            'min': '0'
+        }),
+        label='Cantidad'
+    )
+    
+    minimo_sucursal = forms.IntegerField(
+        min_value=0,
+        required=False,
+        widget=forms.NumberInput(attrs={
+            'class': 'form-control',
+            'min': '0'
+        }),
+        label='Mínimo en la sucursal',
+        help_text='0 = sin mínimo; vacío = no cambiarlo'
+    )
+    
+    class Meta:
+        model = Inventario
+        fields = ['stock_minimo']
+        labels = {'stock_minimo': 'Mínimo total (punto de reorden)'}
+
+class NuevaExistenciaForm(ExistenciaForm):
+    # Fuera de Meta.fields: el libro puede tener ya su Inventario (está en otra sucursal)
+    # y la validación del OneToOne lo rechazaría; la vista no crea otro Inventario
+    libro = forms.ModelChoiceField(
+        queryset=Libro.objects.all(),
+        widget=forms.Select(attrs={
+            'class': 'form-control'
+        })
+    )
+
+    field_order = ['libro']
+
 class UserProfileForm(forms.ModelForm):
     first_name = forms.CharField(
         required=False,
@@ -263,7 +364,9 @@ class SearchForm(forms.Form):
         widget=forms.TextInput(attrs={
             'class': 'form-control',
             'placeholder': 'Buscar libros, autores...',
-            'aria-label': 'Buscar'
+            'aria-label': 'Buscar',
+            'autocomplete': 'off',
+            'data-autocomplete-url': reverse_lazy('api_autocomplete'),
         })
     )
     
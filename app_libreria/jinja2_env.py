@@ -0,0 +1,29 @@
+from django.templatetags.static import static
+from django.template.defaultfilters import floatformat, truncatechars
+from django.urls import reverse
+from jinja2 import Environment
+
+# =======================================================
+# ENTORNO JINJA2 PARA LAS PLANTILLAS DE LA TIENDA
+# =======================================================
+# Se activa con LIBRERIA_JINJA2=1 (ver settings.TEMPLATES). Las plantillas
+# viven en app_libreria/jinja2/ con los mismos nombres que las de Django, así
+# que la tienda se resuelve aquí y el panel de administración sigue igual.
+# `csrf_input`, `csrf_token` y `request` los agrega el backend de Django.
+
+
+def url(nombre, *args, **kwargs):
+    return reverse(nombre, args=args or None, kwargs=kwargs or None)
+
+
+def environment(**options):
+    env = Environment(**options)
+    env.globals.update({
+        'url': url,
+        'static': static,
+    })
+    env.filters.update({
+        'truncatechars': truncatechars,
+        'floatformat': floatformat,
+    })
+    return env
@@ -0,0 +1,127 @@
+import math
+import time
+from functools import wraps
+from threading import BoundedSemaphore
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+# =======================================================
+# LÍMITES DE PETICIONES Y CONTROL DE ADMISIÓN
+# =======================================================
+# Token bucket por IP y por usuario guardado en la caché configurada en
+# LIMITES_CACHE (cualquier backend de Django: locmem, redis, memcached...).
+# Además, un tope de peticiones simultáneas por proceso para las rutas caras:
+# si se llena, respondemos 503 antes de hashear contraseñas o escribir.
+# La tabla de límites por ruta vive solo en settings.LIMITES_PETICIONES; una
+# ruta que no aparece ahí no se limita.
+
+RESULTADOS = ('permitidas', 'limitadas', 'rechazadas')
+
+_semaforo = None
+
+
+def _cache():
+    return caches[getattr(settings, 'LIMITES_CACHE', 'default')]
+
+
+def _semaforo_global():
+    global _semaforo
+    if _semaforo is None:
+        _semaforo = BoundedSemaphore(getattr(settings, 'LIMITE_CONCURRENCIA', 16))
+    return _semaforo
+
+
+def _contar(ruta, resultado):
+    cache = _cache()
+    key = f'limites:contador:{ruta}:{resultado}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def contadores(rutas=None):
+    """Contadores por ruta: {'login': {'permitidas': 10, 'limitadas': 2, ...}}."""
+    rutas = rutas or getattr(settings, 'LIMITES_PETICIONES', {}).keys()
+    keys = {f'limites:contador:{r}:{res}': (r, res) for r in rutas for res in RESULTADOS}
+    valores = _cache().get_many(keys.keys())
+    datos = {r: dict.fromkeys(RESULTADOS, 0) for r in rutas}
+    for key, valor in valores.items():
+        ruta, resultado = keys[key]
+        datos[ruta][resultado] = valor
+    return datos
+
+
+def consumir_token(key, capacidad, periodo):
+    """Intenta gastar un token; regresa (permitido, segundos_para_reintentar).
+
+    Leer y escribir no es atómico entre procesos, así que con mucha
+    concurrencia algún token extra se puede colar; para frenar abuso basta.
+    """
+    cache = _cache()
+    ahora = time.time()
+    tasa = capacidad / periodo
+    estado = cache.get(key)
+    tokens, ultimo = estado if estado else (capacidad, ahora)
+    tokens = min(capacidad, tokens + (ahora - ultimo) * tasa)
+    if tokens < 1:
+        return False, math.ceil((1 - tokens) / tasa)
+    cache.set(key, (tokens - 1, ahora), math.ceil(periodo * 2))
+    return True, 0
+
+
+def _ip(request):
+    return request.META.get('REMOTE_ADDR', 'desconocida')
+
+
+def limitar(ruta, metodos=None, usuario=None):
+    """Decorador: aplica los límites de `ruta` y el tope de concurrencia.
+
+    `usuario` es una función request -> identificador (por ejemplo el username
+    que se intenta usar); si no se da, se usa el usuario autenticado.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if metodos and request.method not in metodos:
+                return vista(request, *args, **kwargs)
+
+            reglas = getattr(settings, 'LIMITES_PETICIONES', {}).get(ruta, {})
+            claves = []
+            if 'ip' in reglas:
+                claves.append((f'limites:{ruta}:ip:{_ip(request)}', reglas['ip']))
+            if 'usuario' in reglas:
+                ident = usuario(request) if usuario else (request.user.pk if request.user.is_authenticated else None)
+                if ident:
+                    claves.append((f'limites:{ruta}:usuario:{str(ident).lower()}', reglas['usuario']))
+
+            for key, (capacidad, periodo) in claves:
+                permitido, reintentar = consumir_token(key, capacidad, periodo)
+                if not permitido:
+                    _contar(ruta, 'limitadas')
+                    response = HttpResponse('Demasiadas solicitudes. Intenta de nuevo en unos segundos.',
+                                            status=429, content_type='text/plain; charset=utf-8')
+                    response['Retry-After'] = str(reintentar)
+                    return response
+
+            semaforo = _semaforo_global()
+            if not semaforo.acquire(blocking=False):
+                _contar(ruta, 'rechazadas')
+                response = HttpResponse('El servidor está ocupado. Intenta de nuevo en unos segundos.',
+                                        status=503, content_type='text/plain; charset=utf-8')
+                response['Retry-After'] = '1'
+                return response
+            try:
+                _contar(ruta, 'permitidas')
+                return vista(request, *args, **kwargs)
+            finally:
+                semaforo.release()
+        return envoltura
+    return decorador
+
+
+def username_del_post(request):
+    return request.POST.get('username', '').strip() or None
@@ -0,0 +1,89 @@
+import re
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from app_libreria.archivo import Archivador, ErrorVerificacion, archivo_configurado, archivo_listo
+from app_libreria.models import DB_ARCHIVO, Pedido, DetallePedido, PedidoArchivado, DetallePedidoArchivado
+
+UNIDADES = {'d': 1, 'w': 7, 'm': 30, 'y': 365}
+
+
+def parsear_antiguedad(texto):
+    """'90', '90d', '12w', '6m' o '2y' -> timedelta."""
+    m = re.fullmatch(r'(\d+)([dwmy]?)', texto.strip().lower())
+    if not m:
+        raise CommandError(f'--older-than no válido: {texto!r} (usa p. ej. 90d, 6m o 2y)')
+    return timedelta(days=int(m.group(1)) * UNIDADES[m.group(2) or 'd'])
+
+
+class Command(BaseCommand):
+    help = 'Mueve por lotes los pedidos antiguos (y sus líneas) a la base de archivo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', required=True, help='Antigüedad mínima: 90d, 12w, 6m, 2y.')
+        parser.add_argument('--lote', type=int, default=500, help='Pedidos por transacción.')
+        parser.add_argument('--pausa', type=float, default=0.1,
+                            help='Segundos entre lotes para dejar pasar las escrituras de la tienda.')
+        parser.add_argument('--max-lotes', type=int, default=0, help='Detenerse tras N lotes (0 = sin límite).')
+        parser.add_argument('--dry-run', action='store_true', help='Solo contar lo que se archivaría.')
+
+    def handle(self, *args, **options):
+        if not archivo_configurado():
+            raise CommandError(f"Configura DATABASES['{DB_ARCHIVO}'] en settings.py.")
+        antes_de = timezone.now() - parsear_antiguedad(options['older_than'])
+
+        pendientes = Pedido.objects.filter(fecha__lt=antes_de).count()
+        self.stdout.write(f'Pedidos anteriores a {antes_de:%Y-%m-%d %H:%M}: {pendientes}')
+        if options['dry_run'] or not pendientes:
+            return
+
+        if not archivo_listo():
+            raise CommandError(f'La base de archivo no tiene tablas: ejecuta `manage.py migrate --database={DB_ARCHIVO}`.')
+
+        antes = self._conteos()
+        inicio = time.perf_counter()
+
+        def progreso(lotes, totales):
+            self.stdout.write(f'  lote {lotes}: {totales[PedidoArchivado]} pedidos, '
+                              f'{totales[DetallePedidoArchivado]} líneas archivadas')
+
+        try:
+            with Archivador(options['lote'], options['pausa']) as archivador:
+                totales = archivador.archivar(antes_de, options['max_lotes'] or None, progreso)
+        except ErrorVerificacion as e:
+            # El lote en curso se deshizo; los anteriores ya están verificados
+            raise CommandError(f'Verificación fallida, lote revertido: {e}')
+
+        despues = self._conteos()
+        self._reporte(antes, despues, totales, time.perf_counter() - inicio)
+
+    def _conteos(self):
+        return {
+            'pedidos': Pedido.objects.count(),
+            'lineas': DetallePedido.objects.count(),
+            'pedidos_archivo': PedidoArchivado.objects.count(),
+            'lineas_archivo': DetallePedidoArchivado.objects.count(),
+        }
+
+    def _reporte(self, antes, despues, totales, segundos):
+        self.stdout.write(f"\n{'':<22}{'Antes':>10}{'Después':>10}")
+        for clave, etiqueta in (('pedidos', 'Pedidos (principal)'), ('lineas', 'Líneas (principal)'),
+                                ('pedidos_archivo', 'Pedidos (archivo)'), ('lineas_archivo', 'Líneas (archivo)')):
+            self.stdout.write(f'{etiqueta:<22}{antes[clave]:>10}{despues[clave]:>10}')
+
+        # Nada se pierde ni se duplica: lo que sale de la principal entra al archivo.
+        # Pedidos nuevos creados durante la corrida solo suman en la principal.
+        movidos = totales[PedidoArchivado], totales[DetallePedidoArchivado]
+        cuadra = (
+            despues['pedidos_archivo'] - antes['pedidos_archivo'] == movidos[0]
+            and despues['lineas_archivo'] - antes['lineas_archivo'] == movidos[1]
+            and antes['pedidos'] - despues['pedidos'] <= movidos[0]
+        )
+        resumen = f'{movidos[0]} pedidos y {movidos[1]} líneas archivados en {segundos:.1f}s'
+        if cuadra:
+            self.stdout.write(self.style.SUCCESS(f'\n{resumen}. Conteos verificados.'))
+        else:
+            self.stdout.write(self.style.ERROR(f'\n{resumen}, pero los conteos no cuadran: revisa ambas bases.'))
@@ -0,0 +1,204 @@
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+
+from app_libreria.catalogo import invalidar_catalogo
+from app_libreria.management.commands.loadtest import _percentil
+from app_libreria.models import Categoria, Libro
+from app_libreria.prerender import registrar_cambios
+from app_libreria.respaldo import (
+    COMPRESIONES, ErrorRespaldo, base_principal, copiar, directorio_respaldos, respaldar, respaldos, restaurar,
+)
+
+
+def _mb(n):
+    return f'{n / 1e6:.1f} MB'
+
+
+class Command(BaseCommand):
+    help = 'Respalda db.sqlite3 en caliente (API de backup de SQLite), o restaura un respaldo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--destino', help='Directorio de respaldos (por defecto RESPALDOS_DIR).')
+        parser.add_argument('--paginas', type=int, default=256, help='Páginas copiadas por paso.')
+        parser.add_argument('--pausa', type=float, default=0.05, help='Segundos entre pasos para dejar escribir.')
+        parser.add_argument('--compresion', choices=list(COMPRESIONES), default='gz')
+        parser.add_argument('--conservar', type=int, default=7, help='Respaldos a conservar (0 = todos).')
+        parser.add_argument('--restaurar', metavar='ARCHIVO',
+                            help='Restaura este respaldo ("ultimo" = el más reciente).')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive')
+        parser.add_argument('--benchmark', action='store_true',
+                            help='Mide la latencia de la tienda sin respaldo y durante respaldos continuos.')
+        parser.add_argument('--hilos', type=int, default=4, help='Clientes concurrentes en --benchmark.')
+        parser.add_argument('--segundos', type=float, default=20, help='Duración de cada fase de --benchmark.')
+
+    def handle(self, *args, **options):
+        try:
+            if options['restaurar']:
+                self._restaurar(options)
+            elif options['benchmark']:
+                self._benchmark(options)
+            else:
+                self._respaldar(options)
+        except ErrorRespaldo as e:
+            raise CommandError(str(e))
+
+    # --- Respaldo ---
+
+    def _respaldar(self, options):
+        ultimo = [0]
+
+        def avance(copiadas, total):
+            # Un renglón cada ~10%
+            if total and (copiadas - ultimo[0]) * 10 >= total:
+                ultimo[0] = copiadas
+                self.stdout.write(f'  {copiadas}/{total} páginas')
+
+        r = respaldar(options['destino'], options['paginas'], options['pausa'],
+                      options['compresion'], options['conservar'], avance)
+        self._imprimir(r)
+
+    def _imprimir(self, r):
+        c = r.copia
+        modo = 'un solo paso tras reinicios' if c.un_paso else f'{c.pasos} pasos'
+        self.stdout.write(
+            f'Copia: {c.paginas} páginas ({_mb(c.bytes)}) en {c.segundos:.2f}s, {modo}, '
+            f'{c.reinicios} reinicios, {c.mb_por_segundo:.1f} MB/s (sin contar {c.segundos_pausa:.2f}s de pausas)'
+        )
+        proporcion = r.bytes_comprimido / c.bytes if c.bytes else 0
+        self.stdout.write(f'Compresión: {_mb(r.bytes_comprimido)} ({proporcion:.0%}) en {r.segundos_compresion:.2f}s')
+        for borrado in r.borrados:
+            self.stdout.write(f'  rotado: {borrado.name}')
+        self.stdout.write(self.style.SUCCESS(f'Respaldo verificado (integrity_check): {r.archivo}'))
+
+    # --- Restauración ---
+
+    def _restaurar(self, options):
+        archivo = options['restaurar']
+        if archivo == 'ultimo':
+            existentes = respaldos(Path(options['destino']) if options['destino'] else directorio_respaldos())
+            if not existentes:
+                raise CommandError('No hay respaldos.')
+            archivo = existentes[0]
+        archivo = Path(archivo)
+        if not archivo.exists():
+            raise CommandError(f'No existe {archivo}.')
+
+        if options['interactive']:
+            respuesta = input(f'Se reemplazará TODO el contenido de la base con {archivo.name}. Escribe "si" para continuar: ')
+            if respuesta.strip().lower() != 'si':
+                self.stdout.write('Cancelado.')
+                return
+
+        connections.close_all()
+        inicio = time.perf_counter()
+        restaurar(archivo)
+        # Caché y páginas estáticas pueden venir de la base anterior
+        invalidar_catalogo()
+        registrar_cambios(todo=True)
+        self.stdout.write(self.style.SUCCESS(f'Base restaurada desde {archivo} en {time.perf_counter() - inicio:.1f}s'))
+
+    # --- Benchmark ---
+
+    def _benchmark(self, options):
+        categorias = list(Categoria.objects.values_list('id', flat=True)[:50])
+        libros = list(Libro.objects.values_list('id', flat=True)[:5000])
+        if not categorias or not libros:
+            raise CommandError('Faltan datos: siembra con `loadtest --sembrar-libros N --solo-sembrar`.')
+        connections.close_all()
+
+        # El tráfico agrega al carrito y crea reservas: corre contra una copia
+        # de la base, nunca contra la de la tienda. Las peticiones pasan por
+        # middleware y vistas en este proceso; sin límites por IP para que
+        # todas las escrituras lleguen a la base
+        datos = settings.DATABASES['default']  # El mismo dict que usan las conexiones de cada hilo
+        origen, original = base_principal(), datos['NAME']
+        with tempfile.TemporaryDirectory() as directorio:
+            copia = Path(directorio) / 'benchmark.sqlite3'
+            copiar(origen, copia, options['paginas'], pausa=0)
+            self.stdout.write(f'Benchmark sobre una copia de la base: {copia}')
+            datos['NAME'] = str(copia)
+            try:
+                with override_settings(LIMITES_PETICIONES={}):
+                    self._fases(options, categorias, libros)
+            finally:
+                connections.close_all()
+                datos['NAME'] = original
+
+    def _fases(self, options, categorias, libros):
+        self.stdout.write(f"Fase 1: {options['segundos']}s de tráfico sin respaldo...")
+        base = self._trafico(options, categorias, libros, lambda fin: None)
+
+        copias = []
+
+        def respaldos_continuos(fin):
+            with tempfile.TemporaryDirectory() as directorio:
+                while time.perf_counter() < fin:
+                    copias.append(respaldar(directorio, options['paginas'], options['pausa'],
+                                            options['compresion'], conservar=1).copia)
+
+        self.stdout.write(f"Fase 2: {options['segundos']}s de tráfico con respaldos continuos...")
+        durante = self._trafico(options, categorias, libros, respaldos_continuos)
+
+        self.stdout.write(f"\n{'Ruta':<24}{'Fase':<14}{'Pet.':>7}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'Errores':>9}")
+        for ruta in sorted(set(base) | set(durante)):
+            for fase, datos in (('sin respaldo', base), ('con respaldo', durante)):
+                latencias, errores = datos.get(ruta, ([], 0))
+                if latencias:
+                    self.stdout.write(
+                        f'{ruta:<24}{fase:<14}{len(latencias):>7}{_percentil(latencias, 50) * 1000:>9.1f}'
+                        f'{_percentil(latencias, 99) * 1000:>9.1f}{latencias[-1] * 1000:>9.1f}{errores:>9}'
+                    )
+        if copias:
+            self.stdout.write(self.style.SUCCESS(
+                f'\n{len(copias)} respaldos durante la fase 2: '
+                f'{sum(c.mb_por_segundo for c in copias) / len(copias):.1f} MB/s en promedio, '
+                f'{sum(c.reinicios for c in copias)} reinicios, '
+                f'{sum(c.un_paso for c in copias)} terminados en un solo paso.'
+            ))
+
+    def _trafico(self, options, categorias, libros, en_paralelo):
+        fin = time.perf_counter() + options['segundos']
+        muestras = []
+
+        def cliente(semilla):
+            rnd = random.Random(semilla)
+            c = Client(HTTP_HOST='localhost')
+            propias = []
+            while time.perf_counter() < fin:
+                # Lecturas de catálogo y escrituras (reservas del carrito)
+                if rnd.random() < 0.5:
+                    ruta, path = 'libros_por_categoria', f'/categoria/{rnd.choice(categorias)}/'
+                else:
+                    ruta, path = 'agregar_carrito', f'/agregar/{rnd.choice(libros)}/'
+                inicio = time.perf_counter()
+                try:
+                    ok = c.get(path).status_code < 400
+                except Exception:
+                    ok = False
+                propias.append((ruta, time.perf_counter() - inicio, ok))
+            connections.close_all()
+            muestras.extend(propias)
+
+        hilos = [threading.Thread(target=cliente, args=(i,)) for i in range(options['hilos'])]
+        for h in hilos:
+            h.start()
+        en_paralelo(fin)
+        for h in hilos:
+            h.join()
+
+        por_ruta = {}
+        for ruta, segundos, ok in muestras:
+            latencias, errores = por_ruta.get(ruta, ([], 0))
+            latencias.append(segundos)
+            por_ruta[ruta] = (latencias, errores + (not ok))
+        for latencias, _ in por_ruta.values():
+            latencias.sort()
+        return por_ruta
@@ -0,0 +1,72 @@
+import gzip
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from app_libreria.compresion import brotli, minificar_html
+from app_libreria.models import Categoria
+
+
+def _medir(funcion, dato, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion(dato)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return resultado, statistics.median(tiempos)
+
+
+class Command(BaseCommand):
+    help = 'Compara, por plantilla, el CPU de minificar y comprimir contra los bytes que se ahorran.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=20)
+
+    def handle(self, *args, **options):
+        categoria = Categoria.objects.values_list('id', flat=True).first()
+        if categoria is None:
+            raise CommandError('Faltan datos: siembra con `loadtest --sembrar-libros N --solo-sembrar`.')
+        paginas = {
+            'libreria/dashboard.html': '/',
+            'libreria/libros.html': f'/categoria/{categoria}/',
+            'libreria/carrito.html': '/carrito/',
+            'registration/login.html': '/login/',
+        }
+
+        metodos = {'gzip 6': lambda b: gzip.compress(b, 6), 'gzip 9': lambda b: gzip.compress(b, 9)}
+        if brotli:
+            for calidad in (4, 5, 11):
+                metodos[f'br {calidad}'] = lambda b, q=calidad: brotli.compress(b, quality=q)
+        else:
+            self.stdout.write(self.style.WARNING('brotli no está instalado; solo se mide gzip.'))
+
+        cliente = Client(HTTP_HOST='localhost', HTTP_ACCEPT_ENCODING='identity')
+        repeticiones = options['repeticiones']
+        self.stdout.write(f"{'Plantilla':<26}{'Paso':<16}{'KB':>9}{'Ahorro':>9}{'ms':>9}{'KB/ms':>9}  (KB ahorrados por ms de CPU)")
+        for plantilla, path in paginas.items():
+            # HTML tal como sale de la vista, sin pasar por la minificación del middleware
+            with override_settings(MINIFICAR_HTML=False):
+                respuesta = cliente.get(path)
+            if respuesta.status_code != 200:
+                self.stdout.write(self.style.WARNING(f'{plantilla}: {path} respondió {respuesta.status_code}'))
+                continue
+            html = respuesta.content.decode(respuesta.charset)
+            original = len(respuesta.content)
+            minificado, ms_min = _medir(minificar_html, html, repeticiones)
+            minificado = minificado.encode(respuesta.charset)
+            self._fila(plantilla, 'original', original, original, None)
+            self._fila('', 'minificado', len(minificado), original, ms_min)
+
+            for nombre, metodo in metodos.items():
+                # Las filas "+ min" cuentan también el CPU de minificar: es lo que paga cada respuesta
+                for entrada, sufijo, previo in ((respuesta.content, '', 0), (minificado, ' + min', ms_min)):
+                    comprimido, ms = _medir(metodo, entrada, repeticiones)
+                    self._fila('', nombre + sufijo, len(comprimido), original, previo + ms)
+
+    def _fila(self, plantilla, paso, tamano, original, ms):
+        ahorro = 1 - tamano / original if original else 0
+        tiempo = f'{ms:>9.2f}' if ms is not None else f"{'':>9}"
+        rendimiento = f'{(original - tamano) / 1024 / ms:>9.0f}' if ms else f"{'':>9}"
+        self.stdout.write(f'{plantilla:<26}{paso:<16}{tamano / 1024:>9.1f}{ahorro:>9.0%}{tiempo}{rendimiento}')
@@ -0,0 +1,136 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app_libreria.models import Categoria
+
+# Corre en un proceso nuevo: importa la app WSGI como lo haría gunicorn y
+# atiende cada ruta dos veces (la primera paga la compilación perezosa).
+WORKER = r'''
+import io, json, sys, time
+inicio = time.perf_counter()
+from backend_libreria.wsgi import application
+cargada = time.perf_counter()
+
+def pedir(path):
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+        'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+    }
+    estado = []
+    t = time.perf_counter()
+    respuesta = application(environ, lambda s, h, e=None: estado.append(s))
+    b''.join(respuesta)
+    respuesta.close()
+    return time.perf_counter() - t, estado[0]
+
+rutas = {}
+for path in sys.argv[1:]:
+    primera, estado = pedir(path)
+    segunda, _ = pedir(path)
+    rutas[path] = [primera, segunda, estado]
+print(json.dumps({'carga': cargada - inicio, 'rutas': rutas}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Perfil de tiempo de import y latencia de las primeras peticiones de un worker nuevo, frío vs. precalentado.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15, help='Módulos a mostrar en el perfil de import.')
+        parser.add_argument('--repeticiones', type=int, default=3, help='Procesos nuevos por modo.')
+        parser.add_argument('--ruta', action='append', help='Rutas a pedir (se puede repetir).')
+
+    def handle(self, *args, **options):
+        self._perfil_import(options['top'])
+
+        rutas = options['ruta']
+        if not rutas:
+            categoria = Categoria.objects.values_list('id', flat=True).first()
+            rutas = ['/', '/login/', '/carrito/'] + ([f'/categoria/{categoria}/'] if categoria else [])
+
+        resultados = {}
+        for modo, valor in (('frío', '0'), ('precalentado', '1')):
+            corridas = [self._worker(rutas, LIBRERIA_CALENTAR=valor) for _ in range(options['repeticiones'])]
+            resultados[modo] = corridas
+        self._reporte(rutas, resultados)
+
+    def _entorno(self, **extra):
+        # Mismos settings que este proceso (manage.py ya puso DJANGO_SETTINGS_MODULE)
+        return dict(os.environ, **extra)
+
+    # --- Perfil de import (-X importtime) ---
+
+    def _perfil_import(self, top):
+        proceso = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import backend_libreria.wsgi'],
+            cwd=settings.BASE_DIR, env=self._entorno(LIBRERIA_CALENTAR='0'),
+            capture_output=True, text=True,
+        )
+        if proceso.returncode:
+            raise CommandError(f'No se pudo importar backend_libreria.wsgi:\n{proceso.stderr[-2000:]}')
+
+        modulos = []
+        for linea in proceso.stderr.splitlines():
+            if not linea.startswith('import time:') or 'self [us]' in linea:
+                continue
+            propio, acumulado, nombre = linea[len('import time:'):].split('|')
+            modulos.append((nombre.rstrip(), int(propio), int(acumulado)))
+
+        total = sum(propio for _, propio, _ in modulos)
+        por_paquete = defaultdict(int)
+        for nombre, propio, _ in modulos:
+            por_paquete[nombre.strip().split('.')[0]] += propio
+
+        self.stdout.write(f'Import de backend_libreria.wsgi: {total / 1000:.0f} ms en {len(modulos)} módulos\n')
+        self.stdout.write(f"{'Paquete':<32}{'ms propios':>12}{'%':>7}")
+        for paquete, propio in sorted(por_paquete.items(), key=lambda p: -p[1])[:top]:
+            self.stdout.write(f'{paquete:<32}{propio / 1000:>12.1f}{propio / total:>7.0%}')
+
+        self.stdout.write(f"\n{'Módulo':<48}{'ms propios':>12}{'ms con hijos':>14}")
+        for nombre, propio, acumulado in sorted(modulos, key=lambda m: -m[1])[:top]:
+            self.stdout.write(f'{nombre.strip():<48}{propio / 1000:>12.1f}{acumulado / 1000:>14.1f}')
+
+    # --- Arranque en frío ---
+
+    def _worker(self, rutas, **entorno):
+        proceso = subprocess.run(
+            [sys.executable, '-c', WORKER, *rutas],
+            cwd=settings.BASE_DIR, env=self._entorno(**entorno), capture_output=True, text=True,
+        )
+        if proceso.returncode:
+            raise CommandError(f'El worker de prueba falló:\n{proceso.stderr[-2000:]}')
+        return json.loads(proceso.stdout.strip().splitlines()[-1])
+
+    def _reporte(self, rutas, resultados):
+        self.stdout.write(f"\n{'Worker nuevo':<28}" + ''.join(f'{modo:>16}' for modo in resultados))
+        self.stdout.write(f"{'carga de la app (ms)':<28}" + ''.join(
+            f"{statistics.median(c['carga'] for c in corridas) * 1000:>16.1f}" for corridas in resultados.values()
+        ))
+        for path in rutas:
+            for indice, etiqueta in ((0, '1a'), (1, '2a')):
+                celdas = ''.join(
+                    f"{statistics.median(c['rutas'][path][indice] for c in corridas) * 1000:>16.1f}"
+                    for corridas in resultados.values()
+                )
+                self.stdout.write(f'{etiqueta + " " + path + " (ms)":<28}{celdas}')
+        estados = {c['rutas'][p][2] for corridas in resultados.values() for c in corridas for p in rutas}
+        if any(not e.startswith(('2', '3')) for e in estados):
+            self.stdout.write(self.style.WARNING(f'Respuestas con error: {sorted(estados)}'))
+        primera = {
+            modo: sum(statistics.median(c['rutas'][p][0] for c in corridas) for p in rutas)
+            for modo, corridas in resultados.items()
+        }
+        self.stdout.write(self.style.SUCCESS(
+            f"\nPrimeras peticiones: {primera['frío'] * 1000:.0f} ms en frío, "
+            f"{primera['precalentado'] * 1000:.0f} ms precalentado"
+        ))
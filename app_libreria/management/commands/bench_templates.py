@@ -0,0 +1,115 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.management.base import BaseCommand, CommandError
+from django.template.backends.django import DjangoTemplates
+from django.test import RequestFactory
+
+from app_libreria.catalogo import CategoriaRecord, LibroRecord
+
+PLANTILLAS = ('libreria/libros.html', 'libreria/dashboard.html', 'libreria/carrito.html')
+CONTEXT_PROCESSORS = [
+    'django.template.context_processors.request',
+    'django.contrib.auth.context_processors.auth',
+    'django.contrib.messages.context_processors.messages',
+]
+
+
+class _Linea:
+    def __init__(self, libro, cantidad):
+        self.libro = libro
+        self.cantidad = cantidad
+
+    def subtotal(self):
+        return self.libro.precio * self.cantidad
+
+
+def _motores():
+    dirs = [settings.BASE_DIR / 'app_libreria' / 'templates']
+    motores = {
+        'django (cached loader)': DjangoTemplates({
+            'NAME': 'bench-django-cached', 'DIRS': dirs, 'APP_DIRS': False,
+            'OPTIONS': {'context_processors': CONTEXT_PROCESSORS, 'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ]},
+        }),
+        'django (sin caché)': DjangoTemplates({
+            'NAME': 'bench-django', 'DIRS': dirs, 'APP_DIRS': False,
+            'OPTIONS': {'context_processors': CONTEXT_PROCESSORS, 'loaders': [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ]},
+        }),
+    }
+    try:
+        from django.template.backends.jinja2 import Jinja2
+        motores['jinja2'] = Jinja2({
+            'NAME': 'bench-jinja2', 'DIRS': [], 'APP_DIRS': True,
+            'OPTIONS': {'environment': 'app_libreria.jinja2_env.environment', 'autoescape': True,
+                        'context_processors': CONTEXT_PROCESSORS},
+        })
+    except ImportError:
+        pass
+    return motores
+
+
+class Command(BaseCommand):
+    help = 'Compara el tiempo de render de las plantillas de la tienda en Django y Jinja2.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--libros', type=int, default=1000, help='Libros en la lista a renderizar.')
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--plantilla', choices=PLANTILLAS, action='append',
+                            help='Limita el benchmark a estas plantillas (se puede repetir).')
+
+    def handle(self, *args, **options):
+        n = options['libros']
+        categoria = CategoriaRecord(1, 'Novela', '', '#ff85a2')
+        libros = tuple(
+            LibroRecord(i, f'Libro número {i}', f'Autor {i % 97}', 1, None, 'Editorial',
+                        'Una descripción suficientemente larga para que se trunque en la tarjeta. ' * 2,
+                        Decimal('199.90') + i, f'978-{i:09d}', 'https://via.placeholder.com/300x400')
+            for i in range(n)
+        )
+        lineas = [_Linea(l, 1 + l.id % 3) for l in libros]
+        subtotal = sum(l.subtotal() for l in lineas)
+        contextos = {
+            'libreria/libros.html': {'categoria': categoria, 'libros': libros, 'carrito_count': 3},
+            'libreria/dashboard.html': {'categorias': [categoria] * 3, 'carrito_count': 3},
+            'libreria/carrito.html': {'items': lineas, 'subtotal': subtotal, 'iva': subtotal * Decimal('0.16'),
+                                      'total': subtotal * Decimal('1.16'), 'carrito_count': len(lineas),
+                                      'recomendaciones': libros[:4]},
+        }
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.session = {}
+        request._messages = FallbackStorage(request)
+
+        motores = _motores()
+        if 'jinja2' not in motores:
+            self.stdout.write(self.style.WARNING('Jinja2 no está instalado; solo se comparan los cargadores de Django.'))
+
+        self.stdout.write(f"{'Plantilla':<26}{'Motor':<24}{'mediana ms':>12}{'mín ms':>10}{'KB':>8}")
+        for nombre in options['plantilla'] or PLANTILLAS:
+            for motor_nombre, motor in motores.items():
+                tiempos = []
+                html = ''
+                for _ in range(options['repeticiones']):
+                    inicio = time.perf_counter()
+                    # get_template dentro del ciclo: así se nota el costo de recompilar sin caché
+                    html = motor.get_template(nombre).render(contextos[nombre], request)
+                    tiempos.append((time.perf_counter() - inicio) * 1000)
+                if not html:
+                    raise CommandError(f'{motor_nombre} devolvió una página vacía para {nombre}')
+                self.stdout.write(
+                    f'{nombre:<26}{motor_nombre:<24}{statistics.median(tiempos):>12.2f}'
+                    f'{min(tiempos):>10.2f}{len(html.encode()) / 1024:>8.0f}'
+                )
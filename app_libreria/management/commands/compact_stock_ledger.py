@@ -0,0 +1,44 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from app_libreria.models import CorteExistencia, MovimientoStock
+from app_libreria.movimientos import compactar, diferencias
+
+
+class Command(BaseCommand):
+    help = 'Compacta la bitácora de movimientos de stock en cortes por existencia y borra lo ya cortado.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conservar-dias', type=int, default=90,
+                            help='Días de movimientos que se conservan completos (antes de eso, solo los cortes).')
+        parser.add_argument('--lote', type=int, default=5000, help='Movimientos borrados por transacción.')
+        parser.add_argument('--pausa', type=float, default=0.1,
+                            help='Segundos entre lotes para dejar pasar otras escrituras.')
+        parser.add_argument('--verificar', action='store_true',
+                            help='Compara corte + movimientos contra las existencias actuales.')
+
+    def handle(self, *args, **options):
+        if options['conservar_dias'] < 0:
+            raise CommandError('--conservar-dias no puede ser negativo.')
+        hasta = timezone.now() - timedelta(days=options['conservar_dias'])
+        antes = MovimientoStock.objects.count()
+
+        inicio = time.perf_counter()
+        cortes, borrados = compactar(hasta, options['lote'], options['pausa'])
+        self.stdout.write(
+            f'Corte al {timezone.localtime(hasta):%Y-%m-%d %H:%M}: {cortes} existencias, '
+            f'{borrados} de {antes} movimientos compactados en {time.perf_counter() - inicio:.1f}s'
+        )
+        self.stdout.write(f'Quedan {MovimientoStock.objects.count()} movimientos y {CorteExistencia.objects.count()} cortes.')
+
+        if options['verificar']:
+            distintas = diferencias()
+            if not distintas:
+                self.stdout.write(self.style.SUCCESS('La bitácora cuadra con todas las existencias.'))
+                return
+            self.stdout.write(self.style.WARNING(f'{len(distintas)} existencias no cuadran (libro, sucursal: bitácora / tabla):'))
+            for (libro_id, sucursal_id), (esperada, actual) in sorted(distintas.items())[:20]:
+                self.stdout.write(f'  {libro_id}, {sucursal_id}: {esperada} / {actual}')
@@ -0,0 +1,45 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+
+from app_libreria.reservas import expirar
+
+
+class Command(BaseCommand):
+    help = 'Libera por lotes las reservas de stock caducadas; con --cada se queda corriendo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Reservas por transacción.')
+        parser.add_argument('--pausa', type=float, default=0.1,
+                            help='Segundos entre lotes para dejar pasar otras escrituras.')
+        parser.add_argument('--cada', type=float, default=0,
+                            help='Repetir cada N segundos hasta recibir SIGTERM/Ctrl+C (0 = una sola pasada).')
+
+    def handle(self, *args, **options):
+        self.detener = False
+        if options['cada']:
+            signal.signal(signal.SIGTERM, self._detener)
+        try:
+            while True:
+                liberadas = self._pasada(options['lote'], options['pausa'])
+                if liberadas or options['verbosity'] > 1:
+                    self.stdout.write(f'Reservas liberadas: {liberadas}')
+                if not options['cada'] or self.detener:
+                    return
+                time.sleep(options['cada'])
+        except KeyboardInterrupt:
+            pass
+
+    def _detener(self, *args):
+        self.detener = True
+
+    def _pasada(self, lote, pausa):
+        total = 0
+        while not self.detener:
+            n = expirar(lote)
+            total += n
+            if n < lote:
+                break
+            time.sleep(pausa)
+        return total
@@ -0,0 +1,90 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import F
+
+from app_libreria.models import Libro, Categoria, CarritoItem, Pedido, Proveedor, Inventario, Reserva
+from app_libreria.sucursales import consulta_sucursales
+
+
+def consultas_de_las_vistas(usuario_id=1, libro_id=1):
+    """Consultas representativas de cada vista: (nombre, queryset, se_permite_scan).
+
+    Los listados completos del panel y la reconstrucción del catálogo recorren
+    la tabla entera a propósito; el resto debe resolverse con un índice.
+    """
+    return [
+        # Tienda
+        ('dashboard: contador del carrito', CarritoItem.objects.filter(usuario_id=usuario_id), False),
+        ('dashboard: categorías por nombre', Categoria.objects.filter(nombre__in=['Poesía', 'Novela', 'Historia']), False),
+        ('libros_por_categoria: libros', Libro.objects.filter(categoria_id=1), False),
+        ('agregar_carrito: libro', Libro.objects.filter(id=libro_id), False),
+        ('agregar_carrito: renglón existente', CarritoItem.objects.filter(usuario_id=usuario_id, libro_id=libro_id), False),
+        ('ver_carrito: renglones', CarritoItem.objects.filter(usuario_id=usuario_id), False),
+        ('agregar_carrito: sucursal con existencia', consulta_sucursales({libro_id: 1}), False),
+        ('ver_carrito: sucursal que surte el pedido', consulta_sucursales({libro_id: 1, libro_id + 1: 2}), False),
+        ('ver_carrito: reservas del carrito', Reserva.objects.filter(clave=f'u:{usuario_id}'), False),
+        ('búsqueda: libro por ISBN', Libro.objects.filter(isbn='978-000000'), False),
+        ('búsqueda: libro por título', Libro.objects.filter(titulo='Rayuela'), False),
+        ('búsqueda: libros de un autor', Libro.objects.filter(autor='Pablo Neruda').order_by('titulo'), False),
+        ('catálogo en memoria: categorías', Categoria.objects.order_by('id'), True),
+        ('catálogo en memoria: libros', Libro.objects.order_by('id'), True),
+        ('catálogo en memoria: stock', Inventario.objects.all(), True),
+        # Panel de administración
+        # Recorre por rowid hacia atrás y se detiene a los 5 renglones
+        ('admin_dashboard: libros recientes', Libro.objects.order_by('-id')[:5], True),
+        ('admin_dashboard: stock bajo', Inventario.objects.filter(cantidad__lte=F('stock_minimo')).select_related('libro'), True),
+        ('lista_usuarios: usuarios', User.objects.order_by('id'), True),
+        ('lista_usuarios: pedidos del usuario', Pedido.objects.filter(usuario_id=usuario_id).order_by('-fecha'), False),
+        ('admin_pedidos_list: pedidos recientes', Pedido.objects.order_by('-fecha')[:50], False),
+        ('admin_proveedores_list', Proveedor.objects.all(), True),
+        ('admin_inventario_list', Inventario.objects.select_related('libro'), True),
+    ]
+
+
+def es_scan_completo(detalle):
+    # SQLite reporta "SCAN tabla" cuando recorre todo sin índice;
+    # "SCAN tabla USING [COVERING] INDEX" recorre un índice y no lo contamos como tal.
+    return detalle.startswith('SCAN ') and 'USING' not in detalle
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta EXPLAIN QUERY PLAN sobre las consultas de las vistas y marca los recorridos completos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--strict', action='store_true',
+                            help='Termina con error si alguna consulta no permitida hace un scan completo.')
+        parser.add_argument('--verbose-plan', action='store_true',
+                            help='Muestra el plan completo de cada consulta.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Este diagnóstico solo entiende los planes de SQLite.')
+
+        regresiones = []
+        for nombre, queryset, permite_scan in consultas_de_las_vistas():
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                detalles = [fila[-1] for fila in cursor.fetchall()]
+
+            scans = [d for d in detalles if es_scan_completo(d)]
+            if not scans:
+                estado = self.style.SUCCESS('OK  ')
+            elif permite_scan:
+                estado = self.style.WARNING('SCAN')
+            else:
+                estado = self.style.ERROR('FAIL')
+                regresiones.append(nombre)
+
+            self.stdout.write(f'{estado} {nombre}')
+            for detalle in (detalles if options['verbose_plan'] else scans):
+                self.stdout.write(f'       {detalle}')
+
+        if regresiones:
+            mensaje = f'{len(regresiones)} consulta(s) recorren tablas completas sin índice.'
+            if options['strict']:
+                raise CommandError(mensaje)
+            self.stdout.write(self.style.ERROR(mensaje))
+        else:
+            self.stdout.write(self.style.SUCCESS('Todas las consultas calientes usan índices.'))
@@ -0,0 +1,111 @@
+import signal
+import threading
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+
+from app_libreria.models import (
+    CambioCatalogo, CarritoItem, ExistenciaSucursal, Inventario, Libro, MovimientoStock, Pedido, Reserva,
+)
+from app_libreria.mantenimiento import (
+    activar_vacio_incremental, analizar, borrar_cambios_catalogo, borrar_carritos, borrar_sesiones,
+    carrito_inactivo_dias, es_sqlite, vaciar,
+)
+
+
+# Sus listados en el admin estiman el total con sqlite_stat1 (admin.estimar_filas)
+ESTIMADAS = (Libro, Inventario, ExistenciaSucursal, MovimientoStock, Reserva, CarritoItem, Pedido)
+
+
+class Command(BaseCommand):
+    help = ('Borra por lotes las sesiones vencidas y los carritos abandonados, y mantiene SQLite '
+            '(ANALYZE y vacío incremental); con --cada se queda corriendo.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias-carrito', type=int, default=None,
+                            help='Días sin cambios para dar por abandonado un carrito (def. CARRITO_INACTIVO_DIAS).')
+        parser.add_argument('--lote', type=int, default=500, help='Filas por transacción.')
+        parser.add_argument('--pausa', type=float, default=0.1,
+                            help='Segundos entre lotes para dejar pasar otras escrituras.')
+        parser.add_argument('--paginas', type=int, default=500, help='Páginas devueltas al disco por paso de vacío.')
+        parser.add_argument('--sin-sqlite', action='store_true', help='Solo borrar; sin ANALYZE ni vacío.')
+        parser.add_argument('--activar-vacio-incremental', action='store_true',
+                            help='Cambia auto_vacuum a INCREMENTAL con un VACUUM completo (una vez, sin tráfico).')
+        parser.add_argument('--cada', type=float, default=0,
+                            help='Repetir cada N segundos hasta recibir SIGTERM/Ctrl+C (0 = una sola pasada).')
+
+    def handle(self, *args, **options):
+        if options['activar_vacio_incremental']:
+            self._activar()
+            return
+        # Un Event y no un booleano: la espera entre pasadas y las pausas entre lotes terminan en cuanto llega SIGTERM
+        self.detener = threading.Event()
+        if options['cada']:
+            signal.signal(signal.SIGTERM, self._detener)
+        try:
+            while True:
+                self._pasada(options)
+                if not options['cada'] or self.detener.wait(options['cada']):
+                    return
+        except KeyboardInterrupt:
+            pass
+
+    def _detener(self, *args):
+        self.detener.set()
+
+    def _medir(self, etiqueta, funcion, *args, **kwargs):
+        inicio = time.perf_counter()
+        resultado = funcion(*args, **kwargs)
+        self.tiempos.append((etiqueta, time.perf_counter() - inicio))
+        return resultado
+
+    def _pasada(self, options):
+        self.tiempos = []
+        lote, pausa = options['lote'], options['pausa']
+        dias = options['dias_carrito'] if options['dias_carrito'] is not None else carrito_inactivo_dias()
+
+        sesiones = renglones = cambios = 0
+        # Cada paso corta entre lotes si llega SIGTERM; los siguientes ya no empiezan
+        if not self.detener.is_set():
+            sesiones = self._medir('sesiones', borrar_sesiones, lote, pausa, detener=self.detener)
+            self.stdout.write(f'Sesiones vencidas: {sesiones}')
+        if not self.detener.is_set():
+            renglones = self._medir('carritos', borrar_carritos, dias, lote, pausa, detener=self.detener)
+            self.stdout.write(f'Renglones de carrito sin cambios en {dias} días: {renglones}')
+        if not self.detener.is_set():
+            cambios = self._medir('bitácora prerender', borrar_cambios_catalogo, lote, pausa, detener=self.detener)
+            if cambios:
+                self.stdout.write(f'Cambios de catálogo sin páginas pre-renderizadas: {cambios}')
+
+        if not options['sin_sqlite'] and es_sqlite() and not self.detener.is_set():
+            purgadas = ((Session, sesiones), (CarritoItem, renglones), (CambioCatalogo, cambios))
+            tablas = [m._meta.db_table for m, n in purgadas if n]
+            tablas += [m._meta.db_table for m in ESTIMADAS if m._meta.db_table not in tablas]
+            self._medir('analyze', analizar, tablas)
+            self.stdout.write(f'ANALYZE: {", ".join(tablas)}')
+            vacio = self._medir('vacío', vaciar, paginas=options['paginas'], pausa=pausa, detener=self.detener)
+            if vacio.modo == 'incremental':
+                self.stdout.write(f'Vacío incremental: {vacio.liberadas} páginas ({vacio.bytes_liberados / 1e6:.1f} MB) '
+                                  f'devueltas al disco, quedan {vacio.libres_despues} libres')
+            elif vacio.libres_antes:
+                self.stdout.write(self.style.WARNING(
+                    f'{vacio.libres_antes} páginas libres ({vacio.libres_antes * vacio.tam_pagina / 1e6:.1f} MB) '
+                    f'que no se devuelven al disco: auto_vacuum = {vacio.modo}. '
+                    f'Actívalo una vez con --activar-vacio-incremental'))
+
+        total = sum(segundos for _, segundos in self.tiempos)
+        detalle = ', '.join(f'{etiqueta} {segundos:.1f}s' for etiqueta, segundos in self.tiempos)
+        if self.detener.is_set():
+            self.stdout.write(self.style.WARNING(f'Limpieza interrumpida por SIGTERM tras {total:.1f}s ({detalle})'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Limpieza terminada en {total:.1f}s ({detalle})'))
+
+    def _activar(self):
+        if not es_sqlite():
+            self.stdout.write('La base no es SQLite; no hay nada que activar.')
+            return
+        inicio = time.perf_counter()
+        activar_vacio_incremental()
+        self.stdout.write(self.style.SUCCESS(
+            f'auto_vacuum = INCREMENTAL; VACUUM completo en {time.perf_counter() - inicio:.1f}s'))
@@ -0,0 +1,264 @@
+import json
+import random
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from app_libreria.catalogo import invalidar_catalogo
+from app_libreria.prerender import registrar_cambios
+from app_libreria.models import Categoria, Libro, Inventario, Sucursal, ExistenciaSucursal
+from app_libreria.sucursales import recalcular_totales
+from app_libreria.movimientos import Bitacora
+
+PASSWORD_CARGA = 'carga-1234'
+MEZCLA_DEFAULT = 'login=1,categoria=6,carrito=3,checkout=1'
+CSRF_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+# =======================================================
+# CLIENTE HTTP DE CADA WORKER (SIN SEGUIR REDIRECCIONES)
+# =======================================================
+
+class _SinRedireccion(HTTPRedirectHandler):
+    # Un 302 es una respuesta válida; no queremos medir también la página destino
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class ClienteTienda:
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies), _SinRedireccion())
+        self.muestras = []
+
+    def _csrf(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def peticion(self, ruta, path, datos=None, redireccion=False):
+        """Hace la petición, guarda (ruta, segundos, ok, limitada) y regresa el cuerpo.
+
+        Con `redireccion` solo cuenta como éxito un 3xx: un formulario que se
+        vuelve a mostrar con errores también responde 200.
+        """
+        url = self.base_url + path
+        body = None
+        headers = {}
+        if datos is not None:
+            datos = dict(datos, csrfmiddlewaretoken=self._csrf())
+            body = urlencode(datos).encode()
+            headers = {'Content-Type': 'application/x-www-form-urlencoded', 'Referer': url}
+
+        inicio = time.perf_counter()
+        contenido = b''
+        limitada = False
+        try:
+            with self.opener.open(Request(url, data=body, headers=headers), timeout=self.timeout) as resp:
+                contenido = resp.read()
+            ok = not redireccion
+        except HTTPError as e:
+            ok = 300 <= e.code < 400
+            limitada = e.code == 429
+        except (URLError, OSError):
+            ok = False
+        self.muestras.append((ruta, time.perf_counter() - inicio, ok, limitada))
+        return contenido.decode('utf-8', 'replace')
+
+    def login(self, username):
+        self.cookies.clear()
+        self.peticion('login (GET)', '/login/')
+        # Login correcto = 302 al dashboard; con credenciales malas la vista responde 200 con el formulario
+        self.peticion('login', '/login/', {'username': username, 'password': PASSWORD_CARGA}, redireccion=True)
+
+
+def _worker(args):
+    base_url, username, duracion, timeout, mezcla, categorias, libros, semilla = args
+    rnd = random.Random(semilla)
+    cliente = ClienteTienda(base_url, timeout)
+    acciones, pesos = zip(*mezcla)
+
+    inicio = time.perf_counter()
+    cliente.login(username)
+    while time.perf_counter() - inicio < duracion:
+        accion = rnd.choices(acciones, pesos)[0]
+        if accion == 'login':
+            cliente.login(username)
+        elif accion == 'categoria':
+            cliente.peticion('libros_por_categoria', f'/categoria/{rnd.choice(categorias)}/')
+        elif accion == 'carrito':
+            cliente.peticion('agregar_carrito', f'/agregar/{rnd.choice(libros)}/')
+        elif accion == 'checkout':
+            cliente.peticion('ver_carrito', '/carrito/')
+            cliente.peticion('checkout', '/carrito/', {'direccion': 'Calle de prueba 123'})
+    return cliente.muestras
+
+
+def _percentil(ordenados, p):
+    if not ordenados:
+        return 0.0
+    k = min(len(ordenados) - 1, max(0, round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[k]
+
+
+class Command(BaseCommand):
+    help = ('Siembra un catálogo grande y genera tráfico concurrente contra un servidor local '
+            '(arráncalo con LIBRERIA_SIN_LIMITES=1 para que los límites por IP no recorten la prueba).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--workers', type=int, default=8, help='Procesos concurrentes (uno por usuario simulado).')
+        parser.add_argument('--duracion', type=float, default=30, help='Segundos de tráfico por worker.')
+        parser.add_argument('--timeout', type=float, default=10)
+        parser.add_argument('--mezcla', default=MEZCLA_DEFAULT,
+                            help='Pesos por acción, p. ej. "%s".' % MEZCLA_DEFAULT)
+        parser.add_argument('--sembrar-libros', type=int, default=0, help='Libros de carga a crear antes de la prueba.')
+        parser.add_argument('--sembrar-usuarios', type=int, default=0, help='Usuarios de carga a crear antes de la prueba.')
+        parser.add_argument('--solo-sembrar', action='store_true')
+        parser.add_argument('--json', help='Guarda el reporte en este archivo.')
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['sembrar_libros'] or options['sembrar_usuarios']:
+            self._sembrar(options['sembrar_libros'], options['sembrar_usuarios'])
+        if options['solo_sembrar']:
+            return
+
+        mezcla = self._parsear_mezcla(options['mezcla'])
+        usuarios = list(User.objects.filter(username__startswith='carga_').values_list('username', flat=True)[:options['workers']])
+        categorias = list(Categoria.objects.values_list('id', flat=True))
+        libros = list(Libro.objects.values_list('id', flat=True)[:50000])
+        if not usuarios or not categorias or not libros:
+            raise CommandError('Faltan datos de carga: usa --sembrar-libros y --sembrar-usuarios.')
+
+        tareas = [
+            (options['url'], usuarios[i % len(usuarios)], options['duracion'], options['timeout'],
+             mezcla, categorias, libros, options['semilla'] + i)
+            for i in range(options['workers'])
+        ]
+        self.stdout.write(f"Generando tráfico con {len(tareas)} workers durante {options['duracion']}s contra {options['url']}...")
+
+        inicio = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=len(tareas)) as pool:
+            resultados = list(pool.map(_worker, tareas))
+        transcurrido = time.perf_counter() - inicio
+
+        reporte = self._reporte([m for r in resultados for m in r], transcurrido)
+        self._imprimir(reporte)
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as f:
+                json.dump(reporte, f, indent=2, ensure_ascii=False)
+
+    def _parsear_mezcla(self, texto):
+        mezcla = []
+        for parte in texto.split(','):
+            accion, _, peso = parte.partition('=')
+            accion = accion.strip()
+            if accion not in ('login', 'categoria', 'carrito', 'checkout'):
+                raise CommandError(f'Acción desconocida en --mezcla: {accion!r}')
+            try:
+                mezcla.append((accion, float(peso)))
+            except ValueError:
+                raise CommandError(f'Peso inválido para {accion!r}: {peso!r}')
+        return mezcla
+
+    def _sembrar(self, n_libros, n_usuarios):
+        if n_usuarios:
+            # Un solo hash para todos: hashear miles de contraseñas tomaría minutos
+            password = make_password(PASSWORD_CARGA)
+            existentes = set(User.objects.filter(username__startswith='carga_').values_list('username', flat=True))
+            nuevos = [User(username=f'carga_{i}', password=password)
+                      for i in range(n_usuarios) if f'carga_{i}' not in existentes]
+            User.objects.bulk_create(nuevos, batch_size=1000)
+            self.stdout.write(f'Usuarios de carga creados: {len(nuevos)}')
+
+        if n_libros:
+            categorias = list(Categoria.objects.all()[:10])
+            if not categorias:
+                categorias = Categoria.objects.bulk_create(
+                    [Categoria(nombre=n) for n in ('Poesía', 'Novela', 'Historia')]
+                )
+            sucursales = list(Sucursal.objects.filter(activa=True).values_list('id', flat=True))
+            if not sucursales:
+                sucursales = [Sucursal.objects.create(nombre='Principal').pk]
+            rnd = random.Random(0)
+            bitacora = Bitacora(lote=5000)
+            for inicio in range(0, n_libros, 2000):
+                lote = Libro.objects.bulk_create([
+                    Libro(titulo=f'Libro de carga {i}', autor=f'Autor {i % 500}',
+                          categoria=rnd.choice(categorias), descripcion='Generado por loadtest.',
+                          precio=Decimal(rnd.randint(100, 900)), isbn=f'979-{i:09d}')
+                    for i in range(inicio, min(inicio + 2000, n_libros))
+                ])
+                existencias = ExistenciaSucursal.objects.bulk_create([
+                    ExistenciaSucursal(libro=l, sucursal_id=s, cantidad=rnd.randint(0, 50)) for l in lote for s in sucursales
+                ])
+                Inventario.objects.bulk_create([Inventario(libro=l, cantidad=0) for l in lote])
+                for e in existencias:
+                    bitacora.anotar(e.sucursal_id, e.libro_id, 'entrada', e.cantidad)
+            bitacora.volcar()
+            # bulk_create no dispara señales: totales por libro y sucursal de una vez
+            recalcular_totales()
+            invalidar_catalogo()
+            registrar_cambios(todo=True)
+            self.stdout.write(f'Libros de carga creados: {n_libros}')
+
+    def _reporte(self, muestras, transcurrido):
+        por_ruta = {}
+        for ruta, segundos, ok, limitada in muestras:
+            por_ruta.setdefault(ruta, ([], [0, 0]))
+            por_ruta[ruta][0].append(segundos)
+            if not ok:
+                por_ruta[ruta][1][0] += 1
+            if limitada:
+                por_ruta[ruta][1][1] += 1
+
+        rutas = {}
+        for ruta, (latencias, errores) in sorted(por_ruta.items()):
+            latencias.sort()
+            rutas[ruta] = {
+                'peticiones': len(latencias),
+                'rps': len(latencias) / transcurrido,
+                'p50_ms': _percentil(latencias, 50) * 1000,
+                'p90_ms': _percentil(latencias, 90) * 1000,
+                'p99_ms': _percentil(latencias, 99) * 1000,
+                'max_ms': latencias[-1] * 1000,
+                'errores': errores[0],
+                'tasa_error': errores[0] / len(latencias),
+                'limitadas': errores[1],
+            }
+        return {
+            'segundos': transcurrido,
+            'peticiones': len(muestras),
+            'rps': len(muestras) / transcurrido if transcurrido else 0,
+            'rutas': rutas,
+        }
+
+    def _imprimir(self, reporte):
+        self.stdout.write(f"\n{'Ruta':<22}{'Pet.':>8}{'RPS':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'Error %':>9}")
+        for ruta, r in reporte['rutas'].items():
+            self.stdout.write(
+                f"{ruta:<22}{r['peticiones']:>8}{r['rps']:>9.1f}{r['p50_ms']:>9.1f}"
+                f"{r['p90_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['tasa_error'] * 100:>9.2f}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"\nTotal: {reporte['peticiones']} peticiones en {reporte['segundos']:.1f}s ({reporte['rps']:.1f} req/s)"
+        ))
+        limitadas = sum(r['limitadas'] for r in reporte['rutas'].values())
+        if limitadas:
+            self.stdout.write(self.style.WARNING(
+                f'{limitadas} respuestas 429 por los límites de peticiones: el reporte no mide la capacidad real. '
+                f'Arranca el servidor con LIBRERIA_SIN_LIMITES=1.'
+            ))
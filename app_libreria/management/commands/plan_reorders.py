@@ -0,0 +1,248 @@
+import csv
+import time
+from datetime import timedelta
+from statistics import NormalDist
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from app_libreria.models import DetallePedido, Inventario, Libro, Proveedor
+
+try:
+    import numpy as np
+except ImportError:  # Dependencia opcional: solo la necesita este comando
+    np = None
+
+CAMPOS = ['stock_minimo', 'demanda_diaria', 'pedido_sugerido']
+
+
+# =======================================================
+# PRONÓSTICO Y PUNTOS DE REORDEN (TODO EL CATÁLOGO A LA VEZ)
+# =======================================================
+# Las ventas llegan agregadas por (libro, día). Media móvil y suavizado
+# exponencial son promedios ponderados por día, así que ambos salen con un
+# np.bincount sobre esas filas: sin matriz libros x días ni ciclos por libro.
+
+def pesos_por_dia(dias, metodo, alfa, ventana):
+    """Peso de cada día del historial (el último es ayer), normalizados a 1."""
+    antiguedad = np.arange(dias - 1, -1, -1)
+    if metodo == 'media':
+        pesos = (antiguedad < ventana).astype(np.float64)
+    else:
+        # Suavizado exponencial que arranca en 0; normalizar corrige ese sesgo inicial
+        pesos = alfa * (1 - alfa) ** antiguedad
+    return pesos / pesos.sum()
+
+
+def pronosticar(indice, dia, unidades, n, pesos):
+    """Demanda diaria esperada y su desviación estándar para n libros.
+
+    Los días sin ventas no tienen fila pero cuentan como 0 en ambos promedios.
+    """
+    w = pesos[dia]
+    media = np.bincount(indice, weights=w * unidades, minlength=n)
+    cuadrados = np.bincount(indice, weights=w * unidades * unidades, minlength=n)
+    desviacion = np.sqrt(np.maximum(cuadrados - media * media, 0))
+    return media, desviacion
+
+
+def planear(disponible, demanda, desviacion, entrega, z, cobertura):
+    """Punto de reorden y unidades a pedir para llegar a punto + `cobertura` días de venta."""
+    punto = np.ceil(demanda * entrega + z * desviacion * np.sqrt(entrega))
+    objetivo = punto + np.ceil(demanda * cobertura)
+    sugerido = np.where(disponible <= punto, np.maximum(objetivo - disponible, 0), 0)
+    return punto.astype(np.int64), sugerido.astype(np.int64)
+
+
+class Command(BaseCommand):
+    help = 'Pronostica la demanda de cada libro, recalcula puntos de reorden y sugiere pedidos por proveedor.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--metodo', choices=['exponencial', 'media'], default='exponencial')
+        parser.add_argument('--alfa', type=float, default=0.1, help='Suavizado exponencial (0-1).')
+        parser.add_argument('--ventana', type=int, default=28, help='Días de la media móvil.')
+        parser.add_argument('--dias', type=int, default=180, help='Días de historial de ventas.')
+        parser.add_argument('--nivel-servicio', type=float, default=0.95,
+                            help='Probabilidad de no agotar el libro mientras llega el pedido.')
+        parser.add_argument('--cobertura', type=int, default=30, help='Días de venta que debe cubrir cada pedido.')
+        parser.add_argument('--entrega-default', type=int, default=14,
+                            help='Días de entrega para libros sin proveedor.')
+        parser.add_argument('--csv', help='Escribe aquí las líneas de pedido sugeridas.')
+        parser.add_argument('--dry-run', action='store_true', help='Calcular sin guardar.')
+        parser.add_argument('--benchmark', type=int, metavar='LIBROS',
+                            help='Mide solo el cálculo con datos sintéticos para este número de libros.')
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError('Este comando requiere numpy (pip install numpy).')
+        if not 0 < options['alfa'] < 1 or not 0 < options['nivel_servicio'] < 1:
+            raise CommandError('--alfa y --nivel-servicio deben estar entre 0 y 1.')
+        if options['ventana'] < 1 or options['dias'] < 1:
+            raise CommandError('--ventana y --dias deben ser de al menos 1 día.')
+        if options['cobertura'] < 0 or options['entrega_default'] < 0:
+            raise CommandError('--cobertura y --entrega-default no pueden ser negativos.')
+        self.z = NormalDist().inv_cdf(options['nivel_servicio'])
+        self.pesos = pesos_por_dia(options['dias'], options['metodo'], options['alfa'], options['ventana'])
+        if options['benchmark']:
+            return self._benchmark(options['benchmark'], options)
+
+        inicio = time.perf_counter()
+        inv = self._cargar_inventario(options['entrega_default'])
+        if not len(inv['id']):
+            self.stdout.write('No hay inventario.')
+            return
+        indice, dia, unidades = self._cargar_ventas(inv['libro_id'], options['dias'])
+        carga = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        n = len(inv['id'])
+        demanda, desviacion = pronosticar(indice, dia, unidades, n, self.pesos)
+        disponible = np.maximum(inv['cantidad'] - inv['reservado'], 0)
+        punto, sugerido = planear(disponible, demanda, desviacion, inv['entrega'], self.z, options['cobertura'])
+        demanda = np.round(demanda, 3)
+        calculo = time.perf_counter() - inicio
+
+        self.stdout.write(
+            f'{n} libros, {len(indice)} filas de venta ({options["dias"]} días): '
+            f'carga {carga:.2f}s, cálculo {calculo:.3f}s'
+        )
+        self._resumen_por_proveedor(inv, sugerido)
+        if options['csv']:
+            self._csv(options['csv'], inv, disponible, punto, demanda, sugerido)
+        if options['dry_run']:
+            return
+
+        inicio = time.perf_counter()
+        cambiados = self._guardar(inv, punto, demanda, sugerido)
+        self.stdout.write(self.style.SUCCESS(
+            f'{cambiados} filas de inventario actualizadas en {time.perf_counter() - inicio:.2f}s'
+        ))
+
+    # --- Carga ---
+
+    def _cargar_inventario(self, entrega_default):
+        filas = (
+            Inventario.objects.filter(libro__eliminado=False)
+            .annotate(
+                proveedor=Coalesce('libro__proveedor', Value(0)),
+                entrega=Coalesce('libro__proveedor__dias_entrega', Value(entrega_default)),
+            )
+            .order_by('libro_id')
+            .values_list('id', 'libro_id', 'cantidad', 'reservado', 'proveedor', 'entrega',
+                         'stock_minimo', 'pedido_sugerido', 'demanda_diaria', 'libro__precio')
+            .iterator(chunk_size=20000)
+        )
+        datos = np.array(list(filas), dtype=np.float64).reshape(-1, 10)
+        enteros = ['id', 'libro_id', 'cantidad', 'reservado', 'proveedor', 'entrega', 'stock_minimo', 'pedido_sugerido']
+        inv = {nombre: datos[:, i].astype(np.int64) for i, nombre in enumerate(enteros)}
+        inv['demanda_diaria'] = datos[:, 8]
+        inv['precio'] = datos[:, 9]
+        return inv
+
+    def _cargar_ventas(self, libro_ids, dias):
+        """Unidades por (libro, día) desde hace `dias` hasta ayer, como índices de arreglo."""
+        hoy = timezone.localdate()
+        desde = hoy - timedelta(days=dias)
+        filas = (
+            DetallePedido.objects
+            .filter(pedido__fecha__date__gte=desde, pedido__fecha__date__lt=hoy, libro_id__isnull=False)
+            .annotate(dia=TruncDate('pedido__fecha'))
+            .values('libro_id', 'dia').annotate(unidades=Sum('cantidad')).order_by()
+            .values_list('libro_id', 'dia', 'unidades')
+            .iterator(chunk_size=20000)
+        )
+        libros, fechas, unidades = [], [], []
+        for libro_id, fecha, u in filas:
+            libros.append(libro_id)
+            fechas.append(fecha)
+            unidades.append(u)
+        libros = np.array(libros, dtype=np.int64)
+        dia = (np.array(fechas, dtype='datetime64[D]') - np.datetime64(desde, 'D')).astype(np.int64)
+        unidades = np.array(unidades, dtype=np.float64)
+
+        # libro_ids viene ordenado: searchsorted da la fila de cada venta
+        indice = np.searchsorted(libro_ids, libros)
+        indice = np.minimum(indice, len(libro_ids) - 1)
+        valido = libro_ids[indice] == libros  # Ventas de libros eliminados o sin inventario
+        return indice[valido], dia[valido], unidades[valido]
+
+    # --- Resultados ---
+
+    def _resumen_por_proveedor(self, inv, sugerido):
+        pedir = sugerido > 0
+        if not pedir.any():
+            self.stdout.write('Nada que pedir.')
+            return
+        proveedores, grupo = np.unique(inv['proveedor'][pedir], return_inverse=True)
+        titulos = np.bincount(grupo)
+        unidades = np.bincount(grupo, weights=sugerido[pedir])
+        valor = np.bincount(grupo, weights=sugerido[pedir] * inv['precio'][pedir])
+        nombres = Proveedor.objects.in_bulk([int(p) for p in proveedores if p])
+
+        self.stdout.write(f"\n{'Proveedor':<32}{'Entrega':>9}{'Títulos':>9}{'Unidades':>10}{'Valor':>14}")
+        for i in np.argsort(-valor):
+            proveedor = nombres.get(int(proveedores[i]))
+            nombre = proveedor.nombre if proveedor else '(sin proveedor)'
+            entrega = f'{proveedor.dias_entrega}d' if proveedor else '-'
+            self.stdout.write(f'{nombre[:31]:<32}{entrega:>9}{titulos[i]:>9}{int(unidades[i]):>10}{valor[i]:>14,.2f}')
+        self.stdout.write('')
+
+    def _csv(self, ruta, inv, disponible, punto, demanda, sugerido):
+        filas = np.flatnonzero(sugerido > 0)
+        filas = filas[np.lexsort((inv['libro_id'][filas], inv['proveedor'][filas]))]
+        ids = inv['libro_id'][filas].tolist()
+        libros = {}
+        for i in range(0, len(ids), 2000):
+            libros.update({l[0]: l[1:] for l in Libro.todos.filter(id__in=ids[i:i + 2000]).values_list('id', 'isbn', 'titulo')})
+        nombres = dict(Proveedor.objects.values_list('id', 'nombre'))
+        with open(ruta, 'w', newline='', encoding='utf-8') as f:
+            escritor = csv.writer(f)
+            escritor.writerow(['proveedor', 'libro_id', 'isbn', 'titulo', 'disponible', 'punto_reorden',
+                               'demanda_diaria', 'pedir'])
+            for fila, libro_id in zip(filas, ids):
+                isbn, titulo = libros.get(libro_id, ('', ''))
+                escritor.writerow([nombres.get(int(inv['proveedor'][fila]), ''), libro_id, isbn, titulo,
+                                   int(disponible[fila]), int(punto[fila]), demanda[fila], int(sugerido[fila])])
+        self.stdout.write(f'{len(filas)} líneas de pedido -> {ruta}')
+
+    def _guardar(self, inv, punto, demanda, sugerido):
+        # Solo las filas que cambiaron; en un catálogo estable son pocas
+        cambio = (
+            (inv['stock_minimo'] != punto) | (inv['pedido_sugerido'] != sugerido)
+            | (np.abs(inv['demanda_diaria'] - demanda) > 5e-4)
+        )
+        filas = np.flatnonzero(cambio)
+        objetos = [
+            Inventario(id=int(inv['id'][i]), stock_minimo=int(punto[i]),
+                       demanda_diaria=float(demanda[i]), pedido_sugerido=int(sugerido[i]))
+            for i in filas
+        ]
+        # Sin ultima_actualizacion: cambió el plan, no el stock
+        with transaction.atomic():
+            Inventario.objects.bulk_update(objetos, CAMPOS, batch_size=1000)
+        return len(objetos)
+
+    # --- Benchmark ---
+
+    def _benchmark(self, n, options):
+        rnd = np.random.default_rng(0)
+        dias = options['dias']
+        # ~5 días con ventas por libro, con demanda sesgada como en un catálogo real
+        filas = n * 5
+        indice = rnd.zipf(1.3, filas) % n
+        dia = rnd.integers(0, dias, filas)
+        unidades = rnd.integers(1, 4, filas).astype(np.float64)
+        disponible = rnd.integers(0, 40, n)
+        entrega = rnd.integers(3, 21, n)
+
+        inicio = time.perf_counter()
+        demanda, desviacion = pronosticar(indice, dia, unidades, n, self.pesos)
+        punto, sugerido = planear(disponible, demanda, desviacion, entrega, self.z, options['cobertura'])
+        segundos = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'{n} libros, {filas} filas de venta: {segundos:.3f}s '
+            f'({int((sugerido > 0).sum())} libros por pedir, {int(sugerido.sum())} unidades)'
+        ))
@@ -0,0 +1,82 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max
+
+from app_libreria.catalogo import obtener_catalogo
+from app_libreria.models import CambioCatalogo
+from app_libreria.prerender import borrar_huerfanas, directorio, render_portada, render_categoria
+
+
+def _iniciar_worker():
+    # Con 'spawn' el proceso hijo llega sin configurar; con 'fork' no hace nada
+    django.setup()
+
+
+def _render_lote(paginas):
+    hechas = 0
+    for tipo, categoria_id in paginas:
+        if tipo == 'portada':
+            render_portada()
+            hechas += 2
+        elif render_categoria(categoria_id):
+            hechas += 1
+    return hechas
+
+
+class Command(BaseCommand):
+    help = 'Genera HTML estático de la portada y las páginas de categoría (solo las afectadas por cambios).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true', help='Regenerar todas las páginas.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--lote', type=int, default=20, help='Páginas por tarea del pool.')
+
+    def handle(self, *args, **options):
+        base = directorio()
+        if base is None:
+            raise CommandError('Configura PRERENDER_DIR en settings.py.')
+
+        # Todo lo registrado hasta aquí queda cubierto; lo que llegue después espera a la siguiente corrida
+        hasta = CambioCatalogo.objects.aggregate(m=Max('id'))['m'] or 0
+        completo = options['completo'] or not (base / 'index.html').exists()
+        completo, paginas = self._paginas(hasta, completo)
+        if not paginas:
+            self.stdout.write('Sin cambios pendientes.')
+            return
+
+        inicio = time.perf_counter()
+        lotes = [paginas[i:i + options['lote']] for i in range(0, len(paginas), options['lote'])]
+        if options['workers'] > 1 and len(lotes) > 1:
+            # Los hijos abren sus propias conexiones
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=min(options['workers'], len(lotes)), initializer=_iniciar_worker) as pool:
+                hechas = sum(pool.map(_render_lote, lotes))
+        else:
+            hechas = _render_lote(paginas)
+
+        CambioCatalogo.objects.filter(id__lte=hasta).delete()
+        # Las categorías borradas sin pasar por la bitácora dejan su página; la pasada completa las limpia
+        huerfanas = borrar_huerfanas(obtener_catalogo().categorias) if completo else 0
+        modo = 'completas' if completo else 'incrementales'
+        self.stdout.write(self.style.SUCCESS(
+            f'{hechas} páginas {modo} en {time.perf_counter() - inicio:.1f}s -> {base}'
+            + (f' ({huerfanas} huérfanas borradas)' if huerfanas else '')
+        ))
+
+    def _paginas(self, hasta, completo):
+        cambios = CambioCatalogo.objects.filter(id__lte=hasta)
+        if not completo and cambios.filter(tipo='todo').exists():
+            completo = True
+        if completo:
+            return True, [('portada', None)] + [('categoria', c) for c in obtener_catalogo().categorias]
+
+        categorias = set(cambios.filter(tipo='categoria').values_list('categoria_id', flat=True))
+        paginas = [('categoria', c) for c in sorted(categorias)]
+        if cambios.filter(tipo='portada').exists():
+            paginas.insert(0, ('portada', None))
+        return False, paginas
@@ -0,0 +1,123 @@
+import time
+
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from app_libreria.models import (
+    Categoria, Libro, Inventario, CarritoItem, Pedido, DetallePedido, PedidoArchivado, DetallePedidoArchivado,
+    Recomendacion, Reserva, UsuarioEliminado, ExistenciaSucursal, MovimientoStock, CorteExistencia, LibroSimilar,
+)
+from app_libreria.archivo import archivo_listo
+from app_libreria.reservas import clave_usuario, liberar
+from app_libreria.sucursales import descontar_libros
+
+
+def borrar_en(model, columna, ids):
+    """DELETE ... WHERE columna IN (...) directo, sin cargar objetos ni señales."""
+    if not ids:
+        return 0
+    q = connection.ops.quote_name
+    marcas = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {q(model._meta.db_table)} WHERE {q(columna)} IN ({marcas})', list(ids))
+        return cursor.rowcount
+
+
+class Command(BaseCommand):
+    help = 'Purga por lotes los libros, categorías y usuarios marcados como eliminados.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=200, help='Filas principales por transacción.')
+        parser.add_argument('--pausa', type=float, default=0.2,
+                            help='Segundos entre lotes para dejar pasar otras escrituras.')
+        parser.add_argument('--max-lotes', type=int, default=0, help='Detenerse tras N lotes (0 = sin límite).')
+
+    def handle(self, *args, **options):
+        self.lote = options['lote']
+        self.pausa = options['pausa']
+        self.restantes = options['max_lotes'] or None
+        self.totales = {}
+        self.archivo = archivo_listo()
+
+        inicio = time.perf_counter()
+        self._purgar(self._siguientes_libros, self._purgar_libros)
+        self._purgar(self._siguientes_categorias, self._purgar_categorias)
+        self._purgar(self._siguientes_usuarios, self._purgar_usuarios)
+
+        for tabla, n in sorted(self.totales.items()):
+            self.stdout.write(f'  {tabla}: {n}')
+        self.stdout.write(self.style.SUCCESS(f'Purga terminada en {time.perf_counter() - inicio:.1f}s'))
+
+    def _contar(self, model, n):
+        if n:
+            self.totales[model._meta.db_table] = self.totales.get(model._meta.db_table, 0) + n
+
+    def _purgar(self, siguientes, purgar):
+        while self.restantes is None or self.restantes > 0:
+            ids = siguientes()
+            if not ids:
+                return
+            with transaction.atomic():
+                purgar(ids)
+            if self.restantes is not None:
+                self.restantes -= 1
+            time.sleep(self.pausa)
+
+    # --- Libros: primero los hijos, luego el libro ---
+
+    def _siguientes_libros(self):
+        return list(Libro.todos.filter(eliminado=True).values_list('id', flat=True)[:self.lote])
+
+    def _purgar_libros(self, ids):
+        self._contar(CarritoItem, borrar_en(CarritoItem, 'libro_id', ids))
+        self._contar(Reserva, borrar_en(Reserva, 'libro_id', ids))
+        # Sin señales: los totales de cada sucursal se ajustan antes de borrar
+        descontar_libros(ids)
+        self._contar(ExistenciaSucursal, borrar_en(ExistenciaSucursal, 'libro_id', ids))
+        self._contar(MovimientoStock, borrar_en(MovimientoStock, 'libro_id', ids))
+        self._contar(CorteExistencia, borrar_en(CorteExistencia, 'libro_id', ids))
+        self._contar(Inventario, borrar_en(Inventario, 'libro_id', ids))
+        self._contar(Recomendacion, borrar_en(Recomendacion, 'libro_id', ids))
+        self._contar(Recomendacion, borrar_en(Recomendacion, 'recomendado_id', ids))
+        self._contar(LibroSimilar, borrar_en(LibroSimilar, 'libro_id', ids))
+        self._contar(LibroSimilar, borrar_en(LibroSimilar, 'similar_id', ids))
+        # El historial de ventas se conserva (on_delete=SET_NULL)
+        DetallePedido.objects.filter(libro_id__in=ids).update(libro=None)
+        self._contar(Libro, borrar_en(Libro, 'id', ids))
+
+    # --- Categorías: solo cuando ya no les queda ningún libro ---
+
+    def _siguientes_categorias(self):
+        return list(
+            Categoria.todos.filter(eliminado=True)
+            .exclude(id__in=Libro.todos.values('categoria_id'))
+            .values_list('id', flat=True)[:self.lote]
+        )
+
+    def _purgar_categorias(self, ids):
+        self._contar(Categoria, borrar_en(Categoria, 'id', ids))
+
+    # --- Usuarios ---
+
+    def _siguientes_usuarios(self):
+        return list(UsuarioEliminado.objects.values_list('usuario_id', flat=True)[:self.lote])
+
+    def _purgar_usuarios(self, ids):
+        pedidos = list(Pedido.objects.filter(usuario_id__in=ids).values_list('id', flat=True))
+        for i in range(0, len(pedidos), 500):
+            self._contar(DetallePedido, borrar_en(DetallePedido, 'pedido_id', pedidos[i:i + 500]))
+        self._contar(Pedido, borrar_en(Pedido, 'usuario_id', ids))
+        if self.archivo:
+            # Otra base: no entra en la transacción del lote, pero repetirlo es inocuo
+            _, por_modelo = PedidoArchivado.objects.filter(usuario_id__in=ids).delete()
+            for model in (PedidoArchivado, DetallePedidoArchivado):
+                self._contar(model, por_modelo.get(model._meta.label, 0))
+        self._contar(CarritoItem, borrar_en(CarritoItem, 'usuario_id', ids))
+        self._contar(Reserva, liberar([clave_usuario(i) for i in ids]))
+        self._contar(LogEntry, borrar_en(LogEntry, 'user_id', ids))
+        borrar_en(User.groups.through, 'user_id', ids)
+        borrar_en(User.user_permissions.through, 'user_id', ids)
+        borrar_en(UsuarioEliminado, 'usuario_id', ids)
+        self._contar(User, borrar_en(User, 'id', ids))
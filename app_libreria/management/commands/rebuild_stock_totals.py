@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from app_libreria.models import Sucursal
+from app_libreria.sucursales import recalcular_totales
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde las existencias por sucursal los totales de Inventario y de cada sucursal.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Solo reporta las diferencias.')
+
+    def handle(self, *args, **options):
+        corregidos = recalcular_totales(guardar=not options['dry_run'])
+        verbo = 'Desalineados' if options['dry_run'] else 'Corregidos'
+        for modelo, n in corregidos.items():
+            self.stdout.write(f'{verbo} ({modelo}): {n}')
+
+        self.stdout.write(f"\n{'Sucursal':<30}{'Unidades':>10}{'Reservado':>11}{'Disponible':>12}")
+        for sucursal in Sucursal.objects.all():
+            self.stdout.write(f'{sucursal.nombre:<30}{sucursal.cantidad:>10}{sucursal.reservado:>11}{sucursal.disponible:>12}')
+        if any(corregidos.values()) and options['dry_run']:
+            self.stdout.write(self.style.WARNING('Corre sin --dry-run para corregirlos.'))
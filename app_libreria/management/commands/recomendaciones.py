@@ -0,0 +1,137 @@
+import json
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app_libreria.models import DetallePedido, Libro, Recomendacion
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # Dependencias opcionales: solo las necesita este comando
+    np = sparse = None
+
+
+def _directorio():
+    return Path(getattr(settings, 'RECOMENDACIONES_DIR', settings.BASE_DIR / 'datos' / 'recomendaciones'))
+
+
+class Command(BaseCommand):
+    help = 'Calcula "quienes compraron esto también compraron" a partir de los renglones de pedidos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true',
+                            help='Ignora el estado guardado y recalcula desde todos los pedidos.')
+        parser.add_argument('--top-k', type=int, default=getattr(settings, 'RECOMENDACIONES_TOP_K', 10))
+        parser.add_argument('--min-coincidencias', type=int, default=1,
+                            help='Veces mínimas que dos libros deben aparecer juntos.')
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError('Este comando requiere numpy y scipy (pip install numpy scipy).')
+
+        inicio = time.perf_counter()
+        directorio = _directorio()
+        archivo_matriz = directorio / 'coocurrencias.npz'
+        archivo_estado = directorio / 'estado.json'
+
+        max_libro = Libro.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        n = max_libro + 1
+
+        if options['completo'] or not archivo_matriz.exists() or not archivo_estado.exists():
+            coocurrencias = sparse.csr_matrix((n, n), dtype=np.int32)
+            ultimo_pedido = 0
+            incremental = False
+        else:
+            coocurrencias = sparse.load_npz(archivo_matriz).tocsr()
+            ultimo_pedido = json.loads(archivo_estado.read_text())['ultimo_pedido']
+            incremental = True
+            if coocurrencias.shape[0] < n:
+                coocurrencias.resize((n, n))
+            n = coocurrencias.shape[0]
+
+        # Renglones nuevos como pares (pedido, libro); un libro cuenta una vez por pedido
+        pares = np.array(
+            list(DetallePedido.objects.filter(pedido_id__gt=ultimo_pedido, libro_id__isnull=False, libro_id__lt=n)
+                 .values_list('pedido_id', 'libro_id').distinct().iterator(chunk_size=10000)),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        if not len(pares):
+            if not incremental:
+                Recomendacion.objects.all().delete()  # Sin pedidos no queda ninguna recomendación vigente
+            self.stdout.write('No hay pedidos nuevos desde la última ejecución.')
+            return
+
+        pedidos, filas = np.unique(pares[:, 0], return_inverse=True)
+        # Matriz pedidos x libros (binaria); A^T A da cuántas veces aparecen juntos
+        incidencia = sparse.csr_matrix(
+            (np.ones(len(pares), dtype=np.int32), (filas, pares[:, 1])), shape=(len(pedidos), n)
+        )
+        coocurrencias = (coocurrencias + (incidencia.T @ incidencia)).tocsr()
+
+        # Libros cuyo vecindario cambia: los de los pedidos nuevos y quienes co-ocurren con ellos
+        tocados = np.unique(pares[:, 1])
+        if incremental:
+            afectados = np.unique(np.concatenate([tocados, coocurrencias[:, tocados].nonzero()[0]]))
+        else:
+            afectados = np.flatnonzero(coocurrencias.diagonal())
+
+        vecinos = self._top_k(coocurrencias, afectados, options['top_k'], options['min_coincidencias'])
+        self._guardar(afectados, vecinos, completo=not incremental)
+
+        directorio.mkdir(parents=True, exist_ok=True)
+        sparse.save_npz(archivo_matriz, coocurrencias)
+        archivo_estado.write_text(json.dumps({'ultimo_pedido': int(pedidos.max())}))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Incremental' if incremental else 'Completo'}: {len(pedidos)} pedidos nuevos, "
+            f"{len(afectados)} libros actualizados en {time.perf_counter() - inicio:.2f}s"
+        ))
+
+    def _top_k(self, coocurrencias, afectados, k, minimo):
+        # Similitud coseno entre libros: C[i,j] / sqrt(n_i * n_j), con n_i = pedidos que incluyen i
+        veces = coocurrencias.diagonal().astype(np.float64)
+        escala = np.zeros_like(veces)
+        np.divide(1.0, np.sqrt(veces), out=escala, where=veces > 0)
+
+        bloque = coocurrencias[afectados].tocsr()
+        bloque.data[bloque.data < minimo] = 0
+        similitud = sparse.diags(escala[afectados]) @ bloque @ sparse.diags(escala)
+        similitud = similitud.tocsr()
+
+        vecinos = []
+        for fila, libro_id in enumerate(afectados):
+            inicio, fin = similitud.indptr[fila], similitud.indptr[fila + 1]
+            columnas = similitud.indices[inicio:fin]
+            valores = similitud.data[inicio:fin]
+            # Fuera el propio libro (la diagonal) y los pares bajo el mínimo
+            mascara = (columnas != libro_id) & (valores > 0)
+            columnas, valores = columnas[mascara], valores[mascara]
+            if len(valores) > k:
+                mejores = np.argpartition(-valores, k)[:k]
+                columnas, valores = columnas[mejores], valores[mejores]
+            orden = np.argsort(-valores, kind='stable')
+            vecinos.append(list(zip(columnas[orden].tolist(), valores[orden].tolist())))
+        return vecinos
+
+    def _guardar(self, afectados, vecinos, completo=False):
+        existentes = set(Libro.objects.values_list('id', flat=True))
+        nuevas = [
+            Recomendacion(libro_id=int(libro_id), recomendado_id=recomendado, puntaje=puntaje, posicion=pos)
+            for libro_id, lista in zip(afectados, vecinos) if int(libro_id) in existentes
+            for pos, (recomendado, puntaje) in enumerate(
+                (r, p) for r, p in lista if r in existentes
+            )
+        ]
+        ids = [int(i) for i in afectados]
+        with transaction.atomic():
+            if completo:
+                # También se van las filas de libros que ya no están en el cálculo (p. ej. sin pedidos)
+                Recomendacion.objects.all().delete()
+            else:
+                for i in range(0, len(ids), 500):
+                    Recomendacion.objects.filter(libro_id__in=ids[i:i + 500]).delete()
+            Recomendacion.objects.bulk_create(nuevas, batch_size=2000)
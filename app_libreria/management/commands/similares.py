@@ -0,0 +1,239 @@
+import hashlib
+import math
+import time
+import zlib
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app_libreria.autocompletar import normalizar
+from app_libreria.models import Libro, LibroSimilar
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # Dependencias opcionales: solo las necesita este comando
+    np = sparse = None
+
+# Se quitan después de normalizar (sin acentos): "más" -> "mas"
+PALABRAS_VACIAS = frozenset('''
+a al algo algun alguna algunas alguno algunos ante antes aqui asi cada como con contra cual cuando de del desde
+donde durante e el ella ellas ellos en entre era eran es esa esas ese eso esos esta estan estas este esto estos
+fue fueron ha han hasta hay la las le les lo los mas me mi mis mucho muy nada ni no nos nuestra nuestro o otra
+otras otro otros para pero poco por porque que quien se sea ser si sin sobre su sus tambien te tiene tienen todo
+todos tras tu tus un una uno unas unos y ya yo
+an and are as at by for from in is of on or the to with
+'''.split())
+PESO_TITULO = 2
+PESO_AUTOR = 3
+UMBRAL_COMPLETO = 0.1  # Fracción de libros cambiados a partir de la cual conviene recalcular todos los vecindarios
+
+
+def _directorio():
+    return Path(getattr(settings, 'RECOMENDACIONES_DIR', settings.BASE_DIR / 'datos' / 'recomendaciones'))
+
+
+def _raiz(palabra):
+    # Singular aproximado: "novelas"/"novela" y "autores"/"autor" dan la misma raíz
+    if len(palabra) > 4 and palabra.endswith('s'):
+        palabra = palabra[:-1]
+    if len(palabra) > 4 and palabra.endswith('e'):
+        palabra = palabra[:-1]
+    return palabra
+
+
+def palabras(texto):
+    return [_raiz(p) for p in normalizar(texto).split() if len(p) > 2 and p not in PALABRAS_VACIAS and not p.isdigit()]
+
+
+def terminos(titulo, autor, categoria_id, descripcion):
+    """Conteo ponderado de términos: palabras del título y la descripción, el autor completo y la categoría."""
+    conteo = Counter(palabras(descripcion))
+    for palabra in palabras(titulo):
+        conteo[palabra] += PESO_TITULO
+    autor = normalizar(autor)
+    if autor:
+        conteo[f'autor:{autor}'] += PESO_AUTOR
+    conteo[f'categoria:{categoria_id}'] += 1
+    return conteo
+
+
+def _firma(*campos):
+    texto = '\x1f'.join(str(c) for c in campos)
+    return int.from_bytes(hashlib.blake2b(texto.encode(), digest_size=8).digest(), 'little', signed=True)
+
+
+class Command(BaseCommand):
+    help = 'Calcula los libros parecidos por contenido (TF-IDF de título, autor, categoría y descripción).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true',
+                            help='Ignora el estado guardado y vectoriza todos los libros.')
+        parser.add_argument('--top-k', type=int, default=getattr(settings, 'SIMILARES_TOP_K', 10))
+        parser.add_argument('--min-puntaje', type=float, default=0.05,
+                            help='Similitud coseno mínima para guardar un vecino.')
+        parser.add_argument('--memoria-mb', type=int, default=256,
+                            help='Memoria aproximada para cada bloque de similitudes.')
+        parser.add_argument('--bits', type=int, default=20,
+                            help='Columnas de la matriz = 2**bits (los términos se asignan por hash).')
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError('Este comando requiere numpy y scipy (pip install numpy scipy).')
+
+        inicio = time.perf_counter()
+        directorio = _directorio()
+        archivo_terminos = directorio / 'similares_terminos.npz'
+        archivo_estado = directorio / 'similares_estado.npz'
+        dimension = 2 ** options['bits']
+
+        completo = options['completo'] or not archivo_terminos.exists() or not archivo_estado.exists()
+        if not completo:
+            estado = np.load(archivo_estado)
+            completo = int(estado['dimension']) != dimension
+        if completo:
+            anteriores = {}
+        else:
+            anteriores = dict(zip(estado['ids'].tolist(), estado['firmas'].tolist()))
+
+        # Se recorren todos los libros activos, pero solo se tokenizan los nuevos o cambiados
+        ids, firmas, cambiados = [], [], []
+        filas, columnas, valores = [], [], []
+        for libro_id, titulo, autor, categoria_id, descripcion in (
+                Libro.objects.order_by('id').values_list('id', 'titulo', 'autor', 'categoria_id', 'descripcion')
+                .iterator(chunk_size=2000)):
+            firma = _firma(titulo, autor, categoria_id, descripcion)
+            ids.append(libro_id)
+            firmas.append(firma)
+            if anteriores.get(libro_id) == firma:
+                continue
+            cambiados.append(libro_id)
+            for termino, veces in terminos(titulo, autor, categoria_id, descripcion).items():
+                filas.append(libro_id)
+                columnas.append(zlib.crc32(termino.encode()) % dimension)
+                valores.append(1 + math.log(veces))  # TF sublineal
+        quitados = sorted(anteriores.keys() - set(ids))  # Borrados (lógicos o purgados) desde la última vez
+
+        if not cambiados and not quitados:
+            self.stdout.write('No hay libros nuevos ni cambiados desde la última ejecución.')
+            return
+
+        n = max(ids, default=0) + 1
+        if completo:
+            matriz = sparse.csr_matrix((n, dimension), dtype=np.float32)
+        else:
+            matriz = sparse.load_npz(archivo_terminos).tocsr()
+            n = max(n, matriz.shape[0])
+            if matriz.shape[0] < n:
+                matriz.resize((n, dimension))
+        # Las filas de los libros tocados se reemplazan; las demás se quedan como estaban
+        conservar = np.ones(n, dtype=np.float32)
+        conservar[cambiados + quitados] = 0
+        nuevos = sparse.csr_matrix((np.array(valores, dtype=np.float32), (filas, columnas)), shape=(n, dimension))
+        matriz = (sparse.diags(conservar) @ matriz + nuevos).tocsr()
+        matriz.eliminate_zeros()
+
+        vectores = self._tfidf(matriz, len(ids))
+        afectados = self._afectados(vectores, ids, cambiados, quitados, completo, options['top_k'],
+                                    options['memoria_mb'])
+
+        with transaction.atomic():
+            for i in range(0, len(quitados), 500):
+                LibroSimilar.objects.filter(libro_id__in=quitados[i:i + 500]).delete()
+        guardados = 0
+        for bloque, vecinos, puntajes in self._top_k(vectores, afectados, options['top_k'], options['memoria_mb']):
+            guardados += self._guardar(bloque, vecinos, puntajes, options['min_puntaje'])
+
+        # El estado se guarda al final: si algo falla, la siguiente pasada repite estos libros
+        directorio.mkdir(parents=True, exist_ok=True)
+        sparse.save_npz(archivo_terminos, matriz)
+        np.savez(archivo_estado, ids=np.array(ids, dtype=np.int64), firmas=np.array(firmas, dtype=np.int64),
+                 dimension=dimension)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Completo' if completo else 'Incremental'}: {len(cambiados)} libros vectorizados, "
+            f"{len(quitados)} quitados, {len(afectados)} vecindarios recalculados ({guardados} vecinos) "
+            f"en {time.perf_counter() - inicio:.2f}s"
+        ))
+
+    def _tfidf(self, matriz, n_libros):
+        # idf suavizado; cada fila queda con norma 1, así el producto punto es la similitud coseno
+        df = np.bincount(matriz.indices, minlength=matriz.shape[1])
+        idf = (np.log((1 + n_libros) / (1 + df)) + 1).astype(np.float32)
+        vectores = (matriz @ sparse.diags(idf)).tocsr()
+        normas = np.sqrt(np.asarray(vectores.multiply(vectores).sum(axis=1)).ravel())
+        escala = np.zeros_like(normas)
+        np.divide(1.0, normas, out=escala, where=normas > 0)
+        return (sparse.diags(escala.astype(np.float32)) @ vectores).tocsr()
+
+    def _afectados(self, vectores, ids, cambiados, quitados, completo, k, memoria_mb):
+        """Libros cuyo top-K puede cambiar.
+
+        En una pasada incremental el idf de los demás se mueve poco y no se
+        recalcula su vecindario por eso; solo el de los libros cambiados, el
+        de quienes tenían de vecino a un libro tocado y el de quienes ahora
+        tendrían a un libro cambiado por encima de su último vecino.
+        """
+        if completo or len(cambiados) > UMBRAL_COMPLETO * len(ids):
+            return np.array(ids, dtype=np.int64)
+        activos = np.zeros(vectores.shape[0], dtype=bool)
+        activos[ids] = True
+
+        tocados = cambiados + quitados
+        con_vecino_tocado = set()
+        for i in range(0, len(tocados), 500):
+            con_vecino_tocado.update(
+                LibroSimilar.objects.filter(similar_id__in=tocados[i:i + 500]).values_list('libro_id', flat=True))
+
+        # Puntaje del último vecino guardado; con menos de K vecinos entra cualquiera
+        umbral = np.zeros(vectores.shape[0], dtype=np.float32)
+        for libro_id, puntaje in LibroSimilar.objects.filter(posicion=k - 1).values_list('libro_id', 'puntaje').iterator():
+            if libro_id < len(umbral):
+                umbral[libro_id] = puntaje
+        # Mejor similitud de cada libro contra los cambiados, por los mismos bloques de filas que _top_k
+        mejor = np.zeros(vectores.shape[0], dtype=np.float32)
+        for bloque, similitud in self._similitudes(vectores, np.array(cambiados, dtype=np.int64), memoria_mb):
+            np.maximum(mejor, similitud.max(axis=0), out=mejor)
+        superan = np.flatnonzero((mejor > umbral) & activos)
+
+        afectados = np.unique(np.concatenate([
+            np.array(cambiados, dtype=np.int64), np.array(sorted(con_vecino_tocado), dtype=np.int64), superan,
+        ]))
+        return afectados[activos[afectados]]
+
+    def _top_k(self, vectores, afectados, k, memoria_mb):
+        """Top-K vecinos por bloques de filas: cada bloque es una matriz densa de similitudes contra todos."""
+        n = vectores.shape[0]
+        k = min(k, n - 1)
+        if k <= 0:
+            return
+        for bloque, similitud in self._similitudes(vectores, afectados, memoria_mb):
+            similitud[np.arange(len(bloque)), bloque] = 0  # Fuera el propio libro
+            vecinos = np.argpartition(-similitud, k - 1, axis=1)[:, :k]
+            puntajes = np.take_along_axis(similitud, vecinos, axis=1)
+            orden = np.argsort(-puntajes, axis=1, kind='stable')
+            yield bloque, np.take_along_axis(vecinos, orden, axis=1), np.take_along_axis(puntajes, orden, axis=1)
+
+    def _similitudes(self, vectores, filas, memoria_mb):
+        """Matriz densa de similitudes de `filas` contra todos los libros, por bloques que caben en `memoria_mb`."""
+        traspuesta = vectores.T.tocsr()
+        # ~16 bytes por celda: el producto disperso intermedio más la copia densa en float32
+        filas_por_bloque = max(1, memoria_mb * 2 ** 20 // (16 * vectores.shape[0]))
+        for inicio in range(0, len(filas), filas_por_bloque):
+            bloque = filas[inicio:inicio + filas_por_bloque]
+            yield bloque, (vectores[bloque] @ traspuesta).toarray()
+
+    def _guardar(self, bloque, vecinos, puntajes, minimo):
+        # Los libros borrados tienen vector cero y nunca superan el mínimo
+        nuevas = [
+            LibroSimilar(libro_id=libro_id, similar_id=similar_id, puntaje=puntaje, posicion=pos)
+            for libro_id, columnas, valores in zip(bloque.tolist(), vecinos.tolist(), puntajes.tolist())
+            for pos, (similar_id, puntaje) in enumerate((s, p) for s, p in zip(columnas, valores) if p > minimo)
+        ]
+        with transaction.atomic():
+            LibroSimilar.objects.filter(libro_id__in=bloque.tolist()).delete()
+            LibroSimilar.objects.bulk_create(nuevas, batch_size=2000)
+        return len(nuevas)
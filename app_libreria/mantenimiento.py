@@ -0,0 +1,168 @@
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import CambioCatalogo, CarritoItem
+from .prerender import activo as prerender_activo
+
+# =======================================================
+# LIMPIEZA PERIÓDICA DE TABLAS QUE SOLO CRECEN
+# =======================================================
+# Con SESSION_ENGINE en base, cada visitante deja una fila en django_session
+# que nadie borra al vencer, y los carritos en base (CARRITO_MODO = 'db') que
+# se abandonan se quedan para siempre. Las dos tablas se consultan en cada
+# petición: mientras más crecen, más páginas recorre cada búsqueda.
+#
+# Se borra por lotes cortos, cada uno en su transacción y con pausa entre
+# lotes, para no acaparar el candado de escritura de SQLite (un DELETE de
+# miles de filas bloquearía los checkouts mientras dura). Los carritos de
+# 'ligero' viven en la sesión o en la cookie y caducan con ellas. La bitácora
+# CambioCatalogo la vacía prerender_catalog; si no hay páginas generadas,
+# nadie la consume y se borra aquí.
+#
+# Después, en SQLite:
+# - ANALYZE de las tablas purgadas y de las que el admin pagina con un total
+#   estimado (con analysis_limit para que sea rápido), para que el
+#   planificador y admin.estimar_filas vean su tamaño real.
+# - Vacío incremental: devuelve al disco las páginas que quedaron libres,
+#   por tandas. Necesita auto_vacuum = INCREMENTAL, que solo se activa con un
+#   VACUUM completo (activar_vacio_incremental, una vez y sin tráfico); sin
+#   él las páginas libres se reutilizan pero el archivo no se encoge.
+
+AUTO_VACUUM = {0: 'ninguno', 1: 'completo', 2: 'incremental'}
+
+
+def carrito_inactivo_dias():
+    return getattr(settings, 'CARRITO_INACTIVO_DIAS', 30)
+
+
+def _esperar(segundos, detener=None):
+    """Pausa que se corta si se activa `detener` (threading.Event); regresa True si hay que parar."""
+    if detener is None:
+        time.sleep(segundos)
+        return False
+    return detener.wait(segundos)
+
+
+def _por_lotes(siguientes, borrar, lote, pausa, detener=None):
+    total = 0
+    while True:
+        ids = siguientes(lote)
+        if not ids:
+            return total
+        with transaction.atomic():
+            total += borrar(ids)
+        # Entre lotes no hay nada a medias: buen momento para parar
+        if len(ids) < lote or _esperar(pausa, detener):
+            return total
+
+
+def borrar_sesiones(lote=500, pausa=0.1, ahora=None, detener=None):
+    """Borra las sesiones vencidas; regresa cuántas."""
+    vencidas = Session.objects.filter(expire_date__lt=ahora or timezone.now())
+    return _por_lotes(
+        lambda n: list(vencidas.values_list('session_key', flat=True)[:n]),
+        lambda claves: Session.objects.filter(session_key__in=claves).delete()[0],
+        lote, pausa, detener,
+    )
+
+
+def borrar_carritos(dias=None, lote=200, pausa=0.1, ahora=None, detener=None):
+    """Borra los carritos sin cambios en `dias` (por usuario, completos); regresa renglones borrados."""
+    if dias is None:
+        dias = carrito_inactivo_dias()
+    limite = (ahora or timezone.now()) - timedelta(days=dias)
+    viejos = CarritoItem.objects.filter(actualizado__lt=limite)
+    # Un renglón reciente mantiene vivo todo el carrito de ese usuario
+    abandonados = (
+        viejos.exclude(usuario_id__in=CarritoItem.objects.filter(actualizado__gte=limite).values('usuario_id'))
+        .values_list('usuario_id', flat=True).distinct()
+    )
+    return _por_lotes(
+        lambda n: list(abandonados[:n]),
+        # Solo lo viejo: si el usuario agregó algo entre la consulta y el borrado, se queda
+        lambda usuarios: viejos.filter(usuario_id__in=usuarios).delete()[0],
+        lote, pausa, detener,
+    )
+
+
+def borrar_cambios_catalogo(lote=500, pausa=0.1, detener=None):
+    """Vacía la bitácora de prerender si no hay páginas pre-renderizadas; regresa filas borradas."""
+    if prerender_activo():
+        return 0
+    return _por_lotes(
+        lambda n: list(CambioCatalogo.objects.values_list('id', flat=True)[:n]),
+        lambda ids: CambioCatalogo.objects.filter(id__in=ids).delete()[0],
+        lote, pausa, detener,
+    )
+
+
+# --- SQLite ---
+
+@dataclass
+class Vacio:
+    modo: str
+    tam_pagina: int
+    libres_antes: int
+    libres_despues: int = 0
+
+    @property
+    def liberadas(self):
+        return self.libres_antes - self.libres_despues
+
+    @property
+    def bytes_liberados(self):
+        return self.liberadas * self.tam_pagina
+
+
+def es_sqlite(alias='default'):
+    return connections[alias].vendor == 'sqlite'
+
+
+def _pragma(cursor, nombre):
+    cursor.execute(f'PRAGMA {nombre}')
+    return cursor.fetchone()[0]
+
+
+def analizar(tablas, alias='default', limite=1000):
+    """ANALYZE de `tablas` revisando a lo más ~`limite` filas por índice."""
+    conexion = connections[alias]
+    with conexion.cursor() as cursor:
+        cursor.execute(f'PRAGMA analysis_limit = {int(limite)}')
+        for tabla in tablas:
+            cursor.execute(f'ANALYZE {conexion.ops.quote_name(tabla)}')
+
+
+def vaciar(alias='default', paginas=500, pausa=0.05, detener=None):
+    """Devuelve al disco las páginas libres de a `paginas` por paso (solo con auto_vacuum incremental)."""
+    with connections[alias].cursor() as cursor:
+        vacio = Vacio(
+            modo=AUTO_VACUUM.get(_pragma(cursor, 'auto_vacuum'), '?'),
+            tam_pagina=_pragma(cursor, 'page_size'),
+            libres_antes=_pragma(cursor, 'freelist_count'),
+        )
+        vacio.libres_despues = vacio.libres_antes
+        if vacio.modo != 'incremental':
+            return vacio
+        while vacio.libres_despues:
+            cursor.execute(f'PRAGMA incremental_vacuum({int(paginas)})')
+            cursor.fetchall()
+            libres = _pragma(cursor, 'freelist_count')
+            if libres >= vacio.libres_despues:
+                break  # Otra conexión tiene la base ocupada; queda para la siguiente pasada
+            vacio.libres_despues = libres
+            if _esperar(pausa, detener):
+                break
+    return vacio
+
+
+def activar_vacio_incremental(alias='default'):
+    """Cambia auto_vacuum a INCREMENTAL; reescribe todo el archivo con VACUUM (bloquea la base mientras dura)."""
+    with connections[alias].cursor() as cursor:
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        cursor.execute('VACUUM')
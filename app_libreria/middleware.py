@@ -0,0 +1,114 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+
+from .compresion import TIPOS_COMPRIMIBLES, brotli, elegir_codificacion, minificar_html
+from .prerender import archivo_de
+
+
+class PrerenderMiddleware:
+    """Sirve las páginas de prerender_catalog antes de sesiones, vistas y base de datos.
+
+    En producción conviene que lo haga nginx directamente:
+
+        location / {
+            if ($cookie_messages) { proxy_pass http://django; break; }
+            try_files /prerender$uri/index.html @django;
+        }
+
+    Con avisos pendientes (cookie 'messages') se deja pasar a Django para que se muestren.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PRERENDER_SERVIR', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and not request.GET and not request.COOKIES.get('messages'):
+            archivo = archivo_de(request.path_info)
+            if archivo is not None:
+                try:
+                    return FileResponse(open(archivo, 'rb'), content_type='text/html; charset=utf-8')
+                except FileNotFoundError:
+                    pass
+        return self.get_response(request)
+
+
+class CompresionMiddleware(MiddlewareMixin):
+    """Minifica el HTML y comprime con brotli o gzip según Accept-Encoding.
+
+    Va justo después de SecurityMiddleware para cubrir también las páginas de
+    PrerenderMiddleware. Con MiddlewareMixin funciona en WSGI y ASGI sin
+    forzar a las vistas async (las SSE) a pasar por un hilo.
+
+    BREACH: si la respuesta usó el token CSRF (la plantilla llamó
+    {% csrf_token %}), solo se usa gzip con bytes aleatorios en la cabecera
+    (lo mismo que GZipMiddleware) para que el tamaño no delate el contenido,
+    y no se comprime si la petición viene de otro sitio (Sec-Fetch-Site),
+    que es desde donde se montaría el ataque. Django además enmascara el
+    token distinto en cada respuesta.
+    """
+
+    max_random_bytes = 100
+
+    def process_response(self, request, response):
+        tipo = response.get('Content-Type', '').partition(';')[0].strip().lower()
+        # text/event-stream no está en la lista: comprimirlo retendría los eventos
+        if tipo not in TIPOS_COMPRIMIBLES or response.has_header('Content-Encoding'):
+            return response
+        if response.streaming and response.is_async:
+            return response
+
+        if not response.streaming:
+            if tipo == 'text/html' and getattr(settings, 'MINIFICAR_HTML', False):
+                response.content = minificar_html(response.content.decode(response.charset)).encode(response.charset)
+                if response.has_header('Content-Length'):
+                    response.headers['Content-Length'] = str(len(response.content))
+            if len(response.content) < getattr(settings, 'COMPRESION_MINIMO', 1024):
+                return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        # CsrfViewMiddleware (más adentro) pone la cookie justo cuando la respuesta usó el token
+        con_csrf = settings.CSRF_COOKIE_NAME in response.cookies
+        if con_csrf and request.META.get('HTTP_SEC_FETCH_SITE') == 'cross-site':
+            return response
+        codificacion = elegir_codificacion(request.META.get('HTTP_ACCEPT_ENCODING', ''), permitir_br=not con_csrf)
+        if codificacion is None:
+            return response
+
+        if response.streaming:
+            if codificacion == 'br':
+                response.streaming_content = _brotli_sequence(response.streaming_content)
+            else:
+                response.streaming_content = compress_sequence(
+                    response.streaming_content, max_random_bytes=self.max_random_bytes,
+                )
+            del response.headers['Content-Length']
+        else:
+            if codificacion == 'br':
+                comprimido = brotli.compress(response.content, quality=getattr(settings, 'COMPRESION_BROTLI_CALIDAD', 5))
+            else:
+                comprimido = compress_string(response.content, max_random_bytes=self.max_random_bytes)
+            if len(comprimido) >= len(response.content):
+                return response
+            response.content = comprimido
+            response.headers['Content-Length'] = str(len(comprimido))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = codificacion
+        return response
+
+
+def _brotli_sequence(secuencia):
+    compresor = brotli.Compressor(quality=getattr(settings, 'COMPRESION_BROTLI_CALIDAD', 5))
+    for fragmento in secuencia:
+        salida = compresor.process(fragmento)
+        if salida:
+            yield salida
+    yield compresor.finish()
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:07
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def fusionar_carritos_duplicados(apps, schema_editor):
+    # La restricción única falla si ya hay renglones repetidos: los juntamos en uno
+    CarritoItem = apps.get_model('app_libreria', 'CarritoItem')
+    duplicados = (
+        CarritoItem.objects.values('usuario_id', 'libro_id')
+        .annotate(n=Count('id'), primero=Min('id'), total=Sum('cantidad'))
+        .filter(n__gt=1)
+    )
+    for dup in duplicados:
+        CarritoItem.objects.filter(id=dup['primero']).update(cantidad=dup['total'])
+        CarritoItem.objects.filter(
+            usuario_id=dup['usuario_id'], libro_id=dup['libro_id']
+        ).exclude(id=dup['primero']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_libreria', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='categoria',
+            index=models.Index(fields=['nombre'], name='categoria_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['isbn'], name='libro_isbn_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['titulo'], name='libro_titulo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['autor', 'titulo'], name='libro_autor_titulo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['usuario', '-fecha'], name='pedido_usuario_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['-fecha'], name='pedido_fecha_idx'),
+        ),
+        migrations.RunPython(fusionar_carritos_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='carritoitem',
+            constraint=models.UniqueConstraint(fields=('usuario', 'libro'), name='carrito_usuario_libro_uniq'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_libreria', '0002_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetallePedido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField(default=1)),
+                ('precio_unitario', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('libro', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='app_libreria.libro')),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lineas', to='app_libreria.pedido')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Recomendacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('puntaje', models.FloatField()),
+                ('posicion', models.PositiveSmallIntegerField()),
+                ('libro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recomendaciones', to='app_libreria.libro')),
+                ('recomendado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='app_libreria.libro')),
+            ],
+            options={
+                'ordering': ['libro', 'posicion'],
+                'indexes': [models.Index(fields=['libro', 'posicion'], name='recomendacion_libro_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_libreria', '0003_detalle_pedido_recomendaciones'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsuarioEliminado',
+            fields=[
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='categoria',
+            name='eliminado',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='libro',
+            name='eliminado',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(condition=models.Q(('eliminado', True)), fields=['id'], name='libro_eliminado_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_libreria', '0004_borrado_logico'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventario',
+            name='reservado',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='Reserva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=40)),
+                ('cantidad', models.PositiveIntegerField(default=1)),
+                ('expira', models.DateTimeField()),
+                ('libro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app_libreria.libro')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['expira'], name='reserva_expira_idx')],
+                'constraints': [models.UniqueConstraint(fields=('clave', 'libro'), name='reserva_clave_libro_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_libreria', '0005_reservas_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioCatalogo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('categoria', 'Página de categoría'), ('portada', 'Portada'), ('todo', 'Todo el catálogo')], max_length=10)),
+                ('categoria_id', models.IntegerField(blank=True, null=True)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_libreria', '0006_bitacora_catalogo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PedidoArchivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('direccion', models.TextField()),
+                ('total', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('fecha', models.DateTimeField()),
+                ('usuario', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DetallePedidoArchivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('cantidad', models.PositiveIntegerField(default=1)),
+                ('precio_unitario', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('libro', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app_libreria.libro')),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lineas', to='app_libreria.pedidoarchivado')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pedidoarchivado',
+            index=models.Index(fields=['usuario', '-fecha'], name='archivado_usuario_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedidoarchivado',
+            index=models.Index(fields=['-fecha'], name='archivado_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_libreria', '0007_pedidos_archivados'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventario',
+            name='demanda_diaria',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='inventario',
+            name='pedido_sugerido',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='proveedor',
+            name='dias_entrega',
+            field=models.PositiveIntegerField(default=7),
+        ),
+    ]
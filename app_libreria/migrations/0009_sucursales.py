@@ -0,0 +1,103 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def crear_sucursal_principal(apps, schema_editor):
+    # Todo el stock que ya existía pasa a una sucursal "Principal"
+    Sucursal = apps.get_model('app_libreria', 'Sucursal')
+    ExistenciaSucursal = apps.get_model('app_libreria', 'ExistenciaSucursal')
+    Inventario = apps.get_model('app_libreria', 'Inventario')
+    Reserva = apps.get_model('app_libreria', 'Reserva')
+
+    principal = Sucursal.objects.create(nombre='Principal', prioridad=0)
+    existencias = [
+        ExistenciaSucursal(sucursal=principal, libro_id=libro_id, cantidad=cantidad, reservado=reservado,
+                           stock_minimo=stock_minimo)
+        for libro_id, cantidad, reservado, stock_minimo
+        in Inventario.objects.values_list('libro_id', 'cantidad', 'reservado', 'stock_minimo').iterator()
+    ]
+    ExistenciaSucursal.objects.bulk_create(existencias, batch_size=1000)
+    principal.cantidad = sum(e.cantidad for e in existencias)
+    principal.reservado = sum(e.reservado for e in existencias)
+    principal.save()
+    Reserva.objects.update(sucursal=principal)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_libreria', '0008_plan_reabasto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sucursal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('direccion', models.TextField(blank=True)),
+                ('activa', models.BooleanField(default=True)),
+                ('prioridad', models.PositiveSmallIntegerField(default=0)),
+                ('cantidad', models.PositiveIntegerField(default=0, editable=False)),
+                ('reservado', models.PositiveIntegerField(default=0, editable=False)),
+            ],
+            options={
+                'verbose_name_plural': 'sucursales',
+                'ordering': ['prioridad', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ExistenciaSucursal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField(default=0)),
+                ('reservado', models.PositiveIntegerField(default=0)),
+                ('stock_minimo', models.PositiveIntegerField(default=0)),
+                ('ultima_actualizacion', models.DateTimeField(auto_now=True)),
+                ('libro', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='existencias', to='app_libreria.libro')),
+                ('sucursal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='existencias', to='app_libreria.sucursal')),
+            ],
+            options={
+                'verbose_name_plural': 'existencias por sucursal',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='existenciasucursal',
+            constraint=models.UniqueConstraint(fields=('libro', 'sucursal'), name='existencia_libro_sucursal_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='existenciasucursal',
+            index=models.Index(condition=models.Q(('cantidad__lte', models.F('stock_minimo')), ('stock_minimo__gt', 0)), fields=['sucursal'], name='existencia_bajo_minimo_idx'),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='sucursal',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='app_libreria.sucursal'),
+        ),
+        migrations.AddField(
+            model_name='pedidoarchivado',
+            name='sucursal',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app_libreria.sucursal'),
+        ),
+        migrations.RemoveConstraint(
+            model_name='reserva',
+            name='reserva_clave_libro_uniq',
+        ),
+        migrations.AddField(
+            model_name='reserva',
+            name='sucursal',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='app_libreria.sucursal'),
+        ),
+        migrations.RunPython(crear_sucursal_principal, migrations.RunPython.noop, hints={'model_name': 'sucursal'}),
+        migrations.AlterField(
+            model_name='reserva',
+            name='sucursal',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app_libreria.sucursal'),
+        ),
+        migrations.AddConstraint(
+            model_name='reserva',
+            constraint=models.UniqueConstraint(fields=('clave', 'libro', 'sucursal'), name='reserva_clave_libro_suc_uniq'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def corte_inicial(apps, schema_editor):
+    # La bitácora empieza aquí: un corte con lo que hay hoy en cada sucursal
+    ExistenciaSucursal = apps.get_model('app_libreria', 'ExistenciaSucursal')
+    CorteExistencia = apps.get_model('app_libreria', 'CorteExistencia')
+    ahora = timezone.now()
+    CorteExistencia.objects.bulk_create(
+        (CorteExistencia(libro_id=libro_id, sucursal_id=sucursal_id, cantidad=cantidad, fecha=ahora)
+         for libro_id, sucursal_id, cantidad
+         in ExistenciaSucursal.objects.values_list('libro_id', 'sucursal_id', 'cantidad').iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_libreria', '0009_sucursales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorteExistencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.IntegerField()),
+                ('fecha', models.DateTimeField()),
+                ('libro', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app_libreria.libro')),
+                ('sucursal', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app_libreria.sucursal')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('libro', 'sucursal', 'fecha'), name='corte_libro_sucursal_fecha_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MovimientoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('entrada', 'Entrada de mercancía'), ('venta', 'Venta'), ('ajuste', 'Ajuste / conteo físico')], max_length=10)),
+                ('cantidad', models.IntegerField()),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('libro', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app_libreria.libro')),
+                ('sucursal', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app_libreria.sucursal')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['libro', 'sucursal', 'fecha'], name='movimiento_libro_fecha_idx'), models.Index(fields=['fecha'], name='movimiento_fecha_idx')],
+            },
+        ),
+        migrations.RunPython(corte_inicial, migrations.RunPython.noop, hints={'model_name': 'corteexistencia'}),
+    ]
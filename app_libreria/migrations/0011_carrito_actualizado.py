@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_libreria', '0010_bitacora_movimientos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carritoitem',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='carritoitem',
+            index=models.Index(fields=['actualizado'], name='carrito_actualizado_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_libreria', '0011_carrito_actualizado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibroSimilar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('puntaje', models.FloatField()),
+                ('posicion', models.PositiveSmallIntegerField()),
+                ('libro', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='similares', to='app_libreria.libro')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='app_libreria.libro')),
+            ],
+            options={
+                'ordering': ['libro', 'posicion'],
+                'indexes': [models.Index(fields=['libro', 'posicion'], name='similar_libro_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.contrib import messages
+from django.contrib.auth.mixins import UserPassesTestMixin
+from django.shortcuts import redirect
+
+
+class AdminRequiredMixin(UserPassesTestMixin):
+    """Vistas del panel: solo superusuarios. Sin sesión se va al login de administración."""
+    login_url = 'admin_login'
+
+    def test_func(self):
+        return self.request.user.is_superuser
+
+    def handle_no_permission(self):
+        if self.request.user.is_authenticated:
+            messages.error(self.request, "Acceso denegado. Se requiere ser administrador.")
+            return redirect('dashboard')
+        return super().handle_no_permission()
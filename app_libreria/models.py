@@ -1,13 +1,43 @@
 ﻿from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from datetime import date
 
+# --- BORRADO LÓGICO ---
+
+class ActivosManager(models.Manager):
+    # Oculta lo marcado como eliminado; `todos` ve también lo pendiente de purgar
+    def get_queryset(self):
+        return super().get_queryset().filter(eliminado=False)
+
+# --- ARCHIVO HISTÓRICO (OTRA BASE DE DATOS, VER archivo.py) ---
+
+DB_ARCHIVO = 'archivo'
+
+class ArchivoManager(models.Manager):
+    # Siempre consulta la base de archivo; si no está configurada no hay nada archivado
+    def get_queryset(self):
+        from django.conf import settings
+        queryset = super().get_queryset()
+        if DB_ARCHIVO not in settings.DATABASES:
+            return queryset.none()
+        return queryset.using(DB_ARCHIVO)
+
 # --- MODELOS DE DATOS (CATÁLOGO) ---
 
 class Categoria(models.Model):
     nombre = models.CharField(max_length=100)
     descripcion = models.TextField(blank=True, null=True)
     color = models.CharField(max_length=20, default='#ff85a2') # Para el diseño rosa
+    eliminado = models.BooleanField(default=False) # Se purga después con manage.py purge_deleted
+
+    objects = ActivosManager()
+    todos = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['nombre'], name='categoria_nombre_idx'),
+        ]
 
     def __str__(self):
         return self.nombre
@@ -18,6 +48,8 @@ class Proveedor(models.Model):
     telefono = models.CharField(max_length=20)
     email = models.EmailField()
     direccion = models.TextField()
+    # Días entre hacer el pedido y tener los libros; lo usa manage.py plan_reorders
+    dias_entrega = models.PositiveIntegerField(default=7)
 
     def __str__(self):
         return self.nombre
@@ -38,25 +70,140 @@ class Libro(models.Model):
     
     # Mantenemos imagen_url con un default para que se vea bonito
     imagen_url = models.URLField(default="https://via.placeholder.com/300x400/ffb7b2/000000?text=Libro") 
+    eliminado = models.BooleanField(default=False) # Se purga después con manage.py purge_deleted
+
+    objects = ActivosManager()
+    todos = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['isbn'], name='libro_isbn_idx'),
+            models.Index(fields=['titulo'], name='libro_titulo_idx'),
+            models.Index(fields=['autor', 'titulo'], name='libro_autor_titulo_idx'),
+            # Solo los pendientes de purga (pocos): purge_deleted los recorre y el admin los resta de su estimación
+            models.Index(fields=['id'], condition=models.Q(eliminado=True), name='libro_eliminado_idx'),
+        ]
 
     def __str__(self):
         return self.titulo
 
 class Inventario(models.Model):
+    # Totales del libro en todas las sucursales (ver sucursales.py); se mantienen con UPDATE ... F()
     libro = models.OneToOneField(Libro, on_delete=models.CASCADE)
     cantidad = models.PositiveIntegerField()
-    stock_minimo = models.PositiveIntegerField(default=5)
+    # Unidades apartadas en carritos (suma de Reserva.cantidad)
+    reservado = models.PositiveIntegerField(default=0)
+    stock_minimo = models.PositiveIntegerField(default=5)  # Punto de reorden (plan_reorders lo recalcula)
+    demanda_diaria = models.FloatField(default=0)  # Pronóstico de plan_reorders
+    pedido_sugerido = models.PositiveIntegerField(default=0)
     ultima_actualizacion = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Stock de {self.libro.titulo}"
 
+    @property
+    def disponible(self):
+        return max(self.cantidad - self.reservado, 0)
+
+class Sucursal(models.Model):
+    nombre = models.CharField(max_length=100)
+    direccion = models.TextField(blank=True)
+    activa = models.BooleanField(default=True)
+    prioridad = models.PositiveSmallIntegerField(default=0)  # Menor = se surte primero de aquí
+    # Totales de sus existencias, mantenidos por sucursales.py (los reportes no suman filas)
+    cantidad = models.PositiveIntegerField(default=0, editable=False)
+    reservado = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        ordering = ['prioridad', 'id']
+        verbose_name_plural = 'sucursales'
+
+    def __str__(self):
+        return self.nombre
+
+    @property
+    def disponible(self):
+        return max(self.cantidad - self.reservado, 0)
+
+class ExistenciaSucursal(models.Model):
+    # Stock de un libro en una sucursal; solo se modifica con las funciones de sucursales.py
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, related_name='existencias')
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='existencias', db_index=False)
+    cantidad = models.PositiveIntegerField(default=0)
+    reservado = models.PositiveIntegerField(default=0)
+    stock_minimo = models.PositiveIntegerField(default=0)  # 0 = sin mínimo en esta sucursal
+    ultima_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # (libro, sucursal): el índice con el que se elige qué sucursal surte un carrito
+            # (también cubre las búsquedas por libro, por eso la FK no lleva índice propio)
+            models.UniqueConstraint(fields=['libro', 'sucursal'], name='existencia_libro_sucursal_uniq'),
+        ]
+        indexes = [
+            # Solo las filas en o bajo su mínimo: el reporte de stock bajo por sucursal no recorre la tabla
+            models.Index(fields=['sucursal'], condition=models.Q(stock_minimo__gt=0, cantidad__lte=models.F('stock_minimo')),
+                         name='existencia_bajo_minimo_idx'),
+        ]
+        verbose_name_plural = 'existencias por sucursal'
+
+    def __str__(self):
+        return f"{self.libro} en {self.sucursal}"
+
+    @property
+    def disponible(self):
+        return max(self.cantidad - self.reservado, 0)
+
+# --- BITÁCORA DE MOVIMIENTOS DE STOCK (VER movimientos.py) ---
+# Solo se insertan filas. Las FK no llevan restricción, cascada ni índice
+# propio (los cubren los índices compuestos): borrar un libro o una sucursal
+# no recorre la bitácora (purge_deleted la limpia).
+
+class MovimientoStock(models.Model):
+    TIPOS = [('entrada', 'Entrada de mercancía'), ('venta', 'Venta'), ('ajuste', 'Ajuste / conteo físico')]
+    libro = models.ForeignKey(Libro, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+')
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+')
+    tipo = models.CharField(max_length=10, choices=TIPOS)
+    cantidad = models.IntegerField()  # Con signo: positivo entra, negativo sale
+    fecha = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Existencia a una fecha: último corte + movimientos posteriores
+            models.Index(fields=['libro', 'sucursal', 'fecha'], name='movimiento_libro_fecha_idx'),
+            # Compactación: todo lo anterior a una fecha
+            models.Index(fields=['fecha'], name='movimiento_fecha_idx'),
+        ]
+
+class CorteExistencia(models.Model):
+    # Cantidad de una existencia en `fecha`; lo genera compact_stock_ledger
+    libro = models.ForeignKey(Libro, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+')
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+')
+    cantidad = models.IntegerField()
+    fecha = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['libro', 'sucursal', 'fecha'], name='corte_libro_sucursal_fecha_uniq'),
+        ]
+
 # --- MODELOS DE CARRITO Y VENTAS (FUNCIONALIDAD) ---
 
 class CarritoItem(models.Model):
     usuario = models.ForeignKey(User, on_delete=models.CASCADE)
     libro = models.ForeignKey(Libro, on_delete=models.CASCADE)
     cantidad = models.PositiveIntegerField(default=1)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # Un renglón por libro en el carrito; también sirve de índice para get_or_create
+            models.UniqueConstraint(fields=['usuario', 'libro'], name='carrito_usuario_libro_uniq'),
+        ]
+        indexes = [
+            # housekeeping busca los carritos abandonados por fecha
+            models.Index(fields=['actualizado'], name='carrito_actualizado_idx'),
+        ]
 
     def subtotal(self):
         return self.libro.precio * self.cantidad
@@ -65,4 +212,115 @@ class Pedido(models.Model):
     usuario = models.ForeignKey(User, on_delete=models.CASCADE)
     direccion = models.TextField()
     total = models.DecimalField(max_digits=10, decimal_places=2)
-    fecha = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    fecha = models.DateTimeField(auto_now_add=True)
+    # Sucursal que surtió todo el pedido; vacío si se surtió de varias o sin control de stock
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Historial por usuario (ListaUsuariosView) y listados por fecha
+            models.Index(fields=['usuario', '-fecha'], name='pedido_usuario_fecha_idx'),
+            models.Index(fields=['-fecha'], name='pedido_fecha_idx'),
+        ]
+
+class DetallePedido(models.Model):
+    # Renglones del pedido; el libro puede borrarse sin perder el historial de ventas
+    pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name='lineas')
+    libro = models.ForeignKey(Libro, on_delete=models.SET_NULL, null=True)
+    cantidad = models.PositiveIntegerField(default=1)
+    precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def subtotal(self):
+        return self.precio_unitario * self.cantidad
+
+class Reserva(models.Model):
+    # Stock apartado al meter un libro al carrito; caduca si no se paga a tiempo.
+    # clave = 'u:<id usuario>' (carrito en base) o 'c:<token>' (carrito ligero)
+    clave = models.CharField(max_length=40)
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE)
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE)
+    cantidad = models.PositiveIntegerField(default=1)
+    expira = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['clave', 'libro', 'sucursal'], name='reserva_clave_libro_suc_uniq'),
+        ]
+        indexes = [
+            # El reaper recorre las caducadas en orden
+            models.Index(fields=['expira'], name='reserva_expira_idx'),
+        ]
+
+class UsuarioEliminado(models.Model):
+    # Usuarios dados de baja desde el panel (quedan inactivos hasta la purga)
+    usuario = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    fecha = models.DateTimeField(auto_now_add=True)
+
+# --- PEDIDOS ARCHIVADOS (VIVEN EN LA BASE 'archivo') ---
+# Mismas columnas que Pedido/DetallePedido para copiarlos con INSERT ... SELECT.
+# Las FK hacia la base principal no llevan restricción (SQLite no puede
+# validarlas entre archivos) y DO_NOTHING evita que borrar un usuario o libro
+# intente recorrer la base de archivo.
+
+class PedidoArchivado(models.Model):
+    id = models.BigIntegerField(primary_key=True)  # Conserva el id original
+    usuario = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    direccion = models.TextField()
+    total = models.DecimalField(max_digits=10, decimal_places=2)
+    fecha = models.DateTimeField()
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+
+    objects = ArchivoManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['usuario', '-fecha'], name='archivado_usuario_fecha_idx'),
+            models.Index(fields=['-fecha'], name='archivado_fecha_idx'),
+        ]
+
+class DetallePedidoArchivado(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    pedido = models.ForeignKey(PedidoArchivado, on_delete=models.CASCADE, related_name='lineas')
+    libro = models.ForeignKey(Libro, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    cantidad = models.PositiveIntegerField(default=1)
+    precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
+
+    objects = ArchivoManager()
+
+    def subtotal(self):
+        return self.precio_unitario * self.cantidad
+
+# --- MODELOS DERIVADOS (SE CALCULAN POR LOTES) ---
+
+class CambioCatalogo(models.Model):
+    # Bitácora de páginas públicas por regenerar (la consume prerender_catalog)
+    TIPOS = [('categoria', 'Página de categoría'), ('portada', 'Portada'), ('todo', 'Todo el catálogo')]
+    tipo = models.CharField(max_length=10, choices=TIPOS)
+    categoria_id = models.IntegerField(null=True, blank=True)  # Sin FK: la categoría puede ya no existir
+    fecha = models.DateTimeField(auto_now_add=True)
+
+class Recomendacion(models.Model):
+    # "Quienes compraron esto también compraron...": top-K vecinos por libro
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='recomendaciones')
+    recomendado = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='+')
+    puntaje = models.FloatField()
+    posicion = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['libro', 'posicion']
+        indexes = [
+            models.Index(fields=['libro', 'posicion'], name='recomendacion_libro_idx'),
+        ]
+
+class LibroSimilar(models.Model):
+    # "Libros parecidos" por contenido (TF-IDF de título, autor, categoría y descripción); lo calcula manage.py similares
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='similares', db_index=False)
+    similar = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='+')
+    puntaje = models.FloatField()
+    posicion = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['libro', 'posicion']
+        indexes = [
+            models.Index(fields=['libro', 'posicion'], name='similar_libro_idx'),
+        ]
@@ -0,0 +1,141 @@
+import time
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+
+from .models import CorteExistencia, ExistenciaSucursal, MovimientoStock
+
+# =======================================================
+# BITÁCORA DE MOVIMIENTOS DE STOCK
+# =======================================================
+# Cada entrada, venta o ajuste de una ExistenciaSucursal deja una fila en
+# MovimientoStock con el delta firmado; nunca se actualizan ni se borran
+# filas sueltas. Las funciones de sucursales.py anotan en una Bitacora que
+# junta los movimientos de la operación (todas las líneas de un pedido, un
+# lote de altas) y los inserta con un solo bulk_create dentro de la misma
+# transacción: si el pedido se deshace, sus movimientos tampoco existieron.
+#
+# compact_stock_ledger corta periódicamente: guarda en CorteExistencia la
+# cantidad de cada existencia a una fecha y borra los movimientos
+# anteriores. La existencia en cualquier momento es el último corte previo
+# más los movimientos entre el corte y ese momento, sin repasar toda la
+# historia. Antes del último corte la resolución es la de los cortes.
+#
+# La cantidad vigente sigue en ExistenciaSucursal: el UPDATE condicional que
+# evita vender de más necesita el valor al día, no un corte.
+
+
+class Bitacora:
+    """Junta movimientos y los inserta con bulk_create al salir del bloque (o cada `lote`)."""
+
+    def __init__(self, lote=1000):
+        self.lote = lote
+        self.pendientes = []
+
+    def anotar(self, sucursal_id, libro_id, tipo, cantidad, fecha=None):
+        if not cantidad:
+            return
+        self.pendientes.append(MovimientoStock(
+            sucursal_id=sucursal_id, libro_id=libro_id, tipo=tipo, cantidad=cantidad, fecha=fecha or timezone.now(),
+        ))
+        if len(self.pendientes) >= self.lote:
+            self.volcar()
+
+    def volcar(self):
+        if self.pendientes:
+            MovimientoStock.objects.bulk_create(self.pendientes)
+            self.pendientes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        # Con una excepción la transacción se va a deshacer: no hay nada que guardar
+        if tipo is None:
+            self.volcar()
+
+
+# --- Existencia a una fecha ---
+
+def existencias_en(fecha, libro_ids=None):
+    """{(libro_id, sucursal_id): cantidad} en `fecha`: último corte + movimientos posteriores."""
+    cortes = CorteExistencia.objects.filter(fecha__lte=fecha)
+    movimientos = MovimientoStock.objects.filter(fecha__lte=fecha)
+    if libro_ids is not None:
+        cortes = cortes.filter(libro_id__in=libro_ids)
+        movimientos = movimientos.filter(libro_id__in=libro_ids)
+
+    ultimo_corte = (
+        CorteExistencia.objects
+        .filter(libro_id=OuterRef('libro_id'), sucursal_id=OuterRef('sucursal_id'), fecha__lte=fecha)
+        .order_by('-fecha').values('fecha')[:1]
+    )
+    existencias = {
+        (libro_id, sucursal_id): cantidad
+        for libro_id, sucursal_id, cantidad in
+        cortes.filter(fecha=Subquery(ultimo_corte)).values_list('libro_id', 'sucursal_id', 'cantidad')
+    }
+    posteriores = (
+        movimientos.annotate(corte=Subquery(ultimo_corte))
+        .filter(Q(corte__isnull=True) | Q(fecha__gt=F('corte')))
+        .values('libro_id', 'sucursal_id').annotate(delta=Sum('cantidad'))
+    )
+    for fila in posteriores:
+        clave = fila['libro_id'], fila['sucursal_id']
+        existencias[clave] = existencias.get(clave, 0) + fila['delta']
+    return existencias
+
+
+def existencia_en(libro_id, fecha, sucursal_id=None):
+    """Unidades del libro en `fecha`, en una sucursal o en todas."""
+    return sum(
+        cantidad for (_, sucursal), cantidad in existencias_en(fecha, [libro_id]).items()
+        if sucursal_id is None or sucursal == sucursal_id
+    )
+
+
+def diferencias(libro_ids=None):
+    """Existencias cuya cantidad no cuadra con la bitácora: {(libro, sucursal): (bitácora, tabla)}."""
+    segun_bitacora = existencias_en(timezone.now(), libro_ids)
+    actuales = ExistenciaSucursal.objects.all()
+    if libro_ids is not None:
+        actuales = actuales.filter(libro_id__in=libro_ids)
+    distintas = {}
+    for libro_id, sucursal_id, cantidad in actuales.values_list('libro_id', 'sucursal_id', 'cantidad').iterator():
+        esperada = segun_bitacora.pop((libro_id, sucursal_id), 0)
+        if esperada != cantidad:
+            distintas[libro_id, sucursal_id] = (esperada, cantidad)
+    # En la bitácora pero ya sin existencia (se borró sin dejar su ajuste)
+    distintas.update({clave: (cantidad, 0) for clave, cantidad in segun_bitacora.items() if cantidad})
+    return distintas
+
+
+# --- Compactación ---
+
+def compactar(hasta, lote=5000, pausa=0.0):
+    """Corta en `hasta` las existencias con movimientos previos y borra esos movimientos.
+
+    Regresa (cortes creados, movimientos borrados). Los cortes se escriben en
+    una transacción; el borrado va por lotes después. Si se interrumpe a
+    medias no pasa nada: lo anterior a un corte ya no se suma y la siguiente
+    pasada termina de borrarlo.
+    """
+    viejos = MovimientoStock.objects.filter(fecha__lte=hasta)
+    pares = set(viejos.values_list('libro_id', 'sucursal_id').distinct())
+    with transaction.atomic():
+        cantidades = existencias_en(hasta)
+        cortes = [
+            CorteExistencia(libro_id=libro_id, sucursal_id=sucursal_id, cantidad=cantidades.get((libro_id, sucursal_id), 0), fecha=hasta)
+            for libro_id, sucursal_id in pares
+        ]
+        CorteExistencia.objects.bulk_create(cortes, batch_size=1000, ignore_conflicts=True)
+
+    borrados = 0
+    while True:
+        ids = list(viejos.order_by('fecha').values_list('id', flat=True)[:lote])
+        if not ids:
+            break
+        borrados += MovimientoStock.objects.filter(id__in=ids).delete()[0]
+        time.sleep(pausa)
+    return len(cortes), borrados
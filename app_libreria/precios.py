@@ -0,0 +1,84 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum, Count, Value
+from django.db.models.functions import Ceil, Greatest, Least, Round
+
+from .models import Libro
+from .catalogo import invalidar_catalogo
+from .prerender import registrar_cambios
+
+# =======================================================
+# REPRECIO MASIVO DE LIBROS
+# =======================================================
+# El nuevo precio se arma como una expresión SQL: la vista previa la usa en
+# un annotate() y la aplicación en un solo UPDATE, así ambas coinciden y no
+# se carga ningún Libro en Python.
+
+PRECIO_MINIMO = Decimal('0.01')
+
+REDONDEOS = [
+    ('centavos', 'Al centavo (2 decimales)'),
+    ('entero', 'Al peso entero'),
+    ('99', 'Terminación .99'),
+    ('90', 'Terminación .90'),
+]
+
+
+def _decimal(expr):
+    return ExpressionWrapper(expr, output_field=DecimalField(max_digits=10, decimal_places=2))
+
+
+def expresion_precio(tipo, valor, redondeo='centavos', minimo=None, maximo=None):
+    """Expresión del nuevo precio a partir de F('precio')."""
+    valor = Decimal(valor)
+    if tipo == 'porcentaje':
+        precio = _decimal(F('precio') * Value(1 + valor / 100))
+    else:
+        precio = _decimal(F('precio') + Value(valor))
+
+    if redondeo == 'entero':
+        precio = Round(precio)
+    elif redondeo in ('99', '90'):
+        # Sube al siguiente peso y resta los centavos: 123.40 -> 123.99 / 123.90. El centavo de más
+        # hace que un precio ya entero también suba: 123.00 -> 123.99 y no 122.99
+        precio = _decimal(Ceil(precio + Value(PRECIO_MINIMO)) - Value(Decimal('1.00') - Decimal(redondeo) / 100))
+    else:
+        precio = Round(precio, 2)
+
+    minimo = max(Decimal(minimo), PRECIO_MINIMO) if minimo is not None else PRECIO_MINIMO
+    precio = Greatest(precio, Value(minimo))
+    if maximo is not None:
+        # Nunca por debajo del mínimo: un máximo de 0 dejaría libros gratis
+        precio = Least(precio, Value(max(Decimal(maximo), minimo)))
+    # El último Round evita arrastrar residuos de punto flotante (SQLite)
+    return _decimal(Round(precio, 2))
+
+
+def libros_filtrados(categoria=None, proveedor=None, autor=None):
+    queryset = Libro.objects.all()
+    if categoria is not None:
+        queryset = queryset.filter(categoria=categoria)
+    if proveedor is not None:
+        queryset = queryset.filter(proveedor=proveedor)
+    if autor:
+        queryset = queryset.filter(autor=autor)
+    return queryset
+
+
+def previsualizar(queryset, expresion, muestra=50):
+    """Resumen y muestra del cambio sin escribir nada."""
+    anotado = queryset.annotate(nuevo_precio=expresion)
+    resumen = anotado.aggregate(libros=Count('id'), total_actual=Sum('precio'), total_nuevo=Sum('nuevo_precio'))
+    filas = anotado.order_by('id').values('id', 'titulo', 'autor', 'precio', 'nuevo_precio')[:muestra]
+    return resumen, list(filas)
+
+
+def aplicar(queryset, expresion):
+    """Actualiza todos los precios con un UPDATE dentro de una transacción."""
+    with transaction.atomic():
+        actualizados = queryset.update(precio=expresion)
+        # update() no dispara señales: avisamos al catálogo en memoria y a las páginas estáticas a mano
+        registrar_cambios(queryset.order_by().values_list('categoria_id', flat=True).distinct())
+        transaction.on_commit(invalidar_catalogo)
+    return actualizados
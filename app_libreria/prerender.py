@@ -0,0 +1,138 @@
+import os
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpRequest
+from django.template.loader import render_to_string
+
+from .models import CambioCatalogo
+from .catalogo import obtener_catalogo
+from .compresion import minificar_html
+
+# =======================================================
+# PÁGINAS PÚBLICAS PRE-RENDERIZADAS
+# =======================================================
+# La portada y las páginas de categoría son iguales para todos los
+# visitantes: prerender_catalog las escribe como HTML en PRERENDER_DIR con la
+# misma estructura que las URLs (categoria/3/index.html) para que nginx o
+# PrerenderMiddleware las sirvan sin pasar por las vistas.
+#
+# Lo personal (badge del carrito, usuario, enlaces de admin) lo completa
+# main.js con la cookie COOKIE_ESTADO, que mantienen las vistas que lo cambian.
+
+COOKIE_ESTADO = 'tienda'
+NOMBRES_PORTADA = ['Poesía', 'Novela', 'Historia']
+RUTAS_PRERENDER = re.compile(r'^/(?:|dashboard/|categoria/\d+/)$')
+
+
+def directorio():
+    valor = getattr(settings, 'PRERENDER_DIR', None)
+    return Path(valor) if valor else None
+
+
+def archivo_de(path):
+    """Archivo estático que corresponde a la URL, o None si no se pre-renderiza."""
+    base = directorio()
+    if base is None or not RUTAS_PRERENDER.match(path):
+        return None
+    return base / path.strip('/') / 'index.html'
+
+
+def activo():
+    """Hay páginas que mantener al día: PRERENDER_DIR configurado y prerender_catalog ya generó la portada."""
+    base = directorio()
+    return base is not None and (base / 'index.html').exists()
+
+
+# --- Bitácora de cambios ---
+# Sin páginas generadas no se anota nada: la primera corrida de
+# prerender_catalog es completa de todos modos.
+
+def registrar_cambios(categoria_ids=(), portada=False, todo=False):
+    if not activo():
+        return
+    cambios = [CambioCatalogo(tipo='categoria', categoria_id=c) for c in set(categoria_ids) if c is not None]
+    if portada:
+        cambios.append(CambioCatalogo(tipo='portada'))
+    if todo:
+        cambios.append(CambioCatalogo(tipo='todo'))
+    CambioCatalogo.objects.bulk_create(cambios)
+
+
+# --- Render ---
+
+def _request(path):
+    request = HttpRequest()
+    request.method = 'GET'
+    request.path = request.path_info = path
+    request.META = {'SERVER_NAME': 'localhost', 'SERVER_PORT': '80'}
+    request.user = AnonymousUser()
+    return request
+
+
+def _escribir(path, html):
+    if getattr(settings, 'MINIFICAR_HTML', False):
+        html = minificar_html(html)
+    destino = archivo_de(path)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    temporal = destino.with_suffix(f'.{os.getpid()}.tmp')
+    temporal.write_text(html, encoding='utf-8')
+    os.replace(temporal, destino)  # Nunca se sirve un archivo a medio escribir
+
+
+def render_portada():
+    categorias = obtener_catalogo().categorias_con_nombre(NOMBRES_PORTADA)
+    for path in ('/', '/dashboard/'):
+        html = render_to_string('libreria/dashboard.html', {
+            'categorias': categorias, 'carrito_count': 0, 'prerender': True,
+        }, request=_request(path))
+        _escribir(path, html)
+
+
+def render_categoria(categoria_id):
+    """Regresa False si la categoría ya no existe (y borra su página)."""
+    catalogo = obtener_catalogo()
+    path = f'/categoria/{categoria_id}/'
+    categoria = catalogo.categoria(categoria_id)
+    if categoria is None:
+        archivo_de(path).unlink(missing_ok=True)
+        return False
+    html = render_to_string('libreria/libros.html', {
+        'categoria': categoria, 'libros': catalogo.libros_de_categoria(categoria_id),
+        'carrito_count': 0, 'prerender': True,
+    }, request=_request(path))
+    _escribir(path, html)
+    return True
+
+
+def borrar_huerfanas(categoria_ids):
+    """Borra las páginas de categorías que ya no están en `categoria_ids`; regresa cuántas."""
+    vigentes = {str(c) for c in categoria_ids}
+    borradas = 0
+    for archivo in (directorio() / 'categoria').glob('*/index.html'):
+        if archivo.parent.name not in vigentes:
+            archivo.unlink(missing_ok=True)
+            try:
+                archivo.parent.rmdir()
+            except OSError:  # Quedó otro archivo (p. ej. un .tmp de otra corrida)
+                pass
+            borradas += 1
+    return borradas
+
+
+# --- Cookie con el estado del visitante para las páginas estáticas ---
+
+def guardar_estado_cliente(response, usuario, carrito_count):
+    """Cookie legible desde JS: 'libros_en_carrito:es_admin:usuario'."""
+    if usuario.is_authenticated:
+        valor = f'{carrito_count}:{int(usuario.is_superuser)}:{quote(usuario.get_username(), safe="")}'
+    else:
+        valor = f'{carrito_count}:0:'
+    response.set_cookie(COOKIE_ESTADO, valor, max_age=settings.SESSION_COOKIE_AGE, samesite='Lax')
+
+
+def borrar_estado_cliente(response):
+    response.delete_cookie(COOKIE_ESTADO, samesite='Lax')
@@ -0,0 +1,59 @@
+from .models import LibroSimilar, Recomendacion
+from .catalogo import obtener_catalogo
+
+# =======================================================
+# "QUIENES COMPRARON ESTO TAMBIÉN COMPRARON..."
+# =======================================================
+# Los vecinos se precalculan con `manage.py recomendaciones`; aquí solo se
+# leen con una consulta indexada por libro y se resuelven contra el catálogo
+# en memoria.
+#
+# Los libros sin ventas no tienen vecinos de compra; para ellos están los
+# parecidos por contenido (TF-IDF, `manage.py similares`), que se leen igual.
+
+
+def _sugeridos(filas, libro_ids, limite):
+    """[(libro_id, puntaje), ...] -> libros del catálogo por puntaje acumulado, sin repetir los de entrada."""
+    puntajes = {}
+    for sugerido_id, puntaje in filas:
+        if sugerido_id not in libro_ids:
+            puntajes[sugerido_id] = puntajes.get(sugerido_id, 0) + puntaje
+
+    catalogo = obtener_catalogo()
+    sugeridos = []
+    for libro_id in sorted(puntajes, key=puntajes.get, reverse=True):
+        libro = catalogo.libro(libro_id)
+        if libro is not None:
+            sugeridos.append(libro)
+            if len(sugeridos) == limite:
+                break
+    return sugeridos
+
+
+def tambien_compraron(libro_ids, limite=4):
+    """Libros sugeridos para un conjunto (p. ej. el carrito), sin repetir los de entrada."""
+    libro_ids = set(libro_ids)
+    if not libro_ids:
+        return []
+    filas = Recomendacion.objects.filter(libro_id__in=libro_ids).values_list('recomendado_id', 'puntaje')
+    return _sugeridos(filas, libro_ids, limite)
+
+
+def parecidos(libro_ids, limite=4):
+    """Libros parecidos por contenido a un conjunto, sin repetir los de entrada."""
+    libro_ids = set(libro_ids)
+    if not libro_ids:
+        return []
+    filas = LibroSimilar.objects.filter(libro_id__in=libro_ids).values_list('similar_id', 'puntaje')
+    return _sugeridos(filas, libro_ids, limite)
+
+
+def sugerencias_carrito(libro_ids, limite=4):
+    """Primero lo que se compra junto; si no alcanza (libros sin ventas), se completa con parecidos."""
+    libro_ids = set(libro_ids)
+    sugeridos = tambien_compraron(libro_ids, limite)
+    faltan = limite - len(sugeridos)
+    if faltan:
+        ya = {libro.id for libro in sugeridos}
+        sugeridos += [libro for libro in parecidos(libro_ids, limite) if libro.id not in ya][:faltan]
+    return sugeridos
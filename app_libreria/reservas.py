@@ -0,0 +1,174 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Subquery, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Reserva
+from .eventos import avisar_cambios
+from .movimientos import Bitacora
+from .sucursales import apartar, soltar, sacar, sacar_por_partes, sucursales_para, con_existencias
+
+# =======================================================
+# RESERVAS DE STOCK AL AGREGAR AL CARRITO
+# =======================================================
+# Al meter un libro al carrito se aparta en una sucursal con un UPDATE
+# condicional sobre ExistenciaSucursal.reservado (cantidad >= reservado + n);
+# sucursales.py lleva el delta a los totales del libro y de la sucursal, así
+# la disponibilidad (cantidad - reservado) siempre está a una fila de
+# distancia. Las reservas de un carrito se juntan en la misma sucursal
+# mientras se pueda. Cada reserva caduca a los RESERVA_MINUTOS; el comando
+# expire_reservations las libera por lotes. Al pagar se elige una sucursal
+# que surta todo el pedido y las reservas se convierten en salida de ella.
+#
+# Los libros sin registro de Inventario no llevan control de existencias.
+
+
+class SinExistencias(Exception):
+    def __init__(self, libro_ids):
+        super().__init__(f'Sin existencias para los libros {libro_ids}')
+        self.libro_ids = libro_ids
+
+
+def minutos_reserva():
+    return getattr(settings, 'RESERVA_MINUTOS', 15)
+
+
+def clave_usuario(usuario_id):
+    return f'u:{usuario_id}'
+
+
+def clave_carrito(token):
+    return f'c:{token}'
+
+
+def _apartar(clave, libro_id, cantidad):
+    """Sucursal donde se apartó, False si ninguna alcanza, None si el libro no tiene inventario."""
+    # Preferimos la sucursal donde el carrito ya tiene este libro o, si no, cualquier otro
+    preferida = Subquery(
+        Reserva.objects.filter(clave=clave)
+        .order_by(Case(When(libro_id=libro_id, then=Value(0)), default=Value(1)))
+        .values('sucursal_id')[:1]
+    )
+    for sucursal_id in sucursales_para({libro_id: cantidad}, preferida):
+        if apartar(sucursal_id, libro_id, cantidad):
+            return sucursal_id
+    if not con_existencias([libro_id]):
+        return None
+    return False
+
+
+def _por_sucursal(filas):
+    """[(sucursal_id, libro_id, cantidad), ...] -> {(sucursal_id, libro_id): total}"""
+    totales = {}
+    for sucursal_id, libro_id, cantidad in filas:
+        totales[sucursal_id, libro_id] = totales.get((sucursal_id, libro_id), 0) + cantidad
+    return totales
+
+
+def reservar(clave, libro_id, cantidad=1):
+    """Aparta `cantidad` ejemplares para el carrito `clave`; False si ya no hay."""
+    with transaction.atomic():
+        sucursal_id = _apartar(clave, libro_id, cantidad)
+        if sucursal_id is None:
+            return True
+        if not sucursal_id:
+            return False
+        # Cada libro agregado renueva el plazo de su reserva
+        expira = timezone.now() + timedelta(minutes=minutos_reserva())
+        if not Reserva.objects.filter(clave=clave, libro_id=libro_id, sucursal_id=sucursal_id).update(
+                cantidad=F('cantidad') + cantidad, expira=expira):
+            Reserva.objects.create(clave=clave, libro_id=libro_id, sucursal_id=sucursal_id,
+                                   cantidad=cantidad, expira=expira)
+        avisar_cambios([libro_id])
+    return True
+
+
+def transferir(clave_origen, clave_destino):
+    """Pasa las reservas del carrito anónimo al del usuario al iniciar sesión."""
+    with transaction.atomic():
+        for reserva in Reserva.objects.select_for_update().filter(clave=clave_origen):
+            if not Reserva.objects.filter(clave=clave_destino, libro_id=reserva.libro_id, sucursal_id=reserva.sucursal_id).update(
+                    cantidad=F('cantidad') + reserva.cantidad, expira=Greatest(F('expira'), Value(reserva.expira))):
+                Reserva.objects.create(clave=clave_destino, libro_id=reserva.libro_id, sucursal_id=reserva.sucursal_id,
+                                       cantidad=reserva.cantidad, expira=reserva.expira)
+            reserva.delete()
+
+
+def confirmar(claves, cantidades):
+    """Convierte en venta las reservas de `claves` para {libro_id: cantidad}.
+
+    Debe llamarse dentro de la transacción del pedido: si algún libro ya no
+    alcanza lanza SinExistencias y la transacción completa se deshace.
+    Regresa la sucursal que surte todo el pedido, o None si hubo que
+    juntarlo de varias (o ningún libro lleva control de stock).
+    """
+    reservado = _por_sucursal(
+        Reserva.objects.select_for_update().filter(clave__in=claves).values_list('sucursal_id', 'libro_id', 'cantidad')
+    )
+    # Lo apartado se suelta dentro de la misma transacción: vuelve a estar
+    # disponible solo para este pedido hasta el commit
+    unidades = {}
+    for (sucursal_id, libro_id), cantidad in reservado.items():
+        soltar(sucursal_id, libro_id, cantidad)
+        unidades[sucursal_id] = unidades.get(sucursal_id, 0) + cantidad
+    Reserva.objects.filter(clave__in=claves).delete()
+
+    controladas = con_existencias(cantidades)
+    pedido = {libro_id: cantidad for libro_id, cantidad in cantidades.items() if libro_id in controladas}
+    # De preferencia, la sucursal donde estaba apartado casi todo
+    preferida = max(unidades, key=unidades.get) if unidades else None
+    candidatas = sucursales_para(pedido, preferida)
+
+    sucursal_id = None
+    # Las ventas de todas las líneas van a la bitácora en un solo INSERT
+    with Bitacora() as bitacora:
+        if candidatas:
+            sucursal_id = candidatas[0]
+            agotados = [libro_id for libro_id, cantidad in pedido.items()
+                        if not sacar(sucursal_id, libro_id, cantidad, bitacora)]
+        else:
+            # Ninguna sucursal tiene todo: cada libro se junta de las que tengan
+            agotados = [libro_id for libro_id, cantidad in pedido.items()
+                        if not sacar_por_partes(libro_id, cantidad, bitacora)]
+
+    if agotados:
+        raise SinExistencias(agotados)
+    avisar_cambios(cantidades.keys() | {libro_id for _, libro_id in reservado})
+    return sucursal_id
+
+
+def liberar(claves, ids=None):
+    """Suelta las reservas de `claves` (solo las de `ids`, si se dan); regresa cuántas había."""
+    reservas = Reserva.objects.filter(clave__in=claves)
+    if ids is not None:
+        reservas = reservas.filter(id__in=ids)
+    with transaction.atomic():
+        por_libro = _por_sucursal(
+            reservas.select_for_update().values_list('sucursal_id', 'libro_id', 'cantidad')
+        )
+        for (sucursal_id, libro_id), cantidad in por_libro.items():
+            soltar(sucursal_id, libro_id, cantidad)
+        avisar_cambios({libro_id for _, libro_id in por_libro})
+        return reservas.delete()[0]
+
+
+def expirar(lote=500, ahora=None):
+    """Libera hasta `lote` reservas caducadas; regresa cuántas liberó."""
+    ahora = ahora or timezone.now()
+    with transaction.atomic():
+        filas = list(
+            Reserva.objects.select_for_update(skip_locked=True)
+            .filter(expira__lt=ahora).order_by('expira')
+            .values_list('id', 'sucursal_id', 'libro_id', 'cantidad')[:lote]
+        )
+        if not filas:
+            return 0
+        Reserva.objects.filter(id__in=[f[0] for f in filas]).delete()
+        por_libro = _por_sucursal(f[1:] for f in filas)
+        for (sucursal_id, libro_id), cantidad in por_libro.items():
+            soltar(sucursal_id, libro_id, cantidad)
+        avisar_cambios({libro_id for _, libro_id in por_libro})
+    return len(filas)
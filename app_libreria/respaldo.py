@@ -0,0 +1,204 @@
+import gzip
+import lzma
+import os
+import shutil
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+
+# =======================================================
+# RESPALDOS EN CALIENTE DE LA BASE SQLITE
+# =======================================================
+# Copiar db.sqlite3 con cp mientras la tienda escribe puede dejar un archivo
+# roto. La API de backup de SQLite copia páginas de forma consistente: en
+# cada paso toma un candado de lectura por unas cuantas páginas y lo suelta,
+# así que entre pasos los checkouts siguen escribiendo.
+#
+# Si otra conexión escribe a mitad de la copia, SQLite la reinicia desde el
+# principio. Tras MAX_REINICIOS se hace una última pasada de un solo paso
+# (candado de lectura durante toda la copia) para garantizar que termina.
+
+PREFIJO = 'db-'
+COMPRESIONES = {'gz': gzip.open, 'xz': lzma.open, 'ninguna': open}
+EXTENSIONES = {'gz': '.sqlite3.gz', 'xz': '.sqlite3.xz', 'ninguna': '.sqlite3'}
+MAX_REINICIOS = 5
+
+
+class ErrorRespaldo(Exception):
+    pass
+
+
+class _Reiniciada(Exception):
+    pass
+
+
+@dataclass
+class Copia:
+    paginas: int = 0
+    tam_pagina: int = 0
+    pasos: int = 0
+    reinicios: int = 0
+    un_paso: bool = False
+    segundos: float = 0.0
+    segundos_pausa: float = 0.0
+
+    @property
+    def bytes(self):
+        return self.paginas * self.tam_pagina
+
+    @property
+    def mb_por_segundo(self):
+        # Solo el tiempo copiando; las pausas son deliberadas
+        activo = self.segundos - self.segundos_pausa
+        return self.bytes / 1e6 / activo if activo > 0 else 0.0
+
+
+@dataclass
+class Respaldo:
+    archivo: Path
+    copia: Copia
+    bytes_comprimido: int
+    segundos_compresion: float
+    borrados: list
+
+
+def directorio_respaldos():
+    return Path(getattr(settings, 'RESPALDOS_DIR', settings.BASE_DIR / 'respaldos'))
+
+
+def base_principal():
+    datos = settings.DATABASES['default']
+    if datos['ENGINE'] != 'django.db.backends.sqlite3':
+        raise ErrorRespaldo('backup_db solo funciona con SQLite; usa las herramientas de tu motor.')
+    return str(datos['NAME'])
+
+
+# --- Copia por pasos ---
+
+def copiar(origen, destino, paginas=256, pausa=0.05, al_avanzar=None):
+    """Copia la base `origen` al archivo `destino` con la API de backup."""
+    copia = Copia()
+    fuente = sqlite3.connect(origen, timeout=30)
+    salida = sqlite3.connect(destino)
+    try:
+        copia.tam_pagina = fuente.execute('PRAGMA page_size').fetchone()[0]
+        anterior = None
+
+        def progreso(status, restantes, total):
+            nonlocal anterior
+            copia.pasos += 1
+            copia.paginas = total
+            if anterior is not None and restantes >= anterior:
+                # Sin avance: otra conexión escribió y SQLite volvió a empezar
+                copia.reinicios += 1
+                if copia.reinicios >= MAX_REINICIOS:
+                    raise _Reiniciada
+            anterior = restantes
+            if al_avanzar:
+                al_avanzar(total - restantes, total)
+            if restantes and pausa:
+                time.sleep(pausa)
+                copia.segundos_pausa += pausa
+
+        inicio = time.perf_counter()
+        try:
+            fuente.backup(salida, pages=paginas, progress=progreso)
+        except _Reiniciada:
+            copia.un_paso = True
+            fuente.backup(salida, pages=-1)
+            copia.paginas = fuente.execute('PRAGMA page_count').fetchone()[0]
+        copia.segundos = time.perf_counter() - inicio
+    finally:
+        salida.close()
+        fuente.close()
+    return copia
+
+
+def verificar_integridad(ruta):
+    conexion = sqlite3.connect(ruta)
+    try:
+        resultado = [fila[0] for fila in conexion.execute('PRAGMA integrity_check')]
+    except sqlite3.DatabaseError as e:  # Ni siquiera es una base SQLite (p. ej. un archivo truncado)
+        raise ErrorRespaldo(f'{ruta}: no se pudo leer como base SQLite: {e}')
+    finally:
+        conexion.close()
+    if resultado != ['ok']:
+        raise ErrorRespaldo(f'{ruta}: integrity_check falló: {"; ".join(resultado[:5])}')
+
+
+# --- Compresión y rotación ---
+
+def _comprimir(origen, destino, compresion):
+    with open(origen, 'rb') as entrada, COMPRESIONES[compresion](destino, 'wb') as salida:
+        shutil.copyfileobj(entrada, salida, 1024 * 1024)
+
+
+def _descomprimir(origen, destino):
+    compresion = next((c for c, ext in EXTENSIONES.items() if c != 'ninguna' and origen.name.endswith(ext)), 'ninguna')
+    try:
+        with COMPRESIONES[compresion](origen, 'rb') as entrada, open(destino, 'wb') as salida:
+            shutil.copyfileobj(entrada, salida, 1024 * 1024)
+    except (OSError, EOFError, lzma.LZMAError) as e:  # gzip/xz truncado o con otro formato
+        raise ErrorRespaldo(f'{origen}: no se pudo descomprimir: {e}')
+
+
+def respaldos(directorio):
+    """Respaldos existentes, del más nuevo al más viejo (el nombre lleva la fecha)."""
+    return sorted(directorio.glob(f'{PREFIJO}*.sqlite3*'), reverse=True)
+
+
+def rotar(directorio, conservar):
+    sobrantes = respaldos(directorio)[conservar:]
+    for archivo in sobrantes:
+        archivo.unlink()
+    return sobrantes
+
+
+# --- Respaldar y restaurar ---
+
+def respaldar(directorio=None, paginas=256, pausa=0.05, compresion='gz', conservar=7, al_avanzar=None):
+    directorio = Path(directorio) if directorio else directorio_respaldos()
+    directorio.mkdir(parents=True, exist_ok=True)
+    nombre = f'{PREFIJO}{datetime.now():%Y%m%d-%H%M%S}'
+    temporal = directorio / f'.{nombre}.{os.getpid()}.tmp'
+    comprimido = directorio / f'.{nombre}.{os.getpid()}.tmp{EXTENSIONES[compresion]}'
+    final = directorio / f'{nombre}{EXTENSIONES[compresion]}'
+    try:
+        copia = copiar(base_principal(), temporal, paginas, pausa, al_avanzar)
+        verificar_integridad(temporal)
+        inicio = time.perf_counter()
+        _comprimir(temporal, comprimido, compresion)
+        segundos_compresion = time.perf_counter() - inicio
+        os.replace(comprimido, final)  # Nunca queda un respaldo a medias con nombre válido
+    finally:
+        temporal.unlink(missing_ok=True)
+        comprimido.unlink(missing_ok=True)
+    borrados = rotar(directorio, conservar) if conservar else []
+    return Respaldo(final, copia, final.stat().st_size, segundos_compresion, borrados)
+
+
+def restaurar(archivo):
+    """Reemplaza el contenido de la base principal con el respaldo, ya verificado.
+
+    Se escribe con la API de backup sobre la base en uso: las demás conexiones
+    esperan el candado y después ven la base restaurada, sin archivos movidos.
+    """
+    archivo = Path(archivo)
+    destino = base_principal()
+    temporal = Path(destino).with_name(f'.restaurar.{os.getpid()}.tmp')
+    try:
+        _descomprimir(archivo, temporal)
+        verificar_integridad(temporal)
+        fuente = sqlite3.connect(temporal)
+        salida = sqlite3.connect(destino, timeout=30)
+        try:
+            fuente.backup(salida, pages=-1)
+        finally:
+            salida.close()
+            fuente.close()
+    finally:
+        temporal.unlink(missing_ok=True)
@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Libro, Categoria, Inventario, ExistenciaSucursal
+from .catalogo import invalidar_catalogo
+from .eventos import avisar_cambios, avisar_borrado
+from .prerender import activo, registrar_cambios
+from .sucursales import descontar
+
+# =======================================================
+# SEÑALES: MANTIENEN AL DÍA LAS ESTRUCTURAS EN MEMORIA
+# =======================================================
+
+@receiver(post_save, sender=Libro)
+@receiver(post_delete, sender=Libro)
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def catalogo_modificado(sender, **kwargs):
+    # Esperamos al commit para que ningún worker reconstruya con datos sin confirmar
+    transaction.on_commit(invalidar_catalogo)
+
+
+# --- Bitácora para prerender_catalog ---
+
+@receiver(pre_save, sender=Libro)
+def recordar_categoria(sender, instance, **kwargs):
+    # Si el libro cambia de categoría también hay que regenerar la anterior
+    if instance.pk and activo():
+        instance._categoria_anterior = Libro.todos.filter(pk=instance.pk).values_list('categoria_id', flat=True).first()
+
+
+@receiver(post_save, sender=Libro)
+@receiver(post_delete, sender=Libro)
+def libro_modificado(sender, instance, **kwargs):
+    registrar_cambios([instance.categoria_id, getattr(instance, '_categoria_anterior', None)])
+
+
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def categoria_modificada(sender, instance, **kwargs):
+    registrar_cambios([instance.pk], portada=True)
+
+
+# --- Eventos en vivo del inventario ---
+
+@receiver(post_save, sender=Inventario)
+def inventario_guardado(sender, instance, **kwargs):
+    avisar_cambios([instance.libro_id])
+
+
+@receiver(post_delete, sender=Inventario)
+def inventario_borrado(sender, instance, **kwargs):
+    avisar_borrado(instance.pk, instance.libro_id)
+
+
+# --- Totales por sucursal ---
+
+@receiver(post_save, sender=ExistenciaSucursal)
+def existencia_guardada(sender, instance, **kwargs):
+    # Se publica al commit, cuando fijar() ya llevó el cambio a Inventario
+    avisar_cambios([instance.libro_id])
+
+
+@receiver(post_delete, sender=ExistenciaSucursal)
+def existencia_borrada(sender, instance, **kwargs):
+    # También corre en cascada (al borrar un libro o una sucursal)
+    descontar(instance)
+    avisar_cambios([instance.libro_id])
@@ -0,0 +1,243 @@
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import ExistenciaSucursal, Inventario, Sucursal
+from .eventos import avisar_cambios
+from .movimientos import Bitacora
+
+# =======================================================
+# EXISTENCIAS POR SUCURSAL Y TOTALES AGREGADOS
+# =======================================================
+# ExistenciaSucursal guarda cantidad, reservado y mínimo de cada libro en
+# cada sucursal. Los totales se mantienen incrementalmente, en la misma
+# transacción que el cambio, con UPDATE ... F() y el delta:
+#
+# - Inventario (una fila por libro): suma de todas las sucursales. Catálogo,
+#   API, eventos en vivo y plan_reorders siguen leyendo una sola fila.
+# - Sucursal.cantidad / Sucursal.reservado: totales de cada sucursal para
+#   los reportes, sin sumar existencias en cada petición.
+#
+# Todo cambio de stock pasa por este módulo y siempre en el mismo orden
+# (existencia, inventario, sucursal), así dos transacciones no se bloquean en
+# orden cruzado. Los borrados los cubre la señal post_delete de
+# ExistenciaSucursal. Si algo se desalinea (un UPDATE a mano en la base),
+# manage.py rebuild_stock_totals recalcula todo desde las existencias.
+#
+# Lo que cambia `cantidad` (entradas, ventas, ajustes) también queda en la
+# bitácora de movimientos (ver movimientos.py). Quien mueve varias
+# existencias pasa una Bitacora para escribirlas juntas; sin ella cada
+# función inserta su movimiento al momento.
+
+
+def _propagar(sucursal_id, libro_id, cantidad=0, reservado=0):
+    """Lleva el delta de una existencia a los totales del libro y de la sucursal."""
+    cambios = {}
+    if cantidad:
+        cambios['cantidad'] = Greatest(F('cantidad') + cantidad, Value(0))
+    if reservado:
+        cambios['reservado'] = Greatest(F('reservado') + reservado, Value(0))
+    if not cambios:
+        return
+    if cantidad:
+        Inventario.objects.filter(libro_id=libro_id).update(ultima_actualizacion=timezone.now(), **cambios)
+    else:
+        Inventario.objects.filter(libro_id=libro_id).update(**cambios)
+    Sucursal.objects.filter(pk=sucursal_id).update(**cambios)
+
+
+def _anotar(bitacora, sucursal_id, libro_id, tipo, cantidad):
+    if bitacora is None:
+        with Bitacora() as bitacora:
+            bitacora.anotar(sucursal_id, libro_id, tipo, cantidad)
+    else:
+        bitacora.anotar(sucursal_id, libro_id, tipo, cantidad)
+
+
+def descontar(existencia):
+    """Resta de los totales una existencia que se acaba de borrar (post_delete)."""
+    _propagar(existencia.sucursal_id, existencia.libro_id,
+              cantidad=-existencia.cantidad, reservado=-existencia.reservado)
+    _anotar(None, existencia.sucursal_id, existencia.libro_id, 'ajuste', -existencia.cantidad)
+
+
+# --- Movimientos ---
+
+def apartar(sucursal_id, libro_id, cantidad):
+    """Reserva `cantidad` en la sucursal si le alcanza; False si no."""
+    if not ExistenciaSucursal.objects.filter(
+            sucursal_id=sucursal_id, libro_id=libro_id, cantidad__gte=F('reservado') + cantidad,
+    ).update(reservado=F('reservado') + cantidad):
+        return False
+    _propagar(sucursal_id, libro_id, reservado=cantidad)
+    return True
+
+
+def soltar(sucursal_id, libro_id, cantidad):
+    if ExistenciaSucursal.objects.filter(sucursal_id=sucursal_id, libro_id=libro_id).update(
+            reservado=Greatest(F('reservado') - cantidad, Value(0))):
+        _propagar(sucursal_id, libro_id, reservado=-cantidad)
+
+
+def sacar(sucursal_id, libro_id, cantidad, bitacora=None):
+    """Venta de unidades no reservadas de la sucursal; False si no alcanza."""
+    if not ExistenciaSucursal.objects.filter(
+            sucursal_id=sucursal_id, libro_id=libro_id, cantidad__gte=F('reservado') + cantidad,
+    ).update(cantidad=F('cantidad') - cantidad, ultima_actualizacion=timezone.now()):
+        return False
+    _propagar(sucursal_id, libro_id, cantidad=-cantidad)
+    _anotar(bitacora, sucursal_id, libro_id, 'venta', -cantidad)
+    return True
+
+
+def sacar_por_partes(libro_id, cantidad, bitacora=None):
+    """Junta `cantidad` de varias sucursales en orden de prioridad; False si no alcanza entre todas."""
+    filas = (
+        ExistenciaSucursal.objects
+        .filter(libro_id=libro_id, sucursal__activa=True, cantidad__gt=F('reservado'))
+        .order_by('sucursal__prioridad', 'sucursal_id')
+        .values_list('sucursal_id', 'cantidad', 'reservado')
+    )
+    falta = cantidad
+    for sucursal_id, existencia, reservado in filas:
+        tomar = min(existencia - reservado, falta)
+        if sacar(sucursal_id, libro_id, tomar, bitacora):
+            falta -= tomar
+        if not falta:
+            return True
+    return False
+
+
+def recibir(sucursal_id, libro_id, cantidad, stock_minimo=None, bitacora=None):
+    """Entrada de mercancía: suma `cantidad` a la existencia (la crea si no había)."""
+    cambios = {'cantidad': F('cantidad') + cantidad, 'ultima_actualizacion': timezone.now()}
+    if stock_minimo is not None:
+        cambios['stock_minimo'] = stock_minimo
+    with transaction.atomic():
+        if not ExistenciaSucursal.objects.filter(sucursal_id=sucursal_id, libro_id=libro_id).update(**cambios):
+            # Primera vez en esta sucursal: fijar() la crea y sus señales avisan
+            fijar(sucursal_id, libro_id, cantidad, stock_minimo, tipo='entrada', bitacora=bitacora)
+            return
+        _propagar(sucursal_id, libro_id, cantidad=cantidad)
+        _anotar(bitacora, sucursal_id, libro_id, 'entrada', cantidad)
+    # El UPDATE no dispara señales: que el panel vea las unidades nuevas
+    avisar_cambios([libro_id])
+
+
+def fijar(sucursal_id, libro_id, cantidad, stock_minimo=None, tipo='ajuste', bitacora=None):
+    """Conteo manual (panel, admin): deja la existencia en `cantidad` y propaga la diferencia."""
+    with transaction.atomic():
+        existencia = ExistenciaSucursal.objects.select_for_update().filter(
+            sucursal_id=sucursal_id, libro_id=libro_id).first()
+        Inventario.objects.get_or_create(libro_id=libro_id, defaults={'cantidad': 0})
+        if existencia is None:
+            existencia = ExistenciaSucursal(sucursal_id=sucursal_id, libro_id=libro_id, cantidad=0)
+            anterior = 0
+        else:
+            anterior = existencia.cantidad
+        existencia.cantidad = cantidad
+        if stock_minimo is not None:
+            existencia.stock_minimo = stock_minimo
+        if existencia.pk:
+            # 'reservado' lo mueven las reservas con UPDATE; no lo pisamos con el valor leído aquí
+            existencia.save(update_fields=['cantidad', 'stock_minimo', 'ultima_actualizacion'])
+        else:
+            existencia.save()
+        _propagar(sucursal_id, libro_id, cantidad=cantidad - anterior)
+        _anotar(bitacora, sucursal_id, libro_id, tipo, cantidad - anterior)
+    return existencia
+
+
+def borrar_existencias(libro_id):
+    """Quita el libro de todas las sucursales junto con su Inventario."""
+    with transaction.atomic():
+        ExistenciaSucursal.objects.filter(libro_id=libro_id).delete()  # post_delete ajusta las sucursales
+        Inventario.objects.filter(libro_id=libro_id).delete()
+
+
+def descontar_libros(libro_ids):
+    """Para borrados masivos sin señales (purge_deleted): resta estos libros de sus sucursales."""
+    por_sucursal = (
+        ExistenciaSucursal.objects.filter(libro_id__in=libro_ids)
+        .values('sucursal_id').annotate(unidades=Sum('cantidad'), apartadas=Sum('reservado'))
+    )
+    for fila in por_sucursal:
+        Sucursal.objects.filter(pk=fila['sucursal_id']).update(
+            cantidad=Greatest(F('cantidad') - fila['unidades'], Value(0)),
+            reservado=Greatest(F('reservado') - fila['apartadas'], Value(0)),
+        )
+
+
+# --- Reportes ---
+
+def bajo_minimo():
+    """Existencias en o bajo el mínimo de su sucursal; las encuentra el índice parcial existencia_bajo_minimo_idx."""
+    return ExistenciaSucursal.objects.filter(stock_minimo__gt=0, cantidad__lte=F('stock_minimo'))
+
+
+# --- Elegir sucursal ---
+
+def consulta_sucursales(cantidades, preferida=None):
+    """Sucursales activas que surten completo {libro_id: cantidad}, la mejor primero.
+
+    Es una sola consulta sobre el índice (libro, sucursal): cada libro aporta
+    su condición de disponibilidad y quedan las sucursales que las cumplen
+    todas. `preferida` (id o Subquery) va primero si califica; luego decide
+    la prioridad.
+    """
+    alcanza = Q()
+    for libro_id, cantidad in cantidades.items():
+        alcanza |= Q(libro_id=libro_id, cantidad__gte=F('reservado') + cantidad)
+    orden = ['sucursal__prioridad', 'sucursal_id']
+    if preferida is not None:
+        orden.insert(0, Case(When(sucursal_id=preferida, then=Value(0)), default=Value(1)))
+    return (
+        ExistenciaSucursal.objects.filter(alcanza, sucursal__activa=True)
+        .values('sucursal_id').annotate(libros=Count('id')).filter(libros=len(cantidades))
+        .order_by(*orden).values_list('sucursal_id', flat=True)
+    )
+
+
+def sucursales_para(cantidades, preferida=None):
+    if not cantidades:
+        return []
+    return list(consulta_sucursales(cantidades, preferida))
+
+
+def con_existencias(libro_ids):
+    """Los libros que llevan control de stock (tienen Inventario)."""
+    return set(Inventario.objects.filter(libro_id__in=libro_ids).values_list('libro_id', flat=True))
+
+
+# --- Reconstrucción ---
+
+def recalcular_totales(guardar=True):
+    """Recalcula Inventario y Sucursal desde las existencias; regresa {modelo: filas corregidas}."""
+    por_libro = {
+        f['libro_id']: (f['unidades'], f['apartadas'])
+        for f in ExistenciaSucursal.objects.values('libro_id').annotate(
+            unidades=Sum('cantidad'), apartadas=Sum('reservado'))
+    }
+    por_sucursal = {
+        f['sucursal_id']: (f['unidades'], f['apartadas'])
+        for f in ExistenciaSucursal.objects.values('sucursal_id').annotate(
+            unidades=Sum('cantidad'), apartadas=Sum('reservado'))
+    }
+    corregidos = {}
+    with transaction.atomic():
+        faltantes = por_libro.keys() - set(Inventario.objects.values_list('libro_id', flat=True))
+        if guardar:
+            Inventario.objects.bulk_create([Inventario(libro_id=l, cantidad=0) for l in faltantes], batch_size=1000)
+        for model, campo, totales in ((Inventario, 'libro_id', por_libro), (Sucursal, 'id', por_sucursal)):
+            cambiar = []
+            for fila in model.objects.only(campo, 'cantidad', 'reservado').iterator():
+                unidades, apartadas = totales.get(getattr(fila, campo), (0, 0))
+                if (fila.cantidad, fila.reservado) != (unidades, apartadas):
+                    fila.cantidad, fila.reservado = unidades, apartadas
+                    cambiar.append(fila)
+            if guardar:
+                model.objects.bulk_update(cambiar, ['cantidad', 'reservado'], batch_size=1000)
+            corregidos[model._meta.verbose_name_plural] = len(cambiar)
+        corregidos['inventarios faltantes'] = len(faltantes)
+    return corregidos
@@ -1,3 +1,1991 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import importlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from functools import cached_property
+from io import StringIO
+from pathlib import Path
+from threading import BoundedSemaphore
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.db.models import F, Sum
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import LiveServerTestCase, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .autocompletar import normalizar, sugerencias
+from .forms import RepreciarForm
+from .carrito import MAX_LINEAS, CarritoLigero
+from . import archivo, arranque, compresion, eventos, limites, mantenimiento, precios, prerender, respaldo, sucursales
+from .admin import PaginadorEstimado, estimar_filas
+from .catalogo import VERSION_KEY, invalidar_catalogo, obtener_catalogo, version_catalogo
+from .management.commands import housekeeping, loadtest, plan_reorders, recomendaciones, similares
+from .management.commands.archive_orders import parsear_antiguedad
+from .mantenimiento import analizar, borrar_cambios_catalogo
+from .management.commands.explain_queries import es_scan_completo
+from .management.commands.purge_deleted import borrar_en
+from .middleware import CompresionMiddleware
+from .models import (
+    CambioCatalogo, CarritoItem, Categoria, CorteExistencia, DetallePedido, DetallePedidoArchivado, ExistenciaSucursal,
+    Inventario, Libro, LibroSimilar, MovimientoStock, Pedido, PedidoArchivado, Proveedor, Recomendacion, Reserva,
+    Sucursal, UsuarioEliminado,
+)
+from .movimientos import Bitacora, compactar, diferencias, existencia_en, existencias_en
+from .recomendaciones import sugerencias_carrito, tambien_compraron
+from .reservas import SinExistencias, clave_carrito, clave_usuario, confirmar, expirar, liberar, reservar
+from .sucursales import apartar, bajo_minimo, fijar, recalcular_totales, recibir, soltar
+
+# =======================================================
+# BASE DE LAS PRUEBAS
+# =======================================================
+# La caché de settings.py es de archivos y la comparten todos los procesos:
+# las pruebas usan una LocMem propia para no leer ni mover la versión del
+# catálogo de la tienda. La versión sobrevive al rollback de cada prueba,
+# así que setUp vacía la caché y tira el snapshot del proceso.
+
+CACHE_PRUEBAS = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pruebas'}}
+
+
+class DatosDePrueba:
+    # Compartido por TestCase y TransactionTestCase
+
+    def crear_categoria(self, nombre='Novela'):
+        return Categoria.objects.create(nombre=nombre)
+
+    @cached_property
+    def categoria(self):
+        # La de los libros creados sin categoría; se crea al usarla por primera vez
+        return self.crear_categoria()
+
+    def crear_libro(self, titulo='Pedro Páramo', autor='Juan Rulfo', categoria=None, precio='100.00', **campos):
+        campos.setdefault('descripcion', f'{titulo} de {autor}')
+        return Libro.objects.create(titulo=titulo, autor=autor, categoria=categoria or self.categoria,
+                                    precio=Decimal(precio), **campos)
+
+    def crear_sucursal(self, nombre='Centro', prioridad=0, **campos):
+        return Sucursal.objects.create(nombre=nombre, prioridad=prioridad, **campos)
+
+    def crear_usuario(self, username='lector', **campos):
+        return User.objects.create_user(username, password='clave-de-prueba', **campos)
+
+    def entrar_como_admin(self):
+        self.client.force_login(self.crear_usuario('admin', is_superuser=True, is_staff=True))
+
+    def surtir(self, libro, cantidad, sucursal=None, **campos):
+        sucursal = sucursal or self.crear_sucursal()
+        recibir(sucursal.pk, libro.pk, cantidad, **campos)
+        return sucursal
+
+    def existencia(self, libro, sucursal):
+        return ExistenciaSucursal.objects.get(libro=libro, sucursal=sucursal)
+
+    def crear_pedido(self, libros, usuario=None, fecha=None, **campos):
+        usuario = usuario or User.objects.filter(username='comprador').first() or self.crear_usuario('comprador')
+        total = sum(libro.precio for libro in libros)
+        pedido = Pedido.objects.create(usuario=usuario, direccion='Calle 1', total=total, **campos)
+        DetallePedido.objects.bulk_create([
+            DetallePedido(pedido=pedido, libro=libro, cantidad=1, precio_unitario=libro.precio) for libro in libros
+        ])
+        if fecha is not None:  # auto_now_add no deja fijarla al crear
+            Pedido.objects.filter(pk=pedido.pk).update(fecha=fecha)
+        return pedido
+
+
+@override_settings(CACHES=CACHE_PRUEBAS, LIMITES_PETICIONES={}, PRERENDER_DIR=None, MINIFICAR_HTML=False)
+class PruebaLibreria(DatosDePrueba, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directorio = Path(tempfile.mkdtemp(prefix='libreria-pruebas-'))
+        cls.addClassCleanup(shutil.rmtree, cls.directorio, ignore_errors=True)
+        cls.enterClassContext(override_settings(
+            RECOMENDACIONES_DIR=cls.directorio / 'recomendaciones',
+            RESPALDOS_DIR=cls.directorio / 'respaldos',
+        ))
+
+    def setUp(self):
+        cache.clear()
+        invalidar_catalogo()
+        # El estado incremental de los comandos vive en archivos y no se deshace con el rollback
+        shutil.rmtree(settings.RECOMENDACIONES_DIR, ignore_errors=True)
+
+
+# =======================================================
+# SNAPSHOT DEL CATÁLOGO
+# =======================================================
+
+class CatalogoTests(PruebaLibreria):
+
+    def test_se_reusa_sin_consultas_mientras_no_cambie_la_version(self):
+        self.crear_libro()
+        primero = obtener_catalogo()
+        with self.assertNumQueries(0):
+            self.assertIs(obtener_catalogo(), primero)
+
+    def test_sin_aviso_sigue_el_snapshot_y_al_invalidar_se_reconstruye(self):
+        libro = self.crear_libro(precio='10.00')
+        self.assertEqual(obtener_catalogo().libro(libro.pk).precio, Decimal('10.00'))
+        Libro.objects.filter(pk=libro.pk).update(precio=Decimal('20.00'))
+        self.assertEqual(obtener_catalogo().libro(libro.pk).precio, Decimal('10.00'))
+        invalidar_catalogo()
+        self.assertEqual(obtener_catalogo().libro(libro.pk).precio, Decimal('20.00'))
+
+    def test_la_version_de_otro_proceso_llega_por_la_cache(self):
+        # Otro worker solo escribe la llave compartida; el snapshot de este proceso sigue en memoria
+        viejo = obtener_catalogo()
+        cache.set(VERSION_KEY, 'de-otro-proceso', None)
+        nuevo = obtener_catalogo()
+        self.assertIsNot(nuevo, viejo)
+        self.assertEqual(nuevo.version, 'de-otro-proceso')
+
+    def test_si_la_cache_pierde_la_version_no_revive_un_snapshot_viejo(self):
+        viejo = obtener_catalogo()
+        cache.delete(VERSION_KEY)
+        self.assertNotEqual(version_catalogo(), viejo.version)
+        self.assertIsNot(obtener_catalogo(), viejo)
+
+    def test_guardar_un_libro_invalida_al_confirmar(self):
+        libro = self.crear_libro(precio='10.00')
+        obtener_catalogo()
+        with self.captureOnCommitCallbacks(execute=True):
+            libro.precio = Decimal('15.00')
+            libro.save()
+        self.assertEqual(obtener_catalogo().libro(libro.pk).precio, Decimal('15.00'))
+
+    def test_indices_por_categoria_e_isbn(self):
+        categoria = self.crear_categoria('Poesía')
+        libro = self.crear_libro(categoria=categoria, isbn='978-1')
+        otro = self.crear_libro('Otro', categoria=categoria)
+        catalogo = obtener_catalogo()
+        self.assertEqual([l.id for l in catalogo.libros_de_categoria(categoria.pk)], [libro.pk, otro.pk])
+        self.assertEqual(catalogo.libro_por_isbn('978-1').id, libro.pk)
+        self.assertEqual(catalogo.categorias_con_nombre(['Nada', 'Poesía'])[0].id, categoria.pk)
+
+    def test_la_pagina_de_categoria_sale_del_snapshot(self):
+        libro = self.crear_libro('Rayuela')
+        obtener_catalogo()
+        Libro.objects.filter(pk=libro.pk).update(titulo='Cambiado sin aviso')
+        respuesta = self.client.get(f'/categoria/{libro.categoria_id}/')
+        self.assertContains(respuesta, 'Rayuela')
+
+    def test_settings_usa_una_cache_compartida_entre_procesos(self):
+        # Con LocMem cada worker tendría su propia versión y nunca vería los cambios de los demás
+        from backend_libreria import settings as ajustes
+        self.assertNotIn('locmem', ajustes.CACHES['default']['BACKEND'].lower())
+
+
+# =======================================================
+# ÍNDICES Y RESTRICCIONES
+# =======================================================
+
+class IndicesTests(PruebaLibreria):
+
+    def test_explain_queries_estricto_no_encuentra_scans_completos(self):
+        salida = StringIO()
+        call_command('explain_queries', '--strict', stdout=salida)
+        self.assertNotIn('FAIL', salida.getvalue())
+
+    def test_distingue_scan_completo_de_recorrido_por_indice(self):
+        self.assertTrue(es_scan_completo('SCAN app_libreria_libro'))
+        self.assertFalse(es_scan_completo('SCAN app_libreria_libro USING INDEX libro_titulo_idx'))
+        self.assertFalse(es_scan_completo('SEARCH app_libreria_libro USING INTEGER PRIMARY KEY (rowid=?)'))
+
+    def test_un_renglon_de_carrito_por_usuario_y_libro(self):
+        usuario, libro = self.crear_usuario(), self.crear_libro()
+        CarritoItem.objects.create(usuario=usuario, libro=libro)
+        with self.assertRaises(IntegrityError):
+            CarritoItem.objects.create(usuario=usuario, libro=libro)
+
+
+# =======================================================
+# PRUEBA DE CARGA
+# =======================================================
+
+class LoadtestTests(PruebaLibreria):
+
+    def test_mezcla_de_acciones(self):
+        comando = loadtest.Command()
+        self.assertEqual(comando._parsear_mezcla('login=1, carrito=2.5'), [('login', 1.0), ('carrito', 2.5)])
+        with self.assertRaises(CommandError):
+            comando._parsear_mezcla('comprar=1')
+        with self.assertRaises(CommandError):
+            comando._parsear_mezcla('login=mucho')
+
+    def test_percentiles(self):
+        latencias = [i / 100 for i in range(1, 101)]
+        self.assertEqual(loadtest._percentil([], 50), 0.0)
+        self.assertEqual(loadtest._percentil(latencias, 50), 0.51)
+        self.assertEqual(loadtest._percentil(latencias, 99), 0.99)
+        self.assertEqual(loadtest._percentil(latencias, 100), 1.0)
+
+    def test_el_reporte_separa_los_429_de_los_demas_errores(self):
+        muestras = [('login', 0.1, True, False), ('login', 0.2, False, True), ('login', 0.3, False, False)]
+        ruta = loadtest.Command()._reporte(muestras, transcurrido=1.0)['rutas']['login']
+        self.assertEqual((ruta['peticiones'], ruta['errores'], ruta['limitadas']), (3, 2, 1))
+
+    def test_aviso_si_los_limites_recortaron_la_prueba(self):
+        comando = loadtest.Command(stdout=StringIO())
+        comando._imprimir(comando._reporte([('carrito', 0.1, False, True)], transcurrido=1.0))
+        self.assertIn('LIBRERIA_SIN_LIMITES=1', comando.stdout.getvalue())
+
+    def test_sembrar_deja_totales_y_bitacora_cuadrados(self):
+        self.crear_sucursal()
+        call_command('loadtest', '--sembrar-libros', 30, '--sembrar-usuarios', 3, '--solo-sembrar', stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='carga_').count(), 3)
+        self.assertEqual(Libro.objects.filter(titulo__startswith='Libro de carga').count(), 30)
+        existencias = ExistenciaSucursal.objects.aggregate(t=Sum('cantidad'))['t']
+        self.assertEqual(Inventario.objects.aggregate(t=Sum('cantidad'))['t'], existencias)
+        self.assertEqual(Sucursal.objects.aggregate(t=Sum('cantidad'))['t'], existencias)
+        self.assertEqual(MovimientoStock.objects.aggregate(t=Sum('cantidad'))['t'], existencias)
+
+    def test_el_servidor_de_la_prueba_puede_arrancar_sin_limites(self):
+        from backend_libreria import settings as ajustes
+        self.addCleanup(importlib.reload, ajustes)
+        with mock.patch.dict(os.environ, {'LIBRERIA_SIN_LIMITES': '1'}):
+            self.assertEqual(importlib.reload(ajustes).LIMITES_PETICIONES, {})
+        with mock.patch.dict(os.environ, {'LIBRERIA_SIN_LIMITES': ''}):
+            self.assertIn('login', importlib.reload(ajustes).LIMITES_PETICIONES)
+
+
+# =======================================================
+# CARRITO LIGERO
+# =======================================================
+
+class CarritoLigeroTests(PruebaLibreria):
+
+    def test_la_cookie_firmada_lleva_el_carrito_y_el_token_de_reserva(self):
+        libro = self.crear_libro()
+        sucursal = self.surtir(libro, 3)
+        self.client.get(f'/agregar/{libro.pk}/')
+        self.client.get(f'/agregar/{libro.pk}/')
+        self.assertIn('carrito', self.client.cookies)
+        self.assertFalse(CarritoItem.objects.exists())
+        reserva = Reserva.objects.get()
+        self.assertEqual((reserva.libro_id, reserva.cantidad), (libro.pk, 2))
+        self.assertTrue(reserva.clave.startswith('c:'))
+        self.assertEqual(self.existencia(libro, sucursal).reservado, 2)
+        self.assertContains(self.client.get('/carrito/'), libro.titulo)
+
+    def test_una_cookie_alterada_da_un_carrito_vacio(self):
+        peticion = RequestFactory().get('/')
+        peticion.COOKIES['carrito'] = '{"1":5,"_":"ajeno"}'
+        carrito = CarritoLigero(peticion)
+        self.assertEqual((carrito.lineas, carrito.token), ({}, None))
+
+    def test_tope_de_renglones(self):
+        carrito = CarritoLigero(RequestFactory().get('/'))
+        for libro_id in range(1, MAX_LINEAS + 1):
+            self.assertTrue(carrito.agregar(libro_id))
+        self.assertFalse(carrito.agregar(MAX_LINEAS + 1))
+        self.assertTrue(carrito.agregar(1))  # Más ejemplares de un renglón que ya está sí caben
+        self.assertEqual((len(carrito), carrito.lineas[1]), (MAX_LINEAS, 2))
+
+    def test_cerrar_sesion_borra_la_cookie_y_suelta_las_reservas(self):
+        libro = self.crear_libro()
+        sucursal = self.surtir(libro, 3)
+        self.client.force_login(self.crear_usuario())
+        self.client.get(f'/agregar/{libro.pk}/')
+        self.assertEqual(self.existencia(libro, sucursal).reservado, 1)
+        respuesta = self.client.get('/logout/')
+        self.assertEqual(respuesta.cookies['carrito']['max-age'], 0)
+        self.assertFalse(Reserva.objects.exists())
+        self.assertEqual(self.existencia(libro, sucursal).reservado, 0)
+        self.assertEqual(Inventario.objects.get(libro=libro).reservado, 0)
+
+    @override_settings(CARRITO_ALMACEN='sesion')
+    def test_cerrar_sesion_suelta_las_reservas_del_carrito_en_sesion(self):
+        libro = self.crear_libro()
+        sucursal = self.surtir(libro, 3)
+        self.client.force_login(self.crear_usuario())
+        self.client.get(f'/agregar/{libro.pk}/')
+        self.assertNotIn('carrito', self.client.cookies)
+        self.assertEqual(self.existencia(libro, sucursal).reservado, 1)
+        self.client.get('/logout/')
+        self.assertFalse(Reserva.objects.exists())
+        self.assertEqual(self.existencia(libro, sucursal).reservado, 0)
+
+
+# =======================================================
+# LÍMITES DE PETICIONES
+# =======================================================
+
+class LimitesTests(PruebaLibreria):
+
+    def test_el_balde_se_vacia_y_dice_cuando_reintentar(self):
+        self.assertEqual(limites.consumir_token('prueba', 2, 60), (True, 0))
+        self.assertEqual(limites.consumir_token('prueba', 2, 60), (True, 0))
+        permitido, reintentar = limites.consumir_token('prueba', 2, 60)
+        self.assertFalse(permitido)
+        self.assertGreater(reintentar, 0)
+
+    @override_settings(LIMITES_PETICIONES={'login': {'usuario': (2, 60)}})
+    def test_login_responde_429_por_usuario_sin_importar_mayusculas(self):
+        for username in ('lector', 'LECTOR'):
+            self.assertEqual(self.client.post('/login/', {'username': username, 'password': 'mala'}).status_code, 200)
+        respuesta = self.client.post('/login/', {'username': 'Lector', 'password': 'mala'})
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertIn('Retry-After', respuesta)
+        # Otro usuario y los GET del formulario no comparten el balde
+        self.assertEqual(self.client.post('/login/', {'username': 'otro', 'password': 'mala'}).status_code, 200)
+        self.assertEqual(self.client.get('/login/').status_code, 200)
+        self.assertEqual(limites.contadores(['login'])['login'], {'permitidas': 3, 'limitadas': 1, 'rechazadas': 0})
+
+    @override_settings(LIMITES_PETICIONES={'agregar_carrito': {'ip': (1, 60)}})
+    def test_agregar_al_carrito_por_ip(self):
+        libro = self.crear_libro()
+        self.surtir(libro, 5)
+        self.assertEqual(self.client.get(f'/agregar/{libro.pk}/').status_code, 302)
+        self.assertEqual(self.client.get(f'/agregar/{libro.pk}/').status_code, 429)
+        self.assertEqual(Reserva.objects.get().cantidad, 1)
+
+    def test_con_el_tope_de_concurrencia_lleno_responde_503_sin_entrar_a_la_vista(self):
+        lleno = BoundedSemaphore(1)
+        lleno.acquire()
+        with mock.patch.object(limites, '_semaforo', lleno):
+            respuesta = self.client.post('/login/', {'username': 'lector', 'password': 'mala'})
+        self.assertEqual(respuesta.status_code, 503)
+        self.assertEqual(limites.contadores(['login'])['login']['rechazadas'], 1)
+
+
+@override_settings(CACHES=CACHE_PRUEBAS, LIMITES_PETICIONES={}, PRERENDER_DIR=None, MINIFICAR_HTML=False)
+class LoginDeCargaTests(LiveServerTestCase):
+    # El cliente de loadtest contra un servidor de verdad: el login malo también responde 200
+
+    def test_solo_la_redireccion_cuenta_como_login_exitoso(self):
+        User.objects.create_user('carga_1', password=loadtest.PASSWORD_CARGA)
+        cliente = loadtest.ClienteTienda(self.live_server_url, timeout=10)
+        cliente.login('carga_1')
+        cliente.login('no_existe')
+        exitos = [ok for ruta, _, ok, _ in cliente.muestras if ruta == 'login']
+        self.assertEqual(exitos, [True, False])
+
+
+# =======================================================
+# RECOMENDACIONES POR COMPRAS
+# =======================================================
+
+@skipIf(recomendaciones.np is None, 'requiere numpy y scipy')
+class RecomendacionesTests(PruebaLibreria):
+
+    def setUp(self):
+        super().setUp()
+        self.a, self.b, self.c, self.d = (self.crear_libro(t) for t in 'ABCD')
+
+    def calcular(self, *args):
+        call_command('recomendaciones', *args, stdout=StringIO())
+
+    def vecinos(self, libro):
+        return list(Recomendacion.objects.filter(libro=libro).values_list('recomendado_id', flat=True))
+
+    def test_ordena_por_lo_que_mas_se_compra_junto(self):
+        self.crear_pedido([self.a, self.b])
+        self.crear_pedido([self.a, self.b])
+        self.crear_pedido([self.a, self.c])
+        self.calcular()
+        self.assertEqual(self.vecinos(self.a), [self.b.pk, self.c.pk])
+        self.assertEqual(self.vecinos(self.b), [self.a.pk])
+        self.assertEqual(self.vecinos(self.d), [])
+
+    def test_la_pasada_incremental_solo_suma_los_pedidos_nuevos(self):
+        self.crear_pedido([self.a, self.b])
+        self.calcular()
+        self.crear_pedido([self.c, self.d])
+        self.calcular()
+        self.assertEqual(self.vecinos(self.a), [self.b.pk])
+        self.assertEqual(self.vecinos(self.c), [self.d.pk])
+
+    def test_el_recalculo_completo_tira_las_recomendaciones_viejas(self):
+        Recomendacion.objects.create(libro=self.d, recomendado=self.a, puntaje=1, posicion=0)
+        self.crear_pedido([self.a, self.b])
+        self.calcular('--completo')
+        self.assertEqual(self.vecinos(self.d), [])
+        self.assertEqual(self.vecinos(self.a), [self.b.pk])
+
+    def test_sin_pedidos_el_recalculo_completo_no_deja_nada(self):
+        Recomendacion.objects.create(libro=self.d, recomendado=self.a, puntaje=1, posicion=0)
+        self.calcular('--completo')
+        self.assertFalse(Recomendacion.objects.exists())
+
+    def test_sugerencias_sin_repetir_el_carrito_y_con_parecidos_de_relleno(self):
+        Recomendacion.objects.create(libro=self.a, recomendado=self.b, puntaje=0.9, posicion=0)
+        Recomendacion.objects.create(libro=self.b, recomendado=self.a, puntaje=0.9, posicion=0)
+        LibroSimilar.objects.create(libro=self.a, similar=self.c, puntaje=0.5, posicion=0)
+        self.assertEqual([l.id for l in tambien_compraron([self.a.pk, self.b.pk])], [])
+        self.assertEqual([l.id for l in sugerencias_carrito([self.a.pk], limite=2)], [self.b.pk, self.c.pk])
+
+
+# =======================================================
+# AUTOCOMPLETADO
+# =======================================================
+
+class AutocompletarTests(PruebaLibreria):
+
+    def titulos(self, texto, limite=8):
+        return [libro.titulo for libro in sugerencias(texto, limite)]
+
+    def test_normaliza_acentos_signos_y_mayusculas(self):
+        self.assertEqual(normalizar('Poesía ¡Ñandú!'), 'poesia nandu')
+        self.assertEqual(normalizar(None), '')
+
+    def test_encuentra_por_cualquier_palabra_del_titulo_o_del_autor(self):
+        self.crear_libro('Cien años de soledad', 'Gabriel García Márquez')
+        self.crear_libro('Pedro Páramo', 'Juan Rulfo')
+        self.assertEqual(self.titulos('sole'), ['Cien años de soledad'])
+        self.assertEqual(self.titulos('PARAMO'), ['Pedro Páramo'])
+        self.assertEqual(self.titulos('garcía m'), ['Cien años de soledad'])
+        self.assertEqual(self.titulos('de'), [])  # Las palabras vacías no son clave
+        self.assertEqual(self.titulos('  '), [])
+
+    def test_primero_los_mas_vendidos_y_luego_por_titulo(self):
+        poco = self.crear_libro('Rayuela B')
+        self.crear_libro('Rayuela C')
+        mucho = self.crear_libro('Rayuela A')
+        self.crear_pedido([mucho, mucho, poco])
+        invalidar_catalogo()
+        self.assertEqual(self.titulos('rayuela'), ['Rayuela A', 'Rayuela B', 'Rayuela C'])
+        self.assertEqual(self.titulos('rayuela', limite=1), ['Rayuela A'])
+
+    def test_ordena_entre_todas_las_coincidencias(self):
+        Libro.objects.bulk_create([
+            Libro(titulo=f'Alfa {i:03d}', autor='Anónimo', categoria=self.categoria, precio=Decimal('1.00'))
+            for i in range(300)
+        ])
+        vendido = self.crear_libro('Alfa zeta')
+        self.crear_pedido([vendido])
+        invalidar_catalogo()
+        # Su clave queda después de otras 300; igual sale primero
+        self.assertEqual(self.titulos('a', limite=1), ['Alfa zeta'])
+        self.assertEqual(self.titulos('alfa', limite=2), ['Alfa zeta', 'Alfa 000'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            vendido.titulo = 'Omega'
+            vendido.save()
+        # El top precalculado de los prefijos cortos sigue a los cambios
+        self.assertEqual(self.titulos('a', limite=1), ['Alfa 000'])
+        self.assertEqual(self.titulos('o', limite=1), ['Omega'])
+
+    def test_sigue_los_cambios_del_catalogo(self):
+        libros = [self.crear_libro(f'Libro {i}') for i in range(20)]
+        self.assertEqual(self.titulos('libro 7'), ['Libro 7'])
+        with self.captureOnCommitCallbacks(execute=True):
+            libros[7].titulo = 'Renombrado'
+            libros[7].save()
+        self.assertEqual(self.titulos('libro 7'), [])
+        self.assertEqual(self.titulos('renombr'), ['Renombrado'])
+
+    def test_el_endpoint_no_consulta_la_base(self):
+        libro = self.crear_libro('Ficciones', 'Jorge Luis Borges')
+        self.client.get('/api/autocomplete/', {'q': 'fic'})
+        with self.assertNumQueries(0):
+            datos = self.client.get('/api/autocomplete/', {'q': 'borges', 'limite': 'x'}).json()
+        self.assertEqual(datos['resultados'], [
+            {'id': libro.pk, 'titulo': 'Ficciones', 'autor': 'Jorge Luis Borges', 'categoria_id': self.categoria.pk},
+        ])
+
+    def test_la_plantilla_base_trae_el_buscador(self):
+        self.assertContains(self.client.get('/'), 'data-autocomplete-url="/api/autocomplete/"')
+
+
+# =======================================================
+# API JSON DEL CATÁLOGO
+# =======================================================
+
+class ApiTests(PruebaLibreria):
+
+    def setUp(self):
+        super().setUp()
+        self.libros = [self.crear_libro(f'Libro {i}', isbn=f'isbn-{i}') for i in range(5)]
+
+    def test_solo_los_campos_pedidos(self):
+        datos = self.client.get('/api/libros/', {'fields': 'id,titulo,titulo'}).json()
+        self.assertEqual(datos['resultados'][0], {'id': self.libros[0].pk, 'titulo': 'Libro 0'})
+        respuesta = self.client.get('/api/libros/', {'fields': 'id,password'})
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('password', respuesta.json()['error'])
+
+    def test_varios_libros_en_una_consulta(self):
+        ids = f'{self.libros[3].pk},{self.libros[1].pk}'
+        with self.assertNumQueries(1):
+            datos = self.client.get('/api/libros/', {'ids': ids, 'fields': 'id'}).json()
+        self.assertEqual(datos['resultados'], [{'id': self.libros[1].pk}, {'id': self.libros[3].pk}])
+        datos = self.client.get('/api/libros/', {'isbn': 'isbn-4', 'fields': 'titulo'}).json()
+        self.assertEqual(datos['resultados'], [{'titulo': 'Libro 4'}])
+        self.assertEqual(self.client.get('/api/libros/', {'ids': '1,x'}).status_code, 400)
+
+    def test_paginacion_por_llave(self):
+        primera = self.client.get('/api/libros/', {'fields': 'titulo', 'limite': 2}).json()
+        self.assertEqual([f['titulo'] for f in primera['resultados']], ['Libro 0', 'Libro 1'])
+        segunda = self.client.get('/api/libros/', {'fields': 'titulo', 'limite': 2, 'despues': primera['siguiente']}).json()
+        self.assertEqual([f['titulo'] for f in segunda['resultados']], ['Libro 2', 'Libro 3'])
+        ultima = self.client.get('/api/libros/', {'limite': 2, 'despues': segunda['siguiente']}).json()
+        self.assertEqual((len(ultima['resultados']), ultima['siguiente']), (1, None))
+
+    def test_etag_responde_304_hasta_que_cambia_el_catalogo(self):
+        etag = self.client.get('/api/libros/')['ETag']
+        respuesta = self.client.get('/api/libros/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crear_libro('Nuevo')
+        respuesta = self.client.get('/api/libros/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        # Otros parámetros, otra respuesta
+        self.assertNotEqual(self.client.get('/api/libros/', {'limite': 1})['ETag'], respuesta['ETag'])
+
+    def test_inventario_sin_etag_y_con_disponibles(self):
+        sucursal = self.surtir(self.libros[0], 3)
+        self.assertTrue(reservar('c:prueba', self.libros[0].pk, 2))
+        respuesta = self.client.get('/api/inventario/', {'libros': self.libros[0].pk})
+        self.assertNotIn('ETag', respuesta)
+        self.assertEqual(respuesta.json()['resultados'], [{
+            'libro_id': self.libros[0].pk, 'cantidad': 3, 'reservado': 2,
+            'unidades_disponibles': 1, 'disponible': True,
+        }])
+        self.assertEqual(self.existencia(self.libros[0], sucursal).reservado, 2)
+
+    def test_solo_lectura(self):
+        self.assertEqual(self.client.post('/api/libros/').status_code, 405)
+
+
+# =======================================================
+# PLANTILLAS JINJA2
+# =======================================================
+
+def plantillas_con_jinja2():
+    """settings.TEMPLATES tal como queda con LIBRERIA_JINJA2=1."""
+    from backend_libreria import settings as ajustes
+    try:
+        with mock.patch.dict(os.environ, {'LIBRERIA_JINJA2': '1'}):
+            return importlib.reload(ajustes).TEMPLATES
+    finally:
+        importlib.reload(ajustes)
+
+
+class Jinja2Tests(PruebaLibreria):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.enterClassContext(override_settings(TEMPLATES=plantillas_con_jinja2()))
+
+    def test_la_tienda_se_renderiza_con_jinja2_y_escapa_el_html(self):
+        libro = self.crear_libro('<b>Negritas</b>', categoria=self.crear_categoria('Poesía'))
+        self.surtir(libro, 2)
+        self.client.get(f'/agregar/{libro.pk}/')
+        for url in ('/', f'/categoria/{libro.categoria_id}/', '/carrito/'):
+            with self.subTest(url=url):
+                respuesta = self.client.get(url)
+                self.assertEqual(respuesta.status_code, 200)
+                # Django manda la señal template_rendered con sus plantillas; Jinja2 no
+                self.assertEqual(respuesta.templates, [])
+                self.assertContains(respuesta, 'data-autocomplete-url="/api/autocomplete/"')
+        respuesta = self.client.get(f'/categoria/{libro.categoria_id}/')
+        self.assertContains(respuesta, '&lt;b&gt;Negritas&lt;/b&gt;')
+        self.assertNotContains(respuesta, '<b>Negritas</b>')
+
+    def test_el_panel_sigue_con_plantillas_de_django(self):
+        self.entrar_como_admin()
+        self.assertNotEqual(self.client.get('/admin-panel/').templates, [])
+
+    def test_benchmark_de_plantillas(self):
+        salida = StringIO()
+        call_command('bench_templates', '--libros', 5, '--repeticiones', 1, stdout=salida)
+        filas = [linea.split() for linea in salida.getvalue().splitlines()[1:]]
+        self.assertEqual(sum(1 for fila in filas if 'jinja2' in fila), 3)
+
+
+# =======================================================
+# ADMIN PARA TABLAS GRANDES
+# =======================================================
+
+class AdminTests(PruebaLibreria):
+
+    def setUp(self):
+        super().setUp()
+        self.entrar_como_admin()
+
+    def crear_libros(self, n):
+        return [self.crear_libro(f'Libro {i}') for i in range(n)]
+
+    def test_sin_filtros_estima_sin_count(self):
+        libros = self.crear_libros(4)
+        Libro.todos.filter(pk=libros[0].pk).update(eliminado=True)
+        analizar([Libro._meta.db_table])
+        libros.append(self.crear_libro('Después del ANALYZE'))
+        # Lo que vio ANALYZE, aunque ya haya un libro más
+        self.assertEqual(estimar_filas(Libro), 4)
+        with CaptureQueriesContext(connection) as consultas:
+            total = PaginadorEstimado(Libro.objects.order_by('id'), 2).count
+        # Menos los marcados como eliminados
+        self.assertEqual(total, 3)
+        self.assertFalse(any('COUNT' in c['sql'] and 'eliminado" = 0' in c['sql'] for c in consultas.captured_queries))
+
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM sqlite_stat1 WHERE tbl = %s', [Libro._meta.db_table])
+        # Sin estadísticas queda MAX(id)
+        self.assertEqual(estimar_filas(Libro), libros[-1].pk)
+
+    def test_con_filtros_cuenta_de_verdad(self):
+        self.crear_libros(3)
+        Libro.objects.filter(titulo='Libro 0').update(eliminado=True)
+        self.assertEqual(PaginadorEstimado(Libro.objects.filter(titulo__startswith='Libro').order_by('id'), 2).count, 2)
+        self.assertEqual(PaginadorEstimado([1, 2, 3], 2).count, 3)
+
+    def test_el_listado_no_hace_una_consulta_por_renglon(self):
+        def consultas_del_listado():
+            with CaptureQueriesContext(connection) as consultas:
+                self.assertEqual(self.client.get('/admin/app_libreria/libro/').status_code, 200)
+            return len(consultas)
+        self.crear_libros(2)
+        pocos = consultas_del_listado()
+        self.crear_libros(10)
+        self.assertEqual(consultas_del_listado(), pocos)
+
+    def test_busqueda_y_autocompletado_de_llaves_foraneas(self):
+        self.crear_libro('Rayuela', 'Julio Cortázar', isbn='978-84')
+        self.assertContains(self.client.get('/admin/app_libreria/libro/', {'q': '978-84'}), 'Rayuela')
+        respuesta = self.client.get('/admin/autocomplete/', {
+            'term': 'Ray', 'app_label': 'app_libreria', 'model_name': 'inventario', 'field_name': 'libro',
+        })
+        self.assertEqual([r['text'] for r in respuesta.json()['results']], ['Rayuela'])
+
+    def test_capturar_una_existencia_desde_el_admin_mueve_los_totales(self):
+        libro, sucursal = self.crear_libro(), self.crear_sucursal()
+        respuesta = self.client.post('/admin/app_libreria/existenciasucursal/add/', {
+            'sucursal': sucursal.pk, 'libro': libro.pk, 'cantidad': 7, 'stock_minimo': 2,
+        })
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(Inventario.objects.get(libro=libro).cantidad, 7)
+        self.assertEqual(Sucursal.objects.get(pk=sucursal.pk).cantidad, 7)
+        self.assertEqual(MovimientoStock.objects.get().cantidad, 7)
+
+
+# =======================================================
+# REPRECIO MASIVO
+# =======================================================
+
+class PreciosTests(PruebaLibreria):
+
+    def repreciar(self, precios_actuales, tipo='porcentaje', valor='0', redondeo='centavos', minimo=None, maximo=None):
+        libros = [self.crear_libro(f'Libro {i}', precio=p) for i, p in enumerate(precios_actuales)]
+        expresion = precios.expresion_precio(tipo, valor, redondeo, minimo, maximo)
+        queryset = Libro.objects.filter(pk__in=[l.pk for l in libros])
+        _, muestra = precios.previsualizar(queryset, expresion)
+        self.assertEqual(precios.aplicar(queryset, expresion), len(libros))
+        nuevos = list(queryset.order_by('id').values_list('precio', flat=True))
+        # La vista previa usa la misma expresión que el UPDATE
+        self.assertEqual([Decimal(f['nuevo_precio']) for f in muestra], nuevos)
+        return [str(p) for p in nuevos]
+
+    def test_porcentaje_y_cantidad_fija_al_centavo(self):
+        self.assertEqual(self.repreciar(['100.00', '19.99'], valor='10'), ['110.00', '21.99'])
+        self.assertEqual(self.repreciar(['19.99'], valor='-10'), ['17.99'])
+        self.assertEqual(self.repreciar(['19.99'], 'fijo', '5.50'), ['25.49'])
+
+    def test_terminacion_99_tambien_en_precios_enteros(self):
+        self.assertEqual(self.repreciar(['123.00', '123.40', '123.99', '0.50'], redondeo='99'),
+                         ['123.99', '123.99', '123.99', '0.99'])
+
+    def test_terminacion_90(self):
+        self.assertEqual(self.repreciar(['123.00', '123.40', '123.99'], redondeo='90'), ['123.90', '123.90', '123.90'])
+
+    def test_al_peso_entero(self):
+        self.assertEqual(self.repreciar(['10.40', '10.60'], redondeo='entero'), ['10.00', '11.00'])
+
+    def test_limites_de_precio(self):
+        self.assertEqual(self.repreciar(['10.00', '500.00'], valor='-50', minimo='8', maximo='200'), ['8.00', '200.00'])
+        # Un máximo por debajo del mínimo no deja libros más baratos que el mínimo
+        self.assertEqual(self.repreciar(['50.00'], maximo='5', minimo='10'), ['10.00'])
+        # Nunca gratis ni negativos
+        self.assertEqual(self.repreciar(['3.00'], 'fijo', '-10'), ['0.01'])
+
+    def test_el_formulario_rechaza_maximo_cero_y_rangos_invertidos(self):
+        base = {'tipo': 'porcentaje', 'valor': '5', 'redondeo': 'centavos'}
+        self.assertIn('maximo', RepreciarForm(dict(base, maximo='0')).errors)
+        self.assertIn('maximo', RepreciarForm(dict(base, minimo='20', maximo='10')).errors)
+        self.assertIn('valor', RepreciarForm(dict(base, valor='-100')).errors)
+        self.assertTrue(RepreciarForm(dict(base, minimo='0', maximo='0.01')).is_valid())
+
+    def test_filtra_por_categoria_proveedor_y_autor_sin_tocar_eliminados(self):
+        proveedor = Proveedor.objects.create(nombre='Distribuidora', contacto='Ana', telefono='1', email='a@b.mx',
+                                             direccion='-')
+        elegido = self.crear_libro('Elegido', 'Rulfo', proveedor=proveedor)
+        self.crear_libro('Otro autor', 'Borges', proveedor=proveedor)
+        self.crear_libro('Otra categoría', 'Rulfo', self.crear_categoria('Poesía'), proveedor=proveedor)
+        eliminado = self.crear_libro('Eliminado', 'Rulfo', proveedor=proveedor, eliminado=True)
+        queryset = precios.libros_filtrados(self.categoria, proveedor, 'Rulfo')
+        self.assertEqual(precios.aplicar(queryset, precios.expresion_precio('fijo', '1')), 1)
+        self.assertEqual(Libro.todos.get(pk=elegido.pk).precio, Decimal('101.00'))
+        self.assertEqual(Libro.todos.get(pk=eliminado.pk).precio, Decimal('100.00'))
+
+    def test_la_vista_previa_no_escribe_y_aplicar_invalida_el_catalogo(self):
+        libro = self.crear_libro()
+        self.assertEqual(obtener_catalogo().libro(libro.pk).precio, Decimal('100.00'))
+        self.entrar_como_admin()
+        datos = {'tipo': 'porcentaje', 'valor': '10', 'redondeo': '99'}
+        respuesta = self.client.post('/admin-panel/libros/repreciar/', datos)
+        self.assertContains(respuesta, '110.99')
+        self.assertEqual(Libro.objects.get().precio, Decimal('100.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/admin-panel/libros/repreciar/', dict(datos, aplicar='1'))
+        self.assertEqual(Libro.objects.get().precio, Decimal('110.99'))
+        self.assertEqual(obtener_catalogo().libro(libro.pk).precio, Decimal('110.99'))
+
+
+# =======================================================
+# BORRADO LÓGICO Y PURGA POR LOTES
+# =======================================================
+
+class BorradoTests(PruebaLibreria):
+    databases = {'default', 'archivo'}  # La purga de usuarios también borra sus pedidos archivados
+
+    def setUp(self):
+        super().setUp()
+        self.entrar_como_admin()
+
+    def purgar(self, *args):
+        call_command('purge_deleted', '--pausa', 0, *args, stdout=StringIO())
+
+    def test_borrar_un_libro_solo_lo_oculta(self):
+        libro = self.crear_libro()
+        CarritoItem.objects.create(usuario=self.crear_usuario(), libro=libro)
+        obtener_catalogo()
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post(f'/admin-panel/libros/eliminar/{libro.pk}/')
+        self.assertRedirects(respuesta, '/admin-panel/libros/', fetch_redirect_response=False)
+        self.assertFalse(Libro.objects.filter(pk=libro.pk).exists())
+        self.assertTrue(Libro.todos.filter(pk=libro.pk, eliminado=True).exists())
+        self.assertIsNone(obtener_catalogo().libro(libro.pk))
+        self.assertTrue(CarritoItem.objects.exists())  # La cascada espera a purge_deleted
+
+    def test_borrar_una_categoria_oculta_sus_libros(self):
+        libro = self.crear_libro()
+        self.client.post(f'/admin-panel/categorias/eliminar/{self.categoria.pk}/')
+        self.assertFalse(Categoria.objects.filter(pk=self.categoria.pk).exists())
+        self.assertTrue(Libro.todos.get(pk=libro.pk).eliminado)
+
+    def test_borrar_un_usuario_lo_desactiva(self):
+        usuario = self.crear_usuario()
+        self.client.get(f'/admin-panel/usuarios/eliminar/{usuario.pk}/')
+        self.assertFalse(User.objects.get(pk=usuario.pk).is_active)
+        self.assertTrue(UsuarioEliminado.objects.filter(usuario=usuario).exists())
+        self.assertFalse(self.client.login(username='lector', password='clave-de-prueba'))
+
+    def test_el_admin_de_django_tambien_solo_marca(self):
+        libro = self.crear_libro()
+        CarritoItem.objects.create(usuario=self.crear_usuario(), libro=libro)
+        url = f'/admin/app_libreria/libro/{libro.pk}/delete/'
+        # La confirmación no recorre la cascada
+        self.assertEqual(self.client.get(url).context['deleted_objects'], [libro.titulo])
+        self.client.post(url, {'post': 'yes'})
+        self.assertTrue(Libro.todos.get(pk=libro.pk).eliminado)
+        self.assertTrue(CarritoItem.objects.exists())
+        otro = self.crear_libro('Otro')
+        self.client.post('/admin/app_libreria/categoria/', {
+            'action': 'delete_selected', '_selected_action': [self.categoria.pk], 'post': 'yes',
+        })
+        self.assertTrue(Categoria.todos.get(pk=self.categoria.pk).eliminado)
+        self.assertTrue(Libro.todos.get(pk=otro.pk).eliminado)
+
+    def test_la_purga_de_libros_borra_sus_filas_y_conserva_las_ventas(self):
+        libro, otro = self.crear_libro(), self.crear_libro('Otro')
+        sucursal = self.surtir(libro, 5)
+        self.surtir(otro, 2, sucursal)
+        self.assertTrue(reservar('c:prueba', libro.pk, 2))
+        CarritoItem.objects.create(usuario=self.crear_usuario(), libro=libro)
+        Recomendacion.objects.create(libro=otro, recomendado=libro, puntaje=1, posicion=0)
+        pedido = self.crear_pedido([libro])
+        Libro.objects.filter(pk=libro.pk).update(eliminado=True)
+        self.purgar()
+        self.assertFalse(Libro.todos.filter(pk=libro.pk).exists())
+        for model in (CarritoItem, Reserva, Inventario, ExistenciaSucursal, MovimientoStock):
+            self.assertFalse(model.objects.filter(libro_id=libro.pk).exists(), model)
+        self.assertFalse(Recomendacion.objects.exists())
+        self.assertIsNone(DetallePedido.objects.get(pedido=pedido).libro_id)
+        # Los totales de la sucursal solo conservan al libro que quedó
+        sucursal.refresh_from_db()
+        self.assertEqual((sucursal.cantidad, sucursal.reservado), (2, 0))
+
+    def test_la_categoria_se_purga_despues_de_sus_libros(self):
+        self.crear_libro()
+        Categoria.objects.filter(pk=self.categoria.pk).update(eliminado=True)
+        self.purgar()
+        self.assertTrue(Categoria.todos.filter(pk=self.categoria.pk).exists())  # Todavía tiene un libro vivo
+        Libro.objects.update(eliminado=True)
+        self.purgar()
+        self.assertFalse(Categoria.todos.filter(pk=self.categoria.pk).exists())
+
+    def test_la_purga_de_usuarios_suelta_sus_reservas_y_borra_sus_pedidos(self):
+        usuario = self.crear_usuario()
+        libro = self.crear_libro()
+        sucursal = self.surtir(libro, 3)
+        self.assertTrue(reservar(clave_usuario(usuario.pk), libro.pk, 2))
+        self.crear_pedido([libro], usuario=usuario)
+        PedidoArchivado.objects.create(id=999, usuario_id=usuario.pk, direccion='-', total=1, fecha=timezone.now())
+        UsuarioEliminado.objects.create(usuario=usuario)
+        self.purgar()
+        self.assertFalse(User.objects.filter(pk=usuario.pk).exists())
+        self.assertFalse(Pedido.objects.exists())
+        self.assertFalse(PedidoArchivado.objects.exists())
+        self.assertEqual(self.existencia(libro, sucursal).reservado, 0)
+
+    def test_max_lotes_detiene_la_purga(self):
+        for i in range(3):
+            self.crear_libro(f'Libro {i}', eliminado=True)
+        self.purgar('--lote', 1, '--max-lotes', 2)
+        self.assertEqual(Libro.todos.count(), 1)
+
+
+# =======================================================
+# RESERVAS DE STOCK
+# =======================================================
+
+class ReservasTests(PruebaLibreria):
+
+    def setUp(self):
+        super().setUp()
+        self.libro = self.crear_libro()
+        self.sucursal = self.surtir(self.libro, 2)
+
+    def totales(self):
+        existencia = self.existencia(self.libro, self.sucursal)
+        inventario = Inventario.objects.get(libro=self.libro)
+        sucursal = Sucursal.objects.get(pk=self.sucursal.pk)
+        return [(fila.cantidad, fila.reservado) for fila in (existencia, inventario, sucursal)]
+
+    def test_no_se_aparta_mas_de_lo_que_hay(self):
+        self.assertTrue(reservar('c:a', self.libro.pk))
+        self.assertTrue(reservar('c:b', self.libro.pk))
+        self.assertFalse(reservar('c:c', self.libro.pk))
+        self.assertFalse(reservar('c:a', self.libro.pk, 5))
+        self.assertEqual(self.totales(), [(2, 2)] * 3)
+        self.assertEqual(sorted(Reserva.objects.values_list('clave', 'cantidad')), [('c:a', 1), ('c:b', 1)])
+
+    def test_el_update_condicional_no_confia_en_lo_que_se_leyo_antes(self):
+        # Dos peticiones ven la misma unidad libre; solo la primera en escribir se la lleva
+        vista_a = vista_b = self.existencia(self.libro, self.sucursal)
+        self.assertEqual((vista_a.disponible, vista_b.disponible), (2, 2))
+        self.assertTrue(apartar(self.sucursal.pk, self.libro.pk, 2))
+        self.assertFalse(apartar(self.sucursal.pk, self.libro.pk, 1))
+        self.assertEqual(self.totales(), [(2, 2)] * 3)
+
+    def test_una_venta_sin_reserva_no_toma_lo_apartado(self):
+        self.assertTrue(reservar('c:a', self.libro.pk, 2))
+        with self.assertRaises(SinExistencias) as error, transaction.atomic():
+            confirmar(['c:otro'], {self.libro.pk: 1})
+        self.assertEqual(error.exception.libro_ids, [self.libro.pk])
+        self.assertEqual(self.totales(), [(2, 2)] * 3)
+
+    def test_confirmar_convierte_la_reserva_en_venta(self):
+        self.assertTrue(reservar('c:a', self.libro.pk, 2))
+        with transaction.atomic():
+            self.assertEqual(confirmar(['c:a'], {self.libro.pk: 2}), self.sucursal.pk)
+        self.assertEqual(self.totales(), [(0, 0)] * 3)
+        self.assertFalse(Reserva.objects.exists())
+        self.assertEqual(list(MovimientoStock.objects.filter(tipo='venta').values_list('cantidad', flat=True)), [-2])
+
+    def test_liberar_y_caducar_devuelven_las_unidades(self):
+        reservar('c:a', self.libro.pk)
+        reservar('c:b', self.libro.pk)
+        self.assertEqual(liberar(['c:a']), 1)
+        self.assertEqual(self.totales(), [(2, 1)] * 3)
+        self.assertEqual(expirar(ahora=timezone.now()), 0)
+        self.assertEqual(expirar(ahora=timezone.now() + timedelta(minutes=16)), 1)
+        self.assertEqual(self.totales(), [(2, 0)] * 3)
+
+    def test_el_comando_libera_las_caducadas_por_lotes(self):
+        reservar('c:a', self.libro.pk)
+        reservar('c:b', self.libro.pk)
+        Reserva.objects.update(expira=timezone.now() - timedelta(minutes=1))
+        salida = StringIO()
+        call_command('expire_reservations', '--lote', 1, '--pausa', 0, stdout=salida)
+        self.assertIn('Reservas liberadas: 2', salida.getvalue())
+        self.assertEqual(self.totales(), [(2, 0)] * 3)
+
+    def test_en_el_admin_son_de_solo_lectura_y_borrarlas_suelta_las_unidades(self):
+        reservar('c:a', self.libro.pk)
+        reservar('c:b', self.libro.pk)
+        self.entrar_como_admin()
+        reserva = Reserva.objects.get(clave='c:a')
+        self.assertEqual(self.client.get('/admin/app_libreria/reserva/add/').status_code, 403)
+        respuesta = self.client.get(f'/admin/app_libreria/reserva/{reserva.pk}/change/')
+        self.assertFalse(respuesta.context['has_change_permission'])
+        self.client.post(f'/admin/app_libreria/reserva/{reserva.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(self.totales(), [(2, 1)] * 3)
+        self.client.post('/admin/app_libreria/reserva/', {
+            'action': 'delete_selected', '_selected_action': [Reserva.objects.get().pk], 'post': 'yes',
+        })
+        self.assertEqual(self.totales(), [(2, 0)] * 3)
+        self.assertFalse(Reserva.objects.exists())
+
+    def test_el_carrito_junta_sus_reservas_en_una_sucursal(self):
+        # Norte tiene menos prioridad que Centro, pero ya tiene apartado lo demás del carrito
+        otro = self.crear_libro('Otro', categoria=self.libro.categoria)
+        norte = self.crear_sucursal('Norte', prioridad=1)
+        self.surtir(otro, 1, norte)
+        self.surtir(self.libro, 1, norte)
+        self.assertTrue(reservar('c:a', otro.pk))
+        self.assertTrue(reservar('c:a', self.libro.pk))
+        self.assertTrue(reservar('c:b', self.libro.pk))
+        self.assertEqual(Reserva.objects.get(clave='c:a', libro=self.libro).sucursal_id, norte.pk)
+        self.assertEqual(Reserva.objects.get(clave='c:b').sucursal_id, self.sucursal.pk)
+
+    def test_libros_sin_inventario_no_llevan_reservas(self):
+        libre = self.crear_libro('Sin control', categoria=self.libro.categoria)
+        self.assertTrue(reservar('c:a', libre.pk))
+        self.assertFalse(Reserva.objects.filter(libro=libre).exists())
+
+    def test_pagar_el_carrito(self):
+        usuario = self.crear_usuario()
+        self.client.force_login(usuario)
+        self.client.get(f'/agregar/{self.libro.pk}/')
+        respuesta = self.client.post('/carrito/', {'direccion': 'Calle 1'})
+        self.assertRedirects(respuesta, '/dashboard/', fetch_redirect_response=False)
+        pedido = Pedido.objects.get(usuario=usuario)
+        self.assertEqual(pedido.sucursal_id, self.sucursal.pk)
+        self.assertEqual(pedido.total, Decimal('116.00'))
+        self.assertEqual(self.totales(), [(1, 0)] * 3)
+        self.assertFalse(Reserva.objects.exists())
+
+
+@override_settings(CACHES=CACHE_PRUEBAS)
+class SobreventaConcurrenteTests(DatosDePrueba, TransactionTestCase):
+    """Varios hilos, cada uno con su conexión, compiten por las mismas unidades."""
+
+    HILOS = 8
+    INTENTOS = 100
+
+    def test_nunca_se_apartan_mas_unidades_de_las_que_hay(self):
+        libro = self.crear_libro('Último ejemplar')
+        sucursal = self.surtir(libro, 3)
+        salida = threading.Barrier(self.HILOS)
+        resultados = []
+
+        def comprador(numero):
+            try:
+                salida.wait()
+                for intento in range(self.INTENTOS):
+                    try:
+                        resultados.append(reservar(clave_carrito(f'hilo-{numero}'), libro.pk))
+                        return
+                    except OperationalError:  # SQLite: la base está ocupada por otra escritura
+                        if intento == self.INTENTOS - 1:
+                            raise
+            finally:
+                connections.close_all()
+
+        hilos = [threading.Thread(target=comprador, args=(i,)) for i in range(self.HILOS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(sorted(resultados), [False] * (self.HILOS - 3) + [True] * 3)
+        existencia = ExistenciaSucursal.objects.get(libro=libro)
+        self.assertEqual((existencia.cantidad, existencia.reservado), (3, 3))
+        self.assertEqual(Inventario.objects.get(libro=libro).reservado, 3)
+        self.assertEqual(Sucursal.objects.get(pk=sucursal.pk).reservado, 3)
+        self.assertEqual(Reserva.objects.count(), 3)
+
+
+# =======================================================
+# EVENTOS DEL INVENTARIO EN VIVO
+# =======================================================
+
+class EventosTests(PruebaLibreria):
+
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def suscribir(self):
+        async def suscribir():
+            return eventos.hub.suscribir()
+        suscripcion = self.loop.run_until_complete(suscribir())
+        self.addCleanup(eventos.hub.cancelar, suscripcion)
+        return suscripcion
+
+    def recibir(self, suscripcion, timeout=1):
+        return self.loop.run_until_complete(suscripcion.siguientes(timeout))
+
+    def test_solo_llega_el_ultimo_estado_de_cada_fila(self):
+        suscripcion = self.suscribir()
+        eventos.hub.publicar(1, 'inventario', {'cantidad': 5})
+        eventos.hub.publicar(2, 'inventario', {'cantidad': 1})
+        eventos.hub.publicar(1, 'inventario', {'cantidad': 4})
+        self.assertEqual(self.recibir(suscripcion), [('inventario', {'cantidad': 4}), ('inventario', {'cantidad': 1})])
+        self.assertEqual(self.recibir(suscripcion, timeout=0.01), [])
+
+    def test_sin_pestanas_abiertas_no_se_agenda_nada(self):
+        libro = self.crear_libro()
+        self.surtir(libro, 2)
+        with self.captureOnCommitCallbacks() as callbacks:
+            reservar('c:a', libro.pk)
+        self.assertEqual(callbacks, [])
+
+    def test_una_reserva_publica_la_fila_tras_el_commit(self):
+        libro = self.crear_libro()
+        self.surtir(libro, 2)
+        suscripcion = self.suscribir()
+        with self.captureOnCommitCallbacks(execute=True):
+            reservar('c:a', libro.pk)
+            self.assertEqual(suscripcion.pendientes, {})
+        (tipo, datos), = self.recibir(suscripcion)
+        self.assertEqual(tipo, 'inventario')
+        self.assertEqual((datos['libro_id'], datos['cantidad'], datos['reservado']), (libro.pk, 2, 1))
+
+    def test_el_flujo_manda_eventos_y_latidos_y_al_cerrar_se_desuscribe(self):
+        suscripcion = self.suscribir()
+        flujo = eventos.flujo_sse(suscripcion)
+        with mock.patch.object(eventos, 'HEARTBEAT_SEGUNDOS', 0.01):
+            self.assertEqual(self.loop.run_until_complete(anext(flujo)), f'retry: {eventos.RETRY_MS}\n\n')
+            eventos.hub.publicar(7, 'inventario-borrado', {'id': 7})
+            self.assertEqual(self.loop.run_until_complete(anext(flujo)), 'event: inventario-borrado\ndata: {"id": 7}\n\n')
+            self.assertEqual(self.loop.run_until_complete(anext(flujo)), ': ping\n\n')
+        self.loop.run_until_complete(flujo.aclose())
+        self.assertNotIn(suscripcion, eventos.hub._suscripciones)
+
+    def test_la_vista_es_solo_para_administradores_y_bajo_wsgi_responde_204(self):
+        self.client.force_login(self.crear_usuario())
+        self.assertEqual(self.client.get('/admin-panel/inventario/eventos/').status_code, 403)
+        self.entrar_como_admin()
+        self.assertEqual(self.client.get('/admin-panel/inventario/eventos/').status_code, 204)
+
+    async def test_bajo_asgi_abre_el_flujo_de_eventos(self):
+        admin = await sync_to_async(self.crear_usuario)('admin', is_superuser=True)
+        await self.async_client.aforce_login(admin)
+        respuesta = await self.async_client.get('/admin-panel/inventario/eventos/')
+        # El servidor ASGI cancela el flujo al desconectarse el navegador; aquí nadie lo hace
+        self.addCleanup(eventos.hub._suscripciones.clear)
+        self.assertEqual((respuesta.status_code, respuesta['Content-Type']), (200, 'text/event-stream'))
+        self.assertEqual(len(eventos.hub), 1)
+        self.assertEqual(await anext(respuesta.streaming_content), f'retry: {eventos.RETRY_MS}\n\n'.encode())
+
+
+# =======================================================
+# PÁGINAS PRE-RENDERIZADAS
+# =======================================================
+
+class PrerenderTests(PruebaLibreria):
+
+    def setUp(self):
+        super().setUp()
+        self.base = Path(tempfile.mkdtemp(dir=self.directorio))
+        self.enterContext(override_settings(PRERENDER_DIR=self.base))
+        self.categoria = self.crear_categoria('Poesía')
+        self.libro = self.crear_libro('Muerte sin fin')
+
+    def generar(self, *args):
+        invalidar_catalogo()
+        salida = StringIO()
+        call_command('prerender_catalog', '--workers', 1, *args, stdout=salida)
+        return salida.getvalue()
+
+    def pagina(self, categoria):
+        return self.base / 'categoria' / str(categoria.pk) / 'index.html'
+
+    def test_sin_paginas_generadas_no_se_anotan_cambios(self):
+        self.assertFalse(prerender.activo())
+        self.libro.save()
+        self.assertFalse(CambioCatalogo.objects.exists())
+        # Lo que haya quedado de antes lo vacía la limpieza periódica
+        CambioCatalogo.objects.create(tipo='portada')
+        self.assertEqual(borrar_cambios_catalogo(pausa=0), 1)
+
+    def test_la_primera_corrida_es_completa(self):
+        self.assertIn('3 páginas completas', self.generar())
+        self.assertTrue((self.base / 'index.html').exists())
+        self.assertTrue((self.base / 'dashboard' / 'index.html').exists())
+        self.assertIn('Muerte sin fin', self.pagina(self.categoria).read_text(encoding='utf-8'))
+        self.assertTrue(prerender.activo())
+
+    def test_despues_solo_se_regeneran_las_categorias_tocadas(self):
+        otra = self.crear_categoria('Novela')
+        self.generar()
+        intacta = self.pagina(otra).stat().st_mtime_ns
+        self.libro.titulo = 'Gorostiza'
+        self.libro.save()
+        self.assertEqual(list(CambioCatalogo.objects.values_list('tipo', 'categoria_id')), [('categoria', self.categoria.pk)])
+        self.assertEqual(borrar_cambios_catalogo(pausa=0), 0)  # Con páginas vivas la bitácora no se toca
+        self.assertIn('1 páginas incrementales', self.generar())
+        self.assertIn('Gorostiza', self.pagina(self.categoria).read_text(encoding='utf-8'))
+        self.assertEqual(self.pagina(otra).stat().st_mtime_ns, intacta)
+        self.assertFalse(CambioCatalogo.objects.exists())
+        self.assertIn('Sin cambios pendientes', self.generar())
+
+    def test_cambiar_de_categoria_regenera_las_dos(self):
+        otra = self.crear_categoria('Novela')
+        self.generar()
+        self.libro.categoria = otra
+        self.libro.save()
+        self.assertEqual(set(CambioCatalogo.objects.values_list('categoria_id', flat=True)), {self.categoria.pk, otra.pk})
+        self.generar()
+        self.assertNotIn('Muerte sin fin', self.pagina(self.categoria).read_text(encoding='utf-8'))
+        self.assertIn('Muerte sin fin', self.pagina(otra).read_text(encoding='utf-8'))
+
+    def test_la_corrida_completa_borra_paginas_huerfanas(self):
+        otra = self.crear_categoria('Novela')
+        self.generar()
+        Categoria.objects.filter(pk=otra.pk).update(eliminado=True)  # Sin señales: no llega a la bitácora
+        self.assertIn('1 huérfanas borradas', self.generar('--completo'))
+        self.assertFalse(self.pagina(otra).parent.exists())
+        self.assertTrue(self.pagina(self.categoria).exists())
+
+    @override_settings(PRERENDER_SERVIR=True)
+    def test_el_middleware_sirve_la_pagina_sin_tocar_la_base(self):
+        self.generar()
+        Libro.objects.filter(pk=self.libro.pk).update(titulo='Cambiado sin regenerar')
+        with self.assertNumQueries(0):
+            respuesta = self.client.get(f'/categoria/{self.categoria.pk}/')
+            contenido = b''.join(respuesta.streaming_content).decode()
+        self.assertIn('Muerte sin fin', contenido)
+        # Con parámetros o avisos pendientes pasa a la vista
+        self.assertEqual(self.client.get(f'/categoria/{self.categoria.pk}/', {'page': 1}).templates[0].name,
+                         'libreria/libros.html')
+
+
+# =======================================================
+# ARCHIVO DE PEDIDOS
+# =======================================================
+# TransactionTestCase: el lote se copia por la conexión principal (ATTACH) y
+# se verifica leyendo la de archivo; dentro de la transacción de TestCase la
+# otra conexión vería las tablas bloqueadas.
+
+@override_settings(CACHES=CACHE_PRUEBAS)
+class ArchivoTests(DatosDePrueba, TransactionTestCase):
+    databases = {'default', 'archivo'}
+
+    def setUp(self):
+        self.libros = [self.crear_libro(f'Libro {i}', precio=f'{10 + i}.50') for i in range(3)]
+        hace_un_anio = timezone.now() - timedelta(days=365)
+        self.viejos = [self.crear_pedido(self.libros[:i + 1], fecha=hace_un_anio + timedelta(days=i)) for i in range(3)]
+        self.reciente = self.crear_pedido(self.libros[:1])
+
+    def archivar(self, *args):
+        salida = StringIO()
+        call_command('archive_orders', '--older-than', '6m', '--pausa', 0, *args, stdout=salida)
+        return salida.getvalue()
+
+    def dinero(self, pedidos, lineas):
+        return (pedidos.aggregate(s=Sum('total'))['s'], lineas.aggregate(s=Sum('precio_unitario'))['s'])
+
+    def test_mueve_los_pedidos_viejos_con_sus_lineas_sin_perder_dinero(self):
+        viejos = [p.pk for p in self.viejos]
+        antes = self.dinero(Pedido.objects.filter(pk__in=viejos), DetallePedido.objects.filter(pedido_id__in=viejos))
+        salida = self.archivar('--lote', 2)
+        self.assertIn('3 pedidos y 6 líneas archivados', salida)
+        self.assertIn('Conteos verificados', salida)
+        self.assertEqual(list(Pedido.objects.values_list('pk', flat=True)), [self.reciente.pk])
+        self.assertEqual(sorted(PedidoArchivado.objects.values_list('pk', flat=True)), viejos)
+        self.assertEqual(self.dinero(PedidoArchivado.objects.all(), DetallePedidoArchivado.objects.all()), antes)
+        self.assertEqual(DetallePedido.objects.count(), 1)
+        # Repetir no duplica nada
+        self.assertIn('Pedidos anteriores', self.archivar())
+        self.assertEqual(PedidoArchivado.objects.count(), 3)
+
+    def test_sin_attach_copia_verifica_y_luego_borra(self):
+        with mock.patch('app_libreria.archivo._ambas_sqlite', return_value=False):
+            self.archivar()
+        self.assertEqual(PedidoArchivado.objects.count(), 3)
+        self.assertEqual(DetallePedidoArchivado.objects.count(), 6)
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def test_si_la_verificacion_falla_el_lote_se_revierte(self):
+        with mock.patch('app_libreria.archivo.Archivador._verificar', side_effect=archivo.ErrorVerificacion('no cuadra')):
+            with self.assertRaisesMessage(CommandError, 'lote revertido'):
+                self.archivar()
+        self.assertEqual(Pedido.objects.count(), 4)
+        self.assertEqual(DetallePedido.objects.count(), 7)
+        self.assertFalse(PedidoArchivado.objects.exists())
+
+    def test_dry_run_y_max_lotes(self):
+        self.assertIn(': 3', self.archivar('--dry-run'))
+        self.assertFalse(PedidoArchivado.objects.exists())
+        self.archivar('--lote', 1, '--max-lotes', 2)
+        self.assertEqual(PedidoArchivado.objects.count(), 2)
+
+    def test_antiguedad(self):
+        self.assertEqual(parsear_antiguedad('6m'), timedelta(days=180))
+        self.assertEqual(parsear_antiguedad(' 2Y '), timedelta(days=730))
+        self.assertEqual(parsear_antiguedad('90'), timedelta(days=90))
+        with self.assertRaises(CommandError):
+            parsear_antiguedad('seis meses')
+
+    def test_el_panel_solo_lee_el_archivo_si_se_pide(self):
+        self.archivar()
+        self.entrar_como_admin()
+        with self.assertNumQueries(0, using='archivo'):
+            self.assertEqual([p.pk for p in self.client.get('/admin-panel/pedidos/').context['pedidos']],
+                             [self.reciente.pk])
+        archivados = self.client.get('/admin-panel/pedidos/', {'archivados': '1'}).context['pedidos']
+        self.assertEqual(sorted(p.pk for p in archivados), [p.pk for p in self.viejos])
+
+
+# =======================================================
+# RESPALDOS EN CALIENTE
+# =======================================================
+# Se respalda una base SQLite propia en el directorio temporal: la de las
+# pruebas vive en memoria y la API de backup necesita un archivo.
+
+class RespaldoTests(PruebaLibreria):
+
+    def setUp(self):
+        super().setUp()
+        self.base = self.directorio / 'tienda.sqlite3'
+        self.escribir('CREATE TABLE libro (id INTEGER PRIMARY KEY, titulo TEXT)',
+                      *[f"INSERT INTO libro (titulo) VALUES ('{'x' * 1000}-{i}')" for i in range(200)])
+        self.addCleanup(self.base.unlink)
+        self.destino = self.directorio / 'respaldos'
+        self.addCleanup(shutil.rmtree, self.destino, ignore_errors=True)
+        self.base_principal = respaldo.base_principal
+        self.enterContext(mock.patch('app_libreria.respaldo.base_principal', return_value=str(self.base)))
+
+    def escribir(self, *sentencias, ruta=None):
+        conexion = sqlite3.connect(ruta or self.base, timeout=30)
+        try:
+            with conexion:
+                for sentencia in sentencias:
+                    conexion.execute(sentencia)
+        finally:
+            conexion.close()
+
+    def titulos(self, ruta=None):
+        conexion = sqlite3.connect(ruta or self.base)
+        try:
+            return [fila[0] for fila in conexion.execute('SELECT titulo FROM libro ORDER BY id')]
+        finally:
+            conexion.close()
+
+    def test_copia_por_pasos_con_los_mismos_datos(self):
+        copia_ruta = self.directorio / 'copia.sqlite3'
+        self.addCleanup(copia_ruta.unlink)
+        copia = respaldo.copiar(str(self.base), copia_ruta, paginas=1, pausa=0)
+        self.assertGreater(copia.pasos, 1)
+        self.assertEqual((copia.reinicios, copia.un_paso), (0, False))
+        self.assertEqual(copia.bytes, copia_ruta.stat().st_size)
+        self.assertEqual(self.titulos(copia_ruta), self.titulos())
+
+    def test_escrituras_a_mitad_reinician_y_al_final_copia_de_un_paso(self):
+        copia_ruta = self.directorio / 'copia.sqlite3'
+        self.addCleanup(copia_ruta.unlink)
+        escritas = []
+
+        def al_avanzar(copiadas, total):
+            escritas.append(copiadas)
+            self.escribir(f"INSERT INTO libro (titulo) VALUES ('nuevo {len(escritas)}')")
+
+        copia = respaldo.copiar(str(self.base), copia_ruta, paginas=1, pausa=0, al_avanzar=al_avanzar)
+        self.assertEqual(copia.reinicios, respaldo.MAX_REINICIOS)
+        self.assertTrue(copia.un_paso)
+        # La pasada final ve todo lo escrito antes de empezar
+        self.assertEqual(self.titulos(copia_ruta), self.titulos())
+
+    def test_integridad_de_un_archivo_que_no_es_base(self):
+        basura = self.directorio / 'basura.sqlite3'
+        basura.write_bytes(b'no soy una base SQLite' * 100)
+        self.addCleanup(basura.unlink)
+        with self.assertRaisesMessage(respaldo.ErrorRespaldo, 'no se pudo leer'):
+            respaldo.verificar_integridad(basura)
+
+    def test_respalda_comprimido_rota_y_no_deja_temporales(self):
+        self.destino.mkdir()
+        for i in range(3):
+            (self.destino / f'db-2020010{i}-000000.sqlite3.gz').write_bytes(b'')
+        r = respaldo.respaldar(self.destino, paginas=8, pausa=0, compresion='gz', conservar=2)
+        self.assertTrue(r.archivo.name.endswith('.sqlite3.gz'))
+        self.assertEqual([a.name for a in r.borrados], ['db-20200101-000000.sqlite3.gz', 'db-20200100-000000.sqlite3.gz'])
+        self.assertEqual(sorted(self.destino.iterdir()),
+                         sorted([r.archivo, self.destino / 'db-20200102-000000.sqlite3.gz']))
+        with gzip.open(r.archivo) as entrada:
+            self.assertEqual(entrada.read(16), b'SQLite format 3\x00')
+
+    def test_restaurar_regresa_los_datos_respaldados(self):
+        originales = self.titulos()
+        r = respaldo.respaldar(self.destino, pausa=0, compresion='xz', conservar=0)
+        self.escribir('DELETE FROM libro WHERE id > 10', "UPDATE libro SET titulo = 'cambiado'")
+        respaldo.restaurar(r.archivo)
+        self.assertEqual(self.titulos(), originales)
+        self.assertEqual([a.name for a in self.directorio.iterdir() if a.name.startswith('.restaurar')], [])
+
+    def test_restaurar_un_respaldo_corrupto_no_toca_la_base(self):
+        originales = self.titulos()
+        self.destino.mkdir()
+        roto = self.destino / 'db-20200101-000000.sqlite3.gz'
+        roto.write_bytes(b'esto no es gzip')
+        with self.assertRaisesMessage(respaldo.ErrorRespaldo, 'no se pudo descomprimir'):
+            respaldo.restaurar(roto)
+        self.assertEqual(self.titulos(), originales)
+
+    def test_comando_restaura_el_ultimo(self):
+        originales = self.titulos()
+        salida = StringIO()
+        call_command('backup_db', '--destino', str(self.destino), '--pausa', 0, stdout=salida)
+        self.assertIn('Respaldo verificado', salida.getvalue())
+        self.escribir('DELETE FROM libro')
+        call_command('backup_db', '--destino', str(self.destino), '--restaurar', 'ultimo', '--noinput', stdout=salida)
+        self.assertIn('Base restaurada', salida.getvalue())
+        self.assertEqual(self.titulos(), originales)
+
+    def test_comando_sin_respaldos_o_sin_sqlite(self):
+        with self.assertRaisesMessage(CommandError, 'No hay respaldos'):
+            call_command('backup_db', '--destino', str(self.destino), '--restaurar', 'ultimo', '--noinput')
+        with mock.patch.dict(settings.DATABASES['default'], ENGINE='django.db.backends.postgresql'):
+            with self.assertRaisesMessage(respaldo.ErrorRespaldo, 'solo funciona con SQLite'):
+                self.base_principal()  # El original, sin el parche de setUp
+
+
+# =======================================================
+# PUNTOS DE REORDEN
+# =======================================================
+
+@skipIf(plan_reorders.np is None, 'requiere numpy')
+class PlanReordenTests(PruebaLibreria):
+
+    def planear(self, *args):
+        salida = StringIO()
+        call_command('plan_reorders', *args, stdout=salida)
+        return salida.getvalue()
+
+    def test_pesos_de_media_movil_y_exponencial(self):
+        np = plan_reorders.np
+        np.testing.assert_allclose(plan_reorders.pesos_por_dia(5, 'media', 0.1, 2), [0, 0, 0, 0.5, 0.5])
+        pesos = plan_reorders.pesos_por_dia(30, 'exponencial', 0.3, 28)
+        self.assertAlmostEqual(pesos.sum(), 1)
+        self.assertTrue((np.diff(pesos) > 0).all())  # Ayer pesa más que anteayer
+
+    def test_pronostico_cuenta_los_dias_sin_ventas_como_cero(self):
+        np = plan_reorders.np
+        pesos = plan_reorders.pesos_por_dia(4, 'media', 0.1, 2)
+        # Libro 0: 4 unidades ayer, nada anteayer; libro 1 sin ventas
+        media, desviacion = plan_reorders.pronosticar(np.array([0]), np.array([3]), np.array([4.0]), 2, pesos)
+        np.testing.assert_allclose(media, [2, 0])
+        np.testing.assert_allclose(desviacion, [2, 0])
+
+    def test_plan_pide_solo_en_o_bajo_el_punto(self):
+        np = plan_reorders.np
+        punto, sugerido = plan_reorders.planear(
+            disponible=np.array([0, 10, 11]), demanda=np.array([2.0, 2.0, 2.0]), desviacion=np.zeros(3),
+            entrega=np.array([5, 5, 5]), z=1.645, cobertura=10)
+        self.assertEqual(punto.tolist(), [10, 10, 10])
+        self.assertEqual(sugerido.tolist(), [30, 20, 0])
+
+    def test_valida_los_argumentos(self):
+        for args in (['--ventana', '0'], ['--dias', '0'], ['--cobertura', '-1'], ['--entrega-default', '-1'],
+                     ['--alfa', '1'], ['--nivel-servicio', '0']):
+            with self.subTest(args=args), self.assertRaises(CommandError):
+                self.planear(*args)
+
+    def test_recalcula_el_inventario_con_las_ventas(self):
+        proveedor = Proveedor.objects.create(nombre='Distribuidora', dias_entrega=4)
+        vendido = self.crear_libro('Vendido', proveedor=proveedor, precio='10.00')
+        quieto = self.crear_libro('Quieto')
+        self.surtir(vendido, 2)
+        self.surtir(quieto, 50)
+        ayer = timezone.now() - timedelta(days=1)
+        for _ in range(3):
+            self.crear_pedido([vendido], fecha=ayer)
+        self.crear_pedido([vendido], fecha=ayer - timedelta(days=1))  # Fuera de la ventana de 1 día
+
+        args = ['--metodo', 'media', '--ventana', '1', '--dias', '7', '--cobertura', '10']
+        self.assertIn('Distribuidora', self.planear(*args, '--dry-run'))
+        self.assertEqual(Inventario.objects.get(libro=vendido).pedido_sugerido, 0)
+
+        ruta = self.directorio / 'pedido.csv'
+        self.addCleanup(ruta.unlink)
+        self.assertIn('2 filas de inventario actualizadas', self.planear(*args, '--csv', str(ruta)))
+        # 3 diarios x 4 días de entrega = 12; más 30 de cobertura, menos los 2 que hay
+        inventario = Inventario.objects.get(libro=vendido)
+        self.assertEqual((inventario.stock_minimo, inventario.demanda_diaria, inventario.pedido_sugerido), (12, 3, 40))
+        self.assertEqual(Inventario.objects.get(libro=quieto).stock_minimo, 0)
+        lineas = ruta.read_text(encoding='utf-8').splitlines()
+        self.assertEqual(len(lineas), 2)
+        self.assertTrue(lineas[1].startswith(f'Distribuidora,{vendido.pk},'))
+        # Sin cambios, no se vuelve a escribir
+        self.assertIn('0 filas de inventario actualizadas', self.planear(*args))
+
+
+# =======================================================
+# COMPRESIÓN Y MINIFICACIÓN
+# =======================================================
+
+class CompresionTests(PruebaLibreria):
+    HTML = '<html><body>\n' + '    <p>  Pedro   Páramo  </p>\n' * 200 + '</body></html>'
+
+    def responder(self, respuesta, **cabeceras):
+        peticion = RequestFactory().get('/', **cabeceras)
+        return CompresionMiddleware(lambda request: respuesta)(peticion)
+
+    def test_minificar_css_respeta_cadenas_y_url(self):
+        css = '''a  {  color: red ;  }\n/* fuera */ b > i , p { content: "  dos  ;  espacios "; background: url(  a b.png  ) }'''
+        self.assertEqual(compresion.minificar_css(css),
+                         'a{color: red}b>i,p{content: "  dos  ;  espacios ";background: url(  a b.png  )}')
+
+    def test_minificar_html_deja_intactos_pre_y_script(self):
+        html = ('<div>\n   <p>hola    mundo</p>\n  <!-- nota -->\n<!--[if IE]>viejo<![endif]-->\n'
+                '<pre>  a\n   b </pre>\n<style> a { color : red ; } </style>\n<script> var  x = 1 ;  </script></div>')
+        self.assertEqual(compresion.minificar_html(html),
+                         '<div>\n<p>hola mundo</p>\n<!--[if IE]>viejo<![endif]-->\n<pre>  a\n   b </pre>\n'
+                         '<style>a{color : red}</style>\n<script> var  x = 1 ;  </script></div>')
+
+    def test_elegir_codificacion(self):
+        with mock.patch('app_libreria.compresion.brotli', object()):
+            self.assertEqual(compresion.elegir_codificacion('gzip, br'), 'br')
+            self.assertEqual(compresion.elegir_codificacion('gzip, br;q=0.5'), 'gzip')
+            self.assertEqual(compresion.elegir_codificacion('gzip, br', permitir_br=False), 'gzip')
+        with mock.patch('app_libreria.compresion.brotli', None):
+            self.assertEqual(compresion.elegir_codificacion('br'), None)
+        self.assertEqual(compresion.elegir_codificacion('GZIP;q=0.5, *'), 'gzip')
+        self.assertEqual(compresion.elegir_codificacion('*'), 'gzip')
+        for cabecera in ('', 'identity', '*;q=0', 'gzip;q=0', 'gzip;q=abc'):
+            self.assertIsNone(compresion.elegir_codificacion(cabecera), cabecera)
+
+    @override_settings(MINIFICAR_HTML=True)
+    def test_middleware_minifica_y_comprime_con_gzip(self):
+        respuesta = HttpResponse(self.HTML, headers={'ETag': '"v1"'})
+        respuesta = self.responder(respuesta, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(respuesta['Content-Encoding'], 'gzip')
+        self.assertEqual(respuesta['Vary'], 'Accept-Encoding')
+        self.assertEqual(respuesta['ETag'], 'W/"v1"')
+        self.assertEqual(respuesta['Content-Length'], str(len(respuesta.content)))
+        self.assertEqual(gzip.decompress(respuesta.content).decode(), compresion.minificar_html(self.HTML))
+
+    def test_middleware_deja_pasar_lo_que_no_conviene_comprimir(self):
+        pequena = self.responder(HttpResponse('<p>hola</p>'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(pequena.has_header('Content-Encoding'))
+        sin_aceptar = self.responder(HttpResponse(self.HTML))
+        self.assertFalse(sin_aceptar.has_header('Content-Encoding'))
+        eventos_sse = self.responder(HttpResponse(self.HTML, content_type='text/event-stream'),
+                                     HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(eventos_sse.has_header('Content-Encoding'))
+
+    def test_con_token_csrf_no_comprime_peticiones_de_otro_sitio(self):
+        def con_csrf():
+            respuesta = HttpResponse(self.HTML)
+            respuesta.set_cookie(settings.CSRF_COOKIE_NAME, 'token')
+            return respuesta
+
+        otro_sitio = self.responder(con_csrf(), HTTP_ACCEPT_ENCODING='gzip, br', HTTP_SEC_FETCH_SITE='cross-site')
+        self.assertFalse(otro_sitio.has_header('Content-Encoding'))
+        with mock.patch('app_libreria.compresion.brotli', object()):
+            mismo_sitio = self.responder(con_csrf(), HTTP_ACCEPT_ENCODING='gzip, br', HTTP_SEC_FETCH_SITE='same-origin')
+        self.assertEqual(mismo_sitio['Content-Encoding'], 'gzip')  # Nunca br junto al token
+
+    def test_streaming_se_comprime_por_partes(self):
+        respuesta = StreamingHttpResponse(iter([self.HTML.encode()] * 3))
+        respuesta = self.responder(respuesta, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(respuesta['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(respuesta.streaming_content)).decode(), self.HTML * 3)
+
+
+# =======================================================
+# ARRANQUE DE WORKERS
+# =======================================================
+
+class ArranqueTests(PruebaLibreria):
+
+    def test_solo_calienta_en_procesos_servidor(self):
+        with mock.patch.dict(os.environ, {'LIBRERIA_CALENTAR': '1'}):
+            self.assertTrue(arranque.calentamiento_activo())
+            with self.settings(ARRANQUE_CALENTAR=False):
+                self.assertFalse(arranque.calentamiento_activo())
+        with mock.patch.dict(os.environ, {'LIBRERIA_CALENTAR': '0'}):
+            self.assertFalse(arranque.calentamiento_activo())
+
+    def test_precompila_las_plantillas_de_ambos_motores(self):
+        # Sin crispy_forms instalado las plantillas que lo cargan se avisan y se saltan
+        avisos = self.enterContext(mock.patch.object(arranque.logger, 'warning'))
+        django_solo = arranque.precompilar_plantillas()
+        propias = len(list((Path(__file__).parent / 'templates').rglob('*.html')))
+        self.assertGreaterEqual(django_solo + avisos.call_count, propias)
+        with self.settings(TEMPLATES=plantillas_con_jinja2()):
+            self.assertGreater(arranque.precompilar_plantillas(), django_solo)
+
+    def test_una_plantilla_rota_no_tumba_el_arranque(self):
+        directorio = self.directorio / 'plantillas'
+        directorio.mkdir()
+        self.addCleanup(shutil.rmtree, directorio)
+        (directorio / 'bien.html').write_text('{{ libro }}')
+        (directorio / 'rota.html').write_text('{% if %}')
+        plantillas = [{'BACKEND': 'django.template.backends.django.DjangoTemplates', 'DIRS': [directorio]}]
+        with self.settings(TEMPLATES=plantillas), self.assertLogs('app_libreria.arranque', 'WARNING') as registro:
+            self.assertEqual(arranque.precompilar_plantillas(), 1)
+        self.assertIn('rota.html', registro.output[0])
+
+    def test_urls_y_caches_quedan_listos(self):
+        self.assertGreater(arranque.resolver_urls(), 0)
+        self.crear_libro()
+        self.assertEqual(arranque.calentar_caches()['libros'], 1)
+        with self.assertNumQueries(0):
+            obtener_catalogo()
+            sugerencias('ped')
+
+    def test_dentro_de_un_loop_el_orm_corre_en_otro_hilo(self):
+        async def desde_el_loop():
+            return arranque._sin_loop(threading.get_ident)
+
+        self.assertEqual(arranque._sin_loop(threading.get_ident), threading.get_ident())
+        self.assertNotEqual(asyncio.run(desde_el_loop()), threading.get_ident())
+
+    def test_despues_de_cargar(self):
+        with mock.patch('app_libreria.arranque.calentar_caches') as calentar, \
+                mock.patch('app_libreria.arranque.preparar_fork') as preparar:
+            with mock.patch.dict(os.environ, {'LIBRERIA_CALENTAR': '0'}):
+                arranque.despues_de_cargar()
+            calentar.assert_not_called()
+            with mock.patch.dict(os.environ, {'LIBRERIA_CALENTAR': '1', 'LIBRERIA_PRELOAD': '1'}):
+                # Sin base todavía: se avisa y se sigue con el preload
+                calentar.side_effect = OperationalError('no such table')
+                with self.assertLogs('app_libreria.arranque', 'WARNING'):
+                    arranque.despues_de_cargar()
+            calentar.assert_called_once()
+            preparar.assert_called_once()
+
+
+# =======================================================
+# EXISTENCIAS POR SUCURSAL Y TOTALES
+# =======================================================
+
+class SucursalesTests(PruebaLibreria):
+
+    def setUp(self):
+        super().setUp()
+        self.libro = self.crear_libro()
+        self.centro = self.crear_sucursal('Centro', prioridad=0)
+        self.norte = self.crear_sucursal('Norte', prioridad=1)
+
+    def totales(self, libro=None):
+        inventario = Inventario.objects.get(libro=libro or self.libro)
+        return inventario.cantidad, inventario.reservado
+
+    def de_sucursal(self, sucursal):
+        sucursal.refresh_from_db()
+        return sucursal.cantidad, sucursal.reservado
+
+    def assertCuadra(self):
+        self.assertEqual(recalcular_totales(guardar=False),
+                         {'inventarios': 0, 'sucursales': 0, 'inventarios faltantes': 0})
+
+    def test_cada_movimiento_lleva_su_delta_a_los_totales(self):
+        self.surtir(self.libro, 5, self.centro)
+        self.surtir(self.libro, 3, self.norte)
+        self.assertTrue(apartar(self.centro.pk, self.libro.pk, 2))
+        self.assertTrue(sucursales.sacar(self.norte.pk, self.libro.pk, 1))
+        soltar(self.centro.pk, self.libro.pk, 1)
+        fijar(self.norte.pk, self.libro.pk, 10)
+        self.assertEqual(self.totales(), (15, 1))
+        self.assertEqual(self.de_sucursal(self.centro), (5, 1))
+        self.assertEqual(self.de_sucursal(self.norte), (10, 0))
+        self.assertCuadra()
+        self.assertEqual(MovimientoStock.objects.aggregate(t=Sum('cantidad'))['t'], 15)
+
+    def test_no_se_vende_ni_se_aparta_lo_reservado(self):
+        self.surtir(self.libro, 3, self.centro)
+        self.assertTrue(apartar(self.centro.pk, self.libro.pk, 2))
+        self.assertFalse(apartar(self.centro.pk, self.libro.pk, 2))
+        self.assertFalse(sucursales.sacar(self.centro.pk, self.libro.pk, 2))
+        self.assertEqual(self.totales(), (3, 2))
+        self.assertCuadra()
+
+    def test_sacar_por_partes_sigue_la_prioridad(self):
+        self.surtir(self.libro, 2, self.norte)
+        self.surtir(self.libro, 3, self.centro)
+        self.assertTrue(sucursales.sacar_por_partes(self.libro.pk, 4))
+        self.assertEqual((self.existencia(self.libro, self.centro).cantidad,
+                          self.existencia(self.libro, self.norte).cantidad), (0, 1))
+        self.assertFalse(sucursales.sacar_por_partes(self.libro.pk, 2))
+        self.assertCuadra()
+
+    def test_borrar_una_sucursal_descuenta_sus_existencias(self):
+        self.surtir(self.libro, 5, self.centro)
+        self.surtir(self.libro, 3, self.norte)
+        apartar(self.centro.pk, self.libro.pk, 2)
+        apartar(self.norte.pk, self.libro.pk, 1)
+        self.centro.delete()  # Cascada: post_delete de cada existencia
+        self.assertEqual(self.totales(), (3, 1))
+        self.assertEqual(self.de_sucursal(self.norte), (3, 1))
+        self.assertEqual(MovimientoStock.objects.filter(tipo='ajuste').get().cantidad, -5)
+        self.assertCuadra()
+
+    def test_borrar_las_existencias_de_un_libro(self):
+        otro = self.crear_libro('Rayuela', categoria=self.libro.categoria)
+        self.surtir(self.libro, 5, self.centro)
+        self.surtir(otro, 4, self.centro)
+        sucursales.borrar_existencias(self.libro.pk)
+        self.assertFalse(Inventario.objects.filter(libro=self.libro).exists())
+        self.assertEqual(self.de_sucursal(self.centro), (4, 0))
+        # Borrado masivo sin señales (purge_deleted): se descuenta aparte
+        sucursales.descontar_libros([otro.pk])
+        borrar_en(ExistenciaSucursal, 'libro_id', [otro.pk])
+        self.assertEqual(self.de_sucursal(self.centro), (0, 0))
+
+    def test_recalcular_corrige_lo_desalineado(self):
+        self.surtir(self.libro, 5, self.centro)
+        otro = self.crear_libro('Rayuela', categoria=self.libro.categoria)
+        self.surtir(otro, 2, self.norte)
+        Inventario.objects.filter(libro=self.libro).update(cantidad=99)
+        Sucursal.objects.filter(pk=self.norte.pk).update(reservado=7)
+        Inventario.objects.filter(libro=otro).delete()
+
+        salida = StringIO()
+        call_command('rebuild_stock_totals', '--dry-run', stdout=salida)
+        self.assertIn('Desalineados (inventarios): 1', salida.getvalue())
+        self.assertIn('Desalineados (sucursales): 1', salida.getvalue())
+        self.assertIn('Desalineados (inventarios faltantes): 1', salida.getvalue())
+        self.assertEqual(self.totales(), (99, 0))
+
+        call_command('rebuild_stock_totals', stdout=StringIO())
+        self.assertEqual(self.totales(), (5, 0))
+        self.assertEqual(self.totales(otro), (2, 0))
+        self.assertEqual(self.de_sucursal(self.norte), (2, 0))
+        self.assertCuadra()
+
+    def test_bajo_minimo_por_sucursal(self):
+        otro = self.crear_libro('Rayuela', categoria=self.libro.categoria)
+        fijar(self.centro.pk, self.libro.pk, 2, stock_minimo=2)
+        fijar(self.norte.pk, self.libro.pk, 3, stock_minimo=2)
+        fijar(self.centro.pk, otro.pk, 0)  # Sin mínimo: no cuenta aunque esté en cero
+        self.assertEqual(list(bajo_minimo().values_list('sucursal_id', 'libro_id')), [(self.centro.pk, self.libro.pk)])
+        # Cambiar solo la cantidad conserva el mínimo
+        fijar(self.norte.pk, self.libro.pk, 1)
+        self.assertEqual(bajo_minimo().count(), 2)
+
+    def test_editar_inventario_en_el_panel_no_pisa_los_totales(self):
+        self.surtir(self.libro, 10, self.centro)
+        self.surtir(self.libro, 4, self.norte)
+        apartar(self.norte.pk, self.libro.pk, 3)
+        inventario = Inventario.objects.get(libro=self.libro)
+        self.entrar_como_admin()
+        formulario = self.client.get(f'/admin-panel/inventario/editar/{inventario.pk}/').context['form']
+        self.assertEqual(formulario.initial['sucursal'], self.centro.pk)
+        respuesta = self.client.post(f'/admin-panel/inventario/editar/{inventario.pk}/', {
+            'sucursal': self.centro.pk, 'movimiento': 'ajuste', 'cantidad': 6, 'minimo_sucursal': 7,
+            'stock_minimo': 8,
+        })
+        self.assertEqual(respuesta.status_code, 302)
+        inventario.refresh_from_db()
+        self.assertEqual((inventario.cantidad, inventario.reservado, inventario.stock_minimo), (10, 3, 8))
+        self.assertEqual(self.existencia(self.libro, self.centro).stock_minimo, 7)
+        tablero = self.client.get('/admin-panel/').context
+        por_sucursal = {s.pk: s.bajo_minimo for s in tablero['sucursales']}
+        self.assertEqual((por_sucursal[self.centro.pk], por_sucursal[self.norte.pk]), (1, 0))
+        self.assertCuadra()
+
+    def test_registrar_en_otra_sucursal_un_libro_con_inventario(self):
+        self.surtir(self.libro, 10, self.centro)
+        self.entrar_como_admin()
+        formulario = self.client.get('/admin-panel/inventario/crear/').context['form']
+        self.assertEqual(list(formulario.fields)[0], 'libro')
+        respuesta = self.client.post('/admin-panel/inventario/crear/', {
+            'libro': self.libro.pk, 'sucursal': self.norte.pk, 'movimiento': 'entrada', 'cantidad': 4,
+            'minimo_sucursal': '', 'stock_minimo': 6,
+        })
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(self.existencia(self.libro, self.norte).cantidad, 4)
+        self.assertEqual(Inventario.objects.get(libro=self.libro).stock_minimo, 6)
+        self.assertEqual(self.totales(), (14, 0))
+        self.assertCuadra()
+
+
+# =======================================================
+# BITÁCORA DE MOVIMIENTOS DE STOCK
+# =======================================================
+
+class BitacoraTests(PruebaLibreria):
+
+    def setUp(self):
+        super().setUp()
+        self.libro = self.crear_libro()
+        self.centro = self.crear_sucursal()
+        self.inicio = timezone.now() - timedelta(days=100)
+
+    def dia(self, n):
+        return self.inicio + timedelta(days=n)
+
+    def el_dia(self, n):
+        return mock.patch('django.utils.timezone.now', return_value=self.dia(n))
+
+    def historia(self):
+        # 10 entran, se venden 3, entran 5 y hace 5 días se venden 2
+        with self.el_dia(0):
+            recibir(self.centro.pk, self.libro.pk, 10)
+        with self.el_dia(10):
+            sucursales.sacar(self.centro.pk, self.libro.pk, 3)
+        with self.el_dia(20):
+            recibir(self.centro.pk, self.libro.pk, 5)
+        with self.el_dia(95):
+            sucursales.sacar(self.centro.pk, self.libro.pk, 2)
+
+    def en(self, n):
+        return existencia_en(self.libro.pk, self.dia(n))
+
+    def compactar(self, *args):
+        salida = StringIO()
+        call_command('compact_stock_ledger', '--pausa', 0, *args, stdout=salida)
+        return salida.getvalue()
+
+    def test_existencia_a_cualquier_fecha(self):
+        self.historia()
+        self.assertEqual([self.en(-1), self.en(5), self.en(15), self.en(50), self.en(99)], [0, 10, 7, 12, 10])
+        self.assertEqual(existencia_en(self.libro.pk, self.dia(50), sucursal_id=self.centro.pk), 12)
+        self.assertEqual(existencia_en(self.libro.pk, self.dia(50), sucursal_id=self.centro.pk + 1), 0)
+
+    def test_despues_de_compactar_las_fechas_dan_lo_mismo(self):
+        self.historia()
+        with self.el_dia(45):
+            compactar(self.dia(15), lote=1)
+        self.assertIn('La bitácora cuadra', self.compactar('--conservar-dias', 30, '--lote', 1, '--verificar'))
+        self.assertEqual(MovimientoStock.objects.count(), 1)
+        self.assertEqual(list(CorteExistencia.objects.order_by('fecha').values_list('cantidad', flat=True)), [7, 12])
+        # En cada corte y desde el último, lo mismo que con la historia completa
+        self.assertEqual([self.en(15), self.en(71), self.en(80), self.en(99)], [7, 12, 12, 10])
+        # Entre cortes la resolución es la del corte anterior; antes del primero no queda nada que sumar
+        self.assertEqual([self.en(5), self.en(50)], [0, 7])
+        self.assertEqual(existencias_en(timezone.now()), {(self.libro.pk, self.centro.pk): 10})
+
+    def test_compactar_dos_veces_al_mismo_corte_no_duplica(self):
+        self.historia()
+        hasta = self.dia(50)
+        self.assertEqual(compactar(hasta), (1, 3))
+        self.assertEqual(compactar(hasta), (0, 0))
+        self.assertEqual(CorteExistencia.objects.count(), 1)
+        self.assertEqual(self.en(99), 10)
+
+    def test_diferencias_con_la_tabla(self):
+        self.historia()
+        otro = self.crear_libro('Rayuela', categoria=self.libro.categoria)
+        self.surtir(otro, 4, self.centro)
+        self.assertEqual(diferencias(), {})
+        ExistenciaSucursal.objects.filter(libro=self.libro).update(cantidad=11)  # A mano, sin bitácora
+        ExistenciaSucursal.objects.filter(libro=otro)._raw_delete(connection.alias)  # Sin señal: sin ajuste
+        self.assertEqual(diferencias(), {(self.libro.pk, self.centro.pk): (10, 11), (otro.pk, self.centro.pk): (4, 0)})
+        self.assertEqual(diferencias([otro.pk]), {(otro.pk, self.centro.pk): (4, 0)})
+        self.assertIn('2 existencias no cuadran', self.compactar('--verificar'))
+
+    def test_compactar_valida_los_dias(self):
+        with self.assertRaises(CommandError):
+            self.compactar('--conservar-dias', -1)
+
+    def test_la_bitacora_inserta_por_lotes(self):
+        with Bitacora(lote=2) as bitacora:
+            with self.assertNumQueries(1):
+                for cantidad in (1, 0, -1):  # Los ceros no se anotan
+                    bitacora.anotar(self.centro.pk, self.libro.pk, 'ajuste', cantidad)
+            with self.assertNumQueries(0):
+                bitacora.anotar(self.centro.pk, self.libro.pk, 'ajuste', 3)
+        self.assertEqual(sorted(MovimientoStock.objects.values_list('cantidad', flat=True)), [-1, 1, 3])
+
+    def test_si_la_operacion_falla_no_se_anota_nada(self):
+        with self.assertRaises(SinExistencias), transaction.atomic():
+            with Bitacora() as bitacora:
+                bitacora.anotar(self.centro.pk, self.libro.pk, 'venta', -1)
+                raise SinExistencias('no alcanzó')
+        self.assertFalse(MovimientoStock.objects.exists())
+
+    def test_un_pedido_anota_todas_sus_lineas_juntas(self):
+        otro = self.crear_libro('Rayuela', categoria=self.libro.categoria)
+        self.surtir(self.libro, 3, self.centro)
+        self.surtir(otro, 3, self.centro)
+        with Bitacora() as bitacora:
+            sucursales.sacar(self.centro.pk, self.libro.pk, 1, bitacora)
+            sucursales.sacar(self.centro.pk, otro.pk, 2, bitacora)
+            self.assertEqual(len(bitacora.pendientes), 2)
+        self.assertEqual(MovimientoStock.objects.filter(tipo='venta').aggregate(t=Sum('cantidad'))['t'], -3)
+        self.assertEqual(diferencias(), {})
+
+
+# =======================================================
+# LIMPIEZA PERIÓDICA
+# =======================================================
+
+class LimpiezaTests(PruebaLibreria):
+
+    def sesiones(self, vencidas, vigentes=0):
+        ahora = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f'vencida{i}', session_data='', expire_date=ahora - timedelta(hours=1))
+             for i in range(vencidas)]
+            + [Session(session_key=f'vigente{i}', session_data='', expire_date=ahora + timedelta(days=1))
+               for i in range(vigentes)]
+        )
+
+    def carrito(self, usuario, libro, dias):
+        item = CarritoItem.objects.create(usuario=usuario, libro=libro)
+        CarritoItem.objects.filter(pk=item.pk).update(actualizado=timezone.now() - timedelta(days=dias))  # auto_now
+
+    def limpiar(self, *args):
+        salida = StringIO()
+        call_command('housekeeping', '--pausa', 0, *args, stdout=salida)
+        return salida.getvalue()
+
+    def test_sesiones_vencidas_por_lotes(self):
+        self.sesiones(5, vigentes=2)
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(mantenimiento.borrar_sesiones(lote=2, pausa=0), 5)
+        self.assertEqual(sum(c['sql'].startswith('DELETE') for c in consultas.captured_queries), 3)  # 2, 2 y 1
+        self.assertEqual(sorted(Session.objects.values_list('session_key', flat=True)), ['vigente0', 'vigente1'])
+
+    def test_el_aviso_de_parar_corta_entre_lotes(self):
+        self.sesiones(5)
+        detener = threading.Event()
+        detener.set()
+        self.assertEqual(mantenimiento.borrar_sesiones(lote=2, pausa=0, detener=detener), 2)
+        self.assertEqual(Session.objects.count(), 3)
+
+    def test_un_renglon_reciente_mantiene_vivo_todo_el_carrito(self):
+        libros = [self.crear_libro(f'Libro {i}') for i in range(2)]
+        olvidado, activo, nuevo = (self.crear_usuario(n) for n in ('olvidado', 'activo', 'nuevo'))
+        for libro in libros:
+            self.carrito(olvidado, libro, dias=40)
+        self.carrito(activo, libros[0], dias=40)
+        self.carrito(activo, libros[1], dias=1)
+        self.carrito(nuevo, libros[0], dias=10)
+        self.assertEqual(mantenimiento.borrar_carritos(dias=30, lote=1, pausa=0), 2)
+        self.assertEqual(sorted(CarritoItem.objects.values_list('usuario__username', flat=True)),
+                         ['activo', 'activo', 'nuevo'])
+        with self.settings(CARRITO_INACTIVO_DIAS=5):
+            self.assertEqual(mantenimiento.borrar_carritos(pausa=0), 1)
+        self.assertEqual(CarritoItem.objects.count(), 2)
+
+    def test_comando_solo_borrar(self):
+        self.sesiones(3)
+        CambioCatalogo.objects.create(tipo='portada')
+        salida = self.limpiar('--sin-sqlite', '--lote', 2)
+        self.assertIn('Sesiones vencidas: 3', salida)
+        self.assertIn('Cambios de catálogo sin páginas pre-renderizadas: 1', salida)
+        self.assertNotIn('ANALYZE', salida)
+        self.assertIn('Limpieza terminada', salida)
+        self.assertFalse(Session.objects.exists())
+
+    def test_comando_con_mantenimiento_de_sqlite(self):
+        self.sesiones(1)
+        with mock.patch('app_libreria.management.commands.housekeeping.vaciar',
+                        return_value=mantenimiento.Vacio('incremental', 4096, 10, 2)) as vaciar:
+            salida = self.limpiar('--paginas', 50)
+        self.assertIn(f'ANALYZE: {Session._meta.db_table}', salida)
+        self.assertIn('Vacío incremental: 8 páginas', salida)
+        self.assertEqual(vaciar.call_args.kwargs['paginas'], 50)
+        with mock.patch('app_libreria.management.commands.housekeeping.vaciar',
+                        return_value=mantenimiento.Vacio('ninguno', 4096, 10, 10)):
+            self.assertIn('--activar-vacio-incremental', self.limpiar())
+
+    def test_sigterm_deja_la_pasada_sin_empezar_lo_demas(self):
+        self.sesiones(3)
+        comando = housekeeping.Command(stdout=StringIO())
+        comando.detener = threading.Event()
+        comando.detener.set()
+        comando._pasada({'lote': 2, 'pausa': 0, 'dias_carrito': None, 'paginas': 10, 'sin_sqlite': False})
+        self.assertIn('Limpieza interrumpida por SIGTERM', comando.stdout.getvalue())
+        self.assertEqual(Session.objects.count(), 3)
+
+
+# =======================================================
+# LIBROS PARECIDOS POR CONTENIDO
+# =======================================================
+
+@skipIf(similares.np is None, 'requiere numpy y scipy')
+class SimilaresTests(PruebaLibreria):
+    RELLENO = ('cocina mexicana recetas', 'jardineria huertos macetas', 'ajedrez aperturas partidas',
+               'fotografia camaras lentes', 'carpinteria madera herramientas', 'astronomia telescopios estrellas',
+               'guitarra acordes canciones', 'yoga posturas respiracion', 'finanzas ahorro inversion',
+               'montanismo rutas cumbres', 'acuarela pinceles colores', 'programacion python algoritmos')
+
+    def setUp(self):
+        super().setUp()
+        novela, ciencia, manuales = (self.crear_categoria(n) for n in ('Novela', 'Ciencia', 'Manuales'))
+        self.cien = self.crear_libro('Cien años de soledad', 'Gabriel García Márquez', novela,
+                                     descripcion='Macondo y la familia Buendía, soledad y memoria')
+        self.otono = self.crear_libro('El otoño del patriarca', 'Gabriel García Márquez', novela,
+                                      descripcion='Un dictador del Caribe, su soledad y su memoria')
+        self.tiempo = self.crear_libro('Breve historia del tiempo', 'Stephen Hawking', ciencia,
+                                       descripcion='El universo, los agujeros negros y el tiempo')
+        self.cascara = self.crear_libro('El universo en una cáscara de nuez', 'Stephen Hawking', ciencia,
+                                        descripcion='Cosmología del universo y el tiempo')
+        for tema in self.RELLENO:
+            self.crear_libro(f'Manual de {tema.split()[0]}', f'Autor {tema.split()[1]}', manuales, descripcion=tema)
+
+    def calcular(self, *args):
+        salida = StringIO()
+        call_command('similares', '--top-k', 2, *args, stdout=salida)
+        return salida.getvalue()
+
+    def vecinos(self, libro):
+        return list(LibroSimilar.objects.filter(libro=libro).values_list('similar_id', flat=True))
+
+    def tabla(self):
+        return sorted(LibroSimilar.objects.values_list('libro_id', 'posicion', 'similar_id'))
+
+    def test_el_vecino_mas_parecido_va_primero(self):
+        self.assertIn('Completo: 16 libros vectorizados', self.calcular())
+        self.assertEqual(self.vecinos(self.cien)[0], self.otono.pk)
+        self.assertEqual(self.vecinos(self.tiempo)[0], self.cascara.pk)
+        for libro in (self.cien, self.tiempo):
+            puntajes = list(LibroSimilar.objects.filter(libro=libro).values_list('puntaje', flat=True))
+            self.assertEqual(puntajes, sorted(puntajes, reverse=True))
+        self.assertFalse(LibroSimilar.objects.filter(libro_id=F('similar_id')).exists())
+        self.assertEqual(self.calcular(), 'No hay libros nuevos ni cambiados desde la última ejecución.\n')
+
+    def test_la_pasada_incremental_solo_recalcula_lo_afectado(self):
+        self.calcular()
+        cronica = self.crear_libro('Crónica de una muerte anunciada', 'Gabriel García Márquez',
+                                   self.cien.categoria, descripcion='Una muerte anunciada en un pueblo del Caribe')
+        salida = self.calcular()
+        self.assertIn('Incremental: 1 libros vectorizados', salida)
+        recalculados = int(salida.split('quitados, ')[1].split()[0])
+        self.assertLess(recalculados, Libro.objects.count())
+        self.assertEqual(set(self.vecinos(cronica)), {self.cien.pk, self.otono.pk})
+        self.assertIn(cronica.pk, self.vecinos(self.otono))
+        # Lo mismo que un cálculo completo desde cero
+        incremental = set(self.vecinos(cronica))
+        self.calcular('--completo')
+        self.assertEqual(set(self.vecinos(cronica)), incremental)
+
+    def test_un_libro_borrado_sale_de_los_vecindarios(self):
+        self.calcular()
+        Libro.todos.filter(pk=self.otono.pk).update(eliminado=True)
+        self.assertIn('1 quitados', self.calcular())
+        self.assertEqual(self.vecinos(self.otono), [])
+        self.assertNotIn(self.otono.pk, LibroSimilar.objects.values_list('similar_id', flat=True))
+
+    def test_los_bloques_no_cambian_el_resultado(self):
+        self.calcular()
+        esperado = self.tabla()
+        self.calcular('--completo', '--memoria-mb', 0)  # Una fila por bloque
+        self.assertEqual(self.tabla(), esperado)
+
+    def test_cambiar_las_columnas_obliga_a_un_calculo_completo(self):
+        self.calcular()
+        self.assertIn('Completo', self.calcular('--bits', 12))
+        self.assertEqual(self.vecinos(self.cien)[0], self.otono.pk)
+
+    def test_la_api_y_el_carrito_leen_los_vecinos(self):
+        self.calcular()
+        resultados = self.client.get(f'/api/libros/{self.tiempo.pk}/similares/').json()['resultados']
+        self.assertEqual(resultados[0]['id'], self.cascara.pk)
+        self.assertEqual([l.id for l in sugerencias_carrito([self.cien.pk], limite=1)], [self.otono.pk])
+
+    def test_palabras_sin_acentos_ni_plurales(self):
+        self.assertEqual(similares.palabras('Las Novelas de 1967 y más autores'), ['novela', 'autor'])
+        conteo = similares.terminos('Novelas', 'García Márquez', 3, 'una novela')
+        self.assertEqual(conteo['novela'], 1 + similares.PESO_TITULO)
+        self.assertEqual(conteo['autor:garcia marquez'], similares.PESO_AUTOR)
+
+    def test_sin_numpy(self):
+        with mock.patch('app_libreria.management.commands.similares.np', None):
+            with self.assertRaisesMessage(CommandError, 'numpy'):
+                self.calcular()
@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings 
 from django.conf.urls.static import static 
-from . import views
+from . import views, api
 
 # =======================================================
 # 1. RUTAS DE LA APLICACIÓN (FRONTEND & AUTENTICACIÓN)
@@ -28,6 +28,13 @@ urlpatterns = [
     path('agregar/<int:libro_id>/', views.agregar_carrito, name='agregar_carrito'),
     path('carrito/', views.ver_carrito, name='ver_carrito'),
 
+    # ------------------ API JSON ------------------
+    path('api/autocomplete/', api.autocompletar, name='api_autocomplete'),
+    path('api/libros/', api.libros, name='api_libros'),
+    path('api/categorias/', api.categorias, name='api_categorias'),
+    path('api/inventario/', api.inventario, name='api_inventario'),
+    path('api/libros/<int:libro_id>/similares/', api.similares, name='api_libro_similares'),
+
     # ------------------ Home (Raíz del sitio) ------------------
     # 'inicio' apunta a dashboard, que es la vista principal para los usuarios
     path('', views.dashboard, name='inicio'), 
@@ -50,6 +57,7 @@ urlpatterns = [
     path('admin-panel/libros/crear/', views.LibroCreateView.as_view(), name='admin_libros_create'),
     path('admin-panel/libros/editar/<int:pk>/', views.LibroUpdateView.as_view(), name='admin_libros_edit'),
     path('admin-panel/libros/eliminar/<int:pk>/', views.LibroDeleteView.as_view(), name='admin_libros_delete'),
+    path('admin-panel/libros/repreciar/', views.LibroRepreciarView.as_view(), name='admin_libros_repreciar'),
     
     # ------------------ CRUD de Proveedores ------------------
     path('admin-panel/proveedores/', views.ProveedorListView.as_view(), name='admin_proveedores_list'),
@@ -74,6 +82,7 @@ urlpatterns = [
     path('admin-panel/inventario/crear/', views.InventarioCreateView.as_view(), name='admin_inventario_create'),
     path('admin-panel/inventario/editar/<int:pk>/', views.InventarioUpdateView.as_view(), name='admin_inventario_edit'), 
     path('admin-panel/inventario/eliminar/<int:pk>/', views.InventarioDeleteView.as_view(), name='admin_inventario_delete'),
+    path('admin-panel/inventario/eventos/', views.inventario_eventos, name='admin_inventario_eventos'),
 ]
 
 # =======================================================
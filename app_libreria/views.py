@@ -1,15 +1,36 @@
 ﻿from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.views.generic import ListView, CreateView, UpdateView, DeleteView # Vistas Basadas en Clases
+from django.views.generic import ListView, CreateView, UpdateView, DeleteView, FormView # Vistas Basadas en Clases
 from django.urls import reverse_lazy, reverse # Importaciones para URLS
-from django.db.models import F 
+from django.db import transaction
+from django.db.models import Count, F 
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import datetime
 from decimal import Decimal # Cálculos financieros
 
 # Modelos del Proyecto
-from .models import Libro, Categoria, CarritoItem, Pedido, Proveedor, Inventario
+from .models import Libro, Categoria, CarritoItem, Pedido, DetallePedido, Proveedor, Inventario, PedidoArchivado, Sucursal
+from .catalogo import obtener_catalogo
+from .carrito import (
+    CarritoLigero, usa_carrito_ligero, lineas_del_carrito, contar_carrito,
+    agregar_en_db, fusionar_al_iniciar_sesion, descartar_carrito, clave_reserva, claves_reserva,
+)
+from .reservas import reservar, confirmar, SinExistencias
+from .sucursales import fijar, recibir, borrar_existencias, bajo_minimo
+from .movimientos import existencias_en
+from .limites import limitar, username_del_post
+from .recomendaciones import sugerencias_carrito
+from .forms import RepreciarForm, ExistenciaForm, NuevaExistenciaForm
+from . import precios
+from . import borrado
+from .eventos import hub, flujo_sse
+from .prerender import guardar_estado_cliente, borrar_estado_cliente
 
 # Componentes de autenticación y seguridad
 from django.contrib.auth.models import User 
@@ -24,6 +45,7 @@ def is_superuser_check(user):
 # =======================================================
 
 # 1. LOGIN
+@limitar('login', metodos=('POST',), usuario=username_del_post)
 def login_view(request):
     if request.user.is_authenticated:
         return redirect('dashboard')
@@ -33,34 +55,45 @@ def login_view(request):
         if form.is_valid():
             user = form.get_user()
             login(request, user)
-            return redirect('dashboard')
+            response = redirect('dashboard')
+            fusionar_al_iniciar_sesion(request, response)
+            guardar_estado_cliente(response, user, contar_carrito(request))
+            return response
     else:
         form = AuthenticationForm()
     return render(request, 'registration/login.html', {'form': form})
 
 # 2. REGISTRO
+@limitar('registro', metodos=('POST',))
 def registro_view(request):
     if request.method == 'POST':
         form = UserCreationForm(request.POST)
         if form.is_valid():
             user = form.save()
             login(request, user)
-            return redirect('dashboard')
+            response = redirect('dashboard')
+            fusionar_al_iniciar_sesion(request, response)
+            guardar_estado_cliente(response, user, contar_carrito(request))
+            return response
     else:
         form = UserCreationForm()
     return render(request, 'registration/registro.html', {'form': form})
 
 # 3. LOGOUT
 def logout_view(request):
+    carrito = CarritoLigero(request)  # Antes de logout(): con CARRITO_ALMACEN = 'sesion' vive en la sesión
     logout(request)
-    return redirect('login')
+    response = redirect('login')
+    descartar_carrito(carrito, response)
+    borrar_estado_cliente(response)
+    return response
 
 # 4. DASHBOARD (Página Principal con Bienvenida)
-@login_required(login_url='login') 
+# La tienda se puede recorrer sin cuenta: el carrito anónimo vive en la cookie/sesión
 def dashboard(request):
     nombres_deseados = ['Poesía', 'Novela', 'Historia'] 
-    categorias = Categoria.objects.filter(nombre__in=nombres_deseados)
-    carrito_count = CarritoItem.objects.filter(usuario=request.user).count()
+    categorias = obtener_catalogo().categorias_con_nombre(nombres_deseados)
+    carrito_count = contar_carrito(request)
     
     return render(request, 'libreria/dashboard.html', {
         'categorias': categorias,
@@ -68,11 +101,13 @@ def dashboard(request):
     })
 
 # 5. VER LIBROS POR CATEGORÍA
-@login_required(login_url='login')
 def libros_por_categoria(request, categoria_id):
-    categoria = get_object_or_404(Categoria, id=categoria_id)
-    libros = Libro.objects.filter(categoria=categoria)
-    carrito_count = CarritoItem.objects.filter(usuario=request.user).count()
+    catalogo = obtener_catalogo()
+    categoria = catalogo.categoria(categoria_id)
+    if categoria is None:
+        raise Http404("Categoría no encontrada")
+    libros = catalogo.libros_de_categoria(categoria_id)
+    carrito_count = contar_carrito(request)
     return render(request, 'libreria/libros.html', {
         'categoria': categoria, 
         'libros': libros,
@@ -80,43 +115,82 @@ def libros_por_categoria(request, categoria_id):
     })
 
 # 6. AÑADIR AL CARRITO
-@login_required(login_url='login')
+@limitar('agregar_carrito')
 def agregar_carrito(request, libro_id):
-    libro = get_object_or_404(Libro, id=libro_id)
-    item, created = CarritoItem.objects.get_or_create(usuario=request.user, libro=libro)
-    if not created:
-        item.cantidad += 1
-        item.save()
-    messages.success(request, f'"{libro.titulo}" añadido al carrito.')
-    return redirect(request.META.get('HTTP_REFERER', 'dashboard'))
+    libro = obtener_catalogo().libro(libro_id)
+    if libro is None:
+        raise Http404("Libro no encontrado")
+
+    carrito = CarritoLigero(request)
+    if usa_carrito_ligero(request) and not carrito.puede_agregar(libro_id):
+        messages.warning(request, 'Tu carrito está lleno. Finaliza tu compra para agregar más libros.')
+    elif not reservar(clave_reserva(request, carrito), libro_id):
+        messages.warning(request, f'Ya no quedan ejemplares disponibles de "{libro.titulo}".')
+    else:
+        if usa_carrito_ligero(request):
+            carrito.agregar(libro_id)
+        else:
+            agregar_en_db(request.user, libro_id)
+        messages.success(request, f'"{libro.titulo}" añadido al carrito.')
+    response = redirect(request.META.get('HTTP_REFERER', 'dashboard'))
+    carrito.guardar(response)
+    # Las páginas pre-renderizadas leen el badge de esta cookie
+    guardar_estado_cliente(response, request.user, contar_carrito(request, carrito))
+    return response
 
 # 7. VER CARRITO Y SIMULACIÓN DE PAGO
-@login_required(login_url='login')
 def ver_carrito(request):
-    items = CarritoItem.objects.filter(usuario=request.user)
+    carrito = CarritoLigero(request)
+    items = lineas_del_carrito(request, carrito)
     subtotal = sum(item.subtotal() for item in items)
     iva = subtotal * Decimal('0.16') 
     total = subtotal + iva
     
     if request.method == 'POST':
+        # Pagar sí requiere cuenta; el carrito ligero se conserva mientras inicia sesión
+        if not request.user.is_authenticated:
+            messages.info(request, 'Inicia sesión para finalizar tu compra.')
+            return redirect('login')
+
         direccion = request.POST.get('direccion')
         
-        Pedido.objects.create(usuario=request.user, direccion=direccion, total=total)
-        
-        items.delete()
+        try:
+            with transaction.atomic():
+                # Lo reservado al agregar ya está apartado; solo se vuelve a pedir stock si caducó
+                sucursal_id = confirmar(claves_reserva(request, carrito), {item.libro.id: item.cantidad for item in items})
+                pedido = Pedido.objects.create(usuario=request.user, direccion=direccion, total=total,
+                                               sucursal_id=sucursal_id)
+                DetallePedido.objects.bulk_create([
+                    DetallePedido(pedido=pedido, libro_id=item.libro.id, cantidad=item.cantidad,
+                                  precio_unitario=item.libro.precio)
+                    for item in items
+                ])
+                CarritoItem.objects.filter(usuario=request.user).delete()
+        except SinExistencias as e:
+            titulos = ', '.join(item.libro.titulo for item in items if item.libro.id in e.libro_ids)
+            messages.error(request, f'Ya no hay existencias suficientes de: {titulos}.')
+            return redirect('ver_carrito')
+        carrito.vaciar()
         messages.success(request, '¡Compra realizada con éxito! Gracias por tu preferencia.')
-        return redirect('dashboard')
+        response = redirect('dashboard')
+        carrito.guardar(response)
+        guardar_estado_cliente(response, request.user, 0)
+        return response
 
-    return render(request, 'libreria/carrito.html', {
+    response = render(request, 'libreria/carrito.html', {
         'items': items, 
         'subtotal': subtotal, 
         'iva': iva, 
         'total': total,
-        'carrito_count': items.count()
+        'carrito_count': len(items),
+        'recomendaciones': sugerencias_carrito(item.libro.id for item in items),
     })
+    guardar_estado_cliente(response, request.user, len(items))
+    return response
 
 # ------------------ 🔑 VISTAS ADMINISTRATIVAS DE AUTENTICACIÓN (ACCESO FACILITADO) ------------------
 
+@limitar('admin_login', metodos=('POST',), usuario=username_del_post)
 def admin_login_view(request):
     # 1. Si el usuario ya está autenticado
     if request.user.is_authenticated:
@@ -145,9 +219,11 @@ def admin_login_view(request):
                 next_url = request.GET.get('next')
                 
                 if next_url:
-                    return redirect(next_url) 
+                    response = redirect(next_url) 
                 else:
-                    return redirect('admin_dashboard')
+                    response = redirect('admin_dashboard')
+                guardar_estado_cliente(response, user, contar_carrito(request))
+                return response
             else:
                 messages.error(request, 'Acceso denegado. Solo las credenciales de administrador son válidas aquí.')
         
@@ -180,7 +256,18 @@ class AdminDashboardView(AdminRequiredMixin, ListView):
         context['total_proveedores'] = Proveedor.objects.count()
         context['total_pedidos'] = Pedido.objects.count()
         context['total_usuarios'] = User.objects.count()
-        context['low_stock_items'] = Inventario.objects.filter(cantidad__lte=F('stock_minimo')).select_related('libro')
+        context['low_stock_items'] = Inventario.objects.filter(cantidad__lte=F('stock_minimo'), libro__eliminado=False).select_related('libro')
+        # Totales ya agregados por sucursales.py: una fila por sucursal, sin SUM
+        sucursales = list(Sucursal.objects.filter(activa=True))
+        # Stock bajo por sucursal: solo se leen las filas del índice parcial de existencias bajo su mínimo
+        por_sucursal = dict(bajo_minimo().values('sucursal_id').annotate(n=Count('id')).values_list('sucursal_id', 'n'))
+        for sucursal in sucursales:
+            sucursal.bajo_minimo = por_sucursal.get(sucursal.pk, 0)
+        context['sucursales'] = sucursales
+        context['bajo_minimo_sucursal'] = (
+            bajo_minimo().filter(sucursal__activa=True, libro__eliminado=False)
+            .select_related('libro', 'sucursal').order_by('sucursal__prioridad', 'cantidad')[:50]
+        )
         return context
 
 # ------------------ Gestión de Usuarios (Convertido a CBV) ------------------
@@ -191,7 +278,7 @@ class ListaUsuariosView(AdminRequiredMixin, ListView):
     context_object_name = 'users'
     
     def get_queryset(self):
-        return User.objects.all().order_by('id')
+        return User.objects.filter(usuarioeliminado__isnull=True).order_by('id')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -217,7 +304,7 @@ def eliminar_usuario(request, user_id):
     if usuario_a_borrar == request.user:
         messages.error(request, "No puedes eliminar tu propia cuenta desde aquí.")
     else:
-        usuario_a_borrar.delete()
+        borrado.eliminar_usuario(usuario_a_borrar)
         messages.success(request, f"Usuario {usuario_a_borrar.username} eliminado.")
         
     return redirect('lista_usuarios')
@@ -250,13 +337,13 @@ class ProveedorListView(AdminRequiredMixin, ListView):
 class ProveedorCreateView(AdminRequiredMixin, CreateView):
     model = Proveedor
     template_name = 'app_libreria/admin/proveedores_form.html'
-    fields = ['nombre', 'contacto', 'telefono', 'email', 'direccion']
+    fields = ['nombre', 'contacto', 'telefono', 'email', 'direccion', 'dias_entrega']
     success_url = reverse_lazy('admin_proveedores_list')
 
 class ProveedorUpdateView(AdminRequiredMixin, UpdateView):
     model = Proveedor
     template_name = 'app_libreria/admin/proveedores_form.html'
-    fields = ['nombre', 'contacto', 'telefono', 'email', 'direccion']
+    fields = ['nombre', 'contacto', 'telefono', 'email', 'direccion', 'dias_entrega']
     success_url = reverse_lazy('admin_proveedores_list')
 
 class ProveedorDeleteView(AdminRequiredMixin, DeleteView):
@@ -288,6 +375,30 @@ class LibroDeleteView(AdminRequiredMixin, DeleteView):
     template_name = 'app_libreria/admin/libros_confirm_delete.html' 
     success_url = reverse_lazy('admin_libros_list')
 
+    def form_valid(self, form):
+        # Borrado lógico: la cascada real la hace `manage.py purge_deleted` por lotes
+        borrado.eliminar_libros([self.object.pk])
+        return redirect(self.get_success_url())
+
+class LibroRepreciarView(AdminRequiredMixin, FormView):
+    # Primero muestra una vista previa; con el botón "aplicar" hace un solo UPDATE
+    form_class = RepreciarForm
+    template_name = 'app_libreria/admin/libros_repreciar.html'
+
+    def form_valid(self, form):
+        datos = form.cleaned_data
+        queryset = precios.libros_filtrados(datos['categoria'], datos['proveedor'], datos['autor'])
+        expresion = precios.expresion_precio(datos['tipo'], datos['valor'], datos['redondeo'],
+                                             datos['minimo'], datos['maximo'])
+
+        if 'aplicar' in self.request.POST:
+            actualizados = precios.aplicar(queryset, expresion)
+            messages.success(self.request, f"Precios actualizados en {actualizados} libros.")
+            return redirect('admin_libros_list')
+
+        resumen, muestra = precios.previsualizar(queryset, expresion)
+        return self.render_to_response(self.get_context_data(form=form, resumen=resumen, muestra=muestra))
+
 # -------------------- VISTAS CRUD DE PEDIDOS --------------------
 
 class PedidoListView(AdminRequiredMixin, ListView):
@@ -295,6 +406,25 @@ class PedidoListView(AdminRequiredMixin, ListView):
     template_name = 'app_libreria/admin/pedidos_list.html'
     context_object_name = 'pedidos'
 
+    def get(self, request, *args, **kwargs):
+        # ?archivados=1 consulta la base de archivo; por defecto nunca se toca
+        self.archivados = request.GET.get('archivados') == '1'
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        if self.archivados:
+            # El usuario vive en la otra base: prefetch en lugar de JOIN
+            return PedidoArchivado.objects.order_by('-fecha').prefetch_related('usuario', 'sucursal')
+        return super().get_queryset().select_related('usuario', 'sucursal')
+
+    def get_paginate_by(self, queryset):
+        return 100 if self.archivados else None
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['archivados'] = self.archivados
+        return context
+
 class PedidoCreateView(AdminRequiredMixin, CreateView):
     model = Pedido
     template_name = 'app_libreria/admin/pedidos_form.html'
@@ -336,27 +466,96 @@ class CategoriaDeleteView(AdminRequiredMixin, DeleteView):
     template_name = 'app_libreria/admin/categorias_confirm_delete.html' 
     success_url = reverse_lazy('admin_categorias_list')
 
+    def form_valid(self, form):
+        borrado.eliminar_categoria(self.object.pk)
+        return redirect(self.get_success_url())
+
 # -------------------- VISTAS CRUD DE INVENTARIO --------------------
 
 class InventarioListView(AdminRequiredMixin, ListView):
     model = Inventario
     template_name = 'app_libreria/admin/inventario_list.html'
     context_object_name = 'inventarios'
-    queryset = Inventario.objects.select_related('libro').all() 
+    queryset = Inventario.objects.select_related('libro').filter(libro__eliminado=False) 
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # ?al=AAAA-MM-DD agrega el stock al cierre de ese día (último corte + movimientos)
+        try:
+            dia = parse_date(self.request.GET.get('al', ''))
+        except ValueError:
+            dia = None
+        if dia is not None:
+            cierre = timezone.make_aware(datetime.combine(dia, datetime.max.time()))
+            por_libro = {}
+            for (libro_id, _), cantidad in existencias_en(cierre).items():
+                por_libro[libro_id] = por_libro.get(libro_id, 0) + cantidad
+            for item in context['object_list']:
+                item.cantidad_al = por_libro.get(item.libro_id, 0)
+        context['al'] = dia
+        return context
+
+# La cantidad se captura por sucursal; Inventario.cantidad es el total que mantiene sucursales.py
+
+def guardar_movimiento(form, libro_id):
+    sucursal_id = form.cleaned_data['sucursal'].pk
+    minimo = form.cleaned_data['minimo_sucursal']
+    if form.cleaned_data['movimiento'] == 'entrada':
+        recibir(sucursal_id, libro_id, form.cleaned_data['cantidad'], minimo)
+    else:
+        fijar(sucursal_id, libro_id, form.cleaned_data['cantidad'], minimo)
 
 class InventarioCreateView(AdminRequiredMixin, CreateView):
     model = Inventario
     template_name = 'app_libreria/admin/inventario_form.html'
-    fields = ['libro', 'cantidad', 'stock_minimo']
+    form_class = NuevaExistenciaForm
     success_url = reverse_lazy('admin_inventario_list')
 
+    def form_valid(self, form):
+        libro = form.cleaned_data['libro']
+        guardar_movimiento(form, libro.pk)
+        Inventario.objects.filter(libro=libro).update(stock_minimo=form.cleaned_data['stock_minimo'])
+        return redirect(self.success_url)
+
 class InventarioUpdateView(AdminRequiredMixin, UpdateView):
     model = Inventario
     template_name = 'app_libreria/admin/inventario_form.html'
-    fields = ['cantidad', 'stock_minimo'] 
+    form_class = ExistenciaForm
     success_url = reverse_lazy('admin_inventario_list')
 
+    def get_initial(self):
+        existencia = self.object.libro.existencias.filter(sucursal__activa=True).order_by('sucursal__prioridad').first()
+        if existencia is None:
+            return {}
+        return {'sucursal': existencia.sucursal_id, 'cantidad': existencia.cantidad,
+                'minimo_sucursal': existencia.stock_minimo}
+
+    def form_valid(self, form):
+        guardar_movimiento(form, self.object.libro_id)
+        # Con UPDATE: self.object trae los totales de antes de guardar_movimiento y un save()
+        # los pisaría (y publicaría un evento con ellos)
+        Inventario.objects.filter(pk=self.object.pk).update(stock_minimo=form.cleaned_data['stock_minimo'])
+        return redirect(self.get_success_url())
+
 class InventarioDeleteView(AdminRequiredMixin, DeleteView):
     model = Inventario
     template_name = 'app_libreria/admin/inventario_confirm_delete.html' 
-    success_url = reverse_lazy('admin_inventario_list')
\ No newline at end of file
+    success_url = reverse_lazy('admin_inventario_list')
+
+    def form_valid(self, form):
+        borrar_existencias(self.object.libro_id)
+        return redirect(self.get_success_url())
+
+# Cambios de inventario en vivo (Server-Sent Events) para la lista y el dashboard.
+# Requiere servidor ASGI (uvicorn, daphne): bajo WSGI cada pestaña ocuparía un hilo
+# para siempre, así que respondemos 204 y el navegador deja de reconectar.
+async def inventario_eventos(request):
+    user = await request.auser()
+    if not user.is_superuser:
+        return HttpResponseForbidden()
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(flujo_sse(hub.suscribir()), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: no acumular los eventos
+    return response
\ No newline at end of file
@@ -12,5 +12,11 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_libreria.settings')
+# Proceso servidor: precalentar plantillas, URLs y catálogo (app_libreria/arranque.py)
+os.environ.setdefault('LIBRERIA_CALENTAR', '1')
 
 application = get_asgi_application()
+
+from app_libreria.arranque import despues_de_cargar  # noqa: E402
+
+despues_de_cargar()
@@ -25,6 +25,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'app_libreria.middleware.CompresionMiddleware',  # brotli/gzip + HTML minificado
+    'app_libreria.middleware.PrerenderMiddleware',  # Antes de sesiones: las páginas estáticas no tocan la base
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -42,7 +44,27 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # Pedidos viejos (archive_orders). Crear sus tablas con: migrate --database=archivo
+    'archivo': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'archivo.sqlite3',
+    },
+}
+DATABASE_ROUTERS = ['app_libreria.archivo.ArchivoRouter']
+
+# Caché compartida por todos los workers y los comandos de manage.py. Es
+# NECESARIA: la versión del catálogo (catalogo.py), los ETag de la API y los
+# límites de peticiones viven aquí. Con la LocMemCache por defecto de Django
+# cada proceso tendría la suya y un cambio (en otro worker o desde un comando)
+# no invalidaría el catálogo de los demás. Con varios servidores, usar Redis:
+# 'django.core.cache.backends.redis.RedisCache'.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'datos' / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
 }
 
 # Password validation
@@ -101,6 +123,24 @@ TEMPLATES = [
     },
 ]
 
+# Motor Jinja2 opcional para la tienda (dashboard, categorías y carrito).
+# Va primero para que sus plantillas ganen; el panel admin sigue con Django.
+if os.environ.get('LIBRERIA_JINJA2') == '1':
+    TEMPLATES.insert(0, {
+        'BACKEND': 'django.template.backends.jinja2.Jinja2',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'environment': 'app_libreria.jinja2_env.environment',
+            'autoescape': True,
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+            ],
+        },
+    })
+
 # Authentication
 LOGIN_URL = '/admin_login/'
 LOGIN_REDIRECT_URL = '/dashboard/'
@@ -122,4 +162,55 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 # Session configuration
 SESSION_ENGINE = 'django.contrib.sessions.backends.db'
 SESSION_COOKIE_AGE = 1209600 
-SESSION_EXPIRE_AT_BROWSER_CLOSE = False
\ No newline at end of file
+SESSION_EXPIRE_AT_BROWSER_CLOSE = False
+
+# Carrito: 'ligero' guarda todos los carritos fuera de la base hasta pagar;
+# 'db' usa CarritoItem para usuarios autenticados (los anónimos siguen en cookie)
+CARRITO_MODO = 'ligero'
+CARRITO_ALMACEN = 'cookie'  # 'cookie' (firmada) o 'sesion'
+
+# Limpieza periódica (manage.py housekeeping --cada 3600): sesiones vencidas,
+# carritos en base sin cambios en estos días y ANALYZE / vacío incremental de SQLite
+CARRITO_INACTIVO_DIAS = 30
+
+# Minutos que un libro queda apartado en el carrito; las reservas caducadas
+# las libera `manage.py expire_reservations --cada 60`
+RESERVA_MINUTOS = 15
+
+# Límites de peticiones (token bucket) y tope de peticiones simultáneas por proceso.
+# Formato: ruta -> {'ip' | 'usuario': (capacidad, segundos)}
+LIMITES_CACHE = 'default'
+LIMITE_CONCURRENCIA = 16
+LIMITES_PETICIONES = {
+    'login': {'ip': (20, 60), 'usuario': (5, 60)},
+    'admin_login': {'ip': (10, 60), 'usuario': (5, 60)},
+    'registro': {'ip': (5, 300)},
+    'agregar_carrito': {'ip': (60, 60), 'usuario': (30, 60)},
+}
+# Servidor para `manage.py loadtest`: LIBRERIA_SIN_LIMITES=1 quita los límites para
+# que la prueba mida la capacidad de la tienda y no los 429 (todos vienen de una IP)
+if os.environ.get('LIBRERIA_SIN_LIMITES') == '1':
+    LIMITES_PETICIONES = {}
+
+# Recomendaciones precalculadas (manage.py recomendaciones; requiere numpy y scipy)
+RECOMENDACIONES_DIR = BASE_DIR / 'datos' / 'recomendaciones'
+RECOMENDACIONES_TOP_K = 10
+# Libros parecidos por contenido (manage.py similares, p. ej. cada noche; mismo directorio de estado)
+SIMILARES_TOP_K = 10
+
+# Páginas públicas pre-renderizadas (manage.py prerender_catalog, p. ej. cada minuto por cron).
+# PRERENDER_SERVIR activa PrerenderMiddleware; en producción mejor que las sirva nginx.
+PRERENDER_DIR = BASE_DIR / 'datos' / 'prerender'
+PRERENDER_SERVIR = False
+
+# Compresión de respuestas (CompresionMiddleware). brotli es opcional: pip install brotli
+COMPRESION_MINIMO = 1024  # Bytes; por debajo no vale la pena
+COMPRESION_BROTLI_CALIDAD = 5  # 0-11; arriba de 6 cuesta mucho CPU por respuesta
+MINIFICAR_HTML = True  # Ponlo en False para leer el HTML al depurar
+
+# Precalentar plantillas, URLs y catálogo al arrancar cada worker (app_libreria/arranque.py).
+# Con gunicorn --preload y LIBRERIA_PRELOAD=1 se hace una vez y los workers lo heredan.
+ARRANQUE_CALENTAR = True
+
+# Respaldos en caliente (manage.py backup_db, p. ej. cada noche por cron)
+RESPALDOS_DIR = BASE_DIR / 'datos' / 'respaldos'
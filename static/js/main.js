@@ -62,6 +62,155 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
     
+    // Autocompletado del buscador (índice en memoria del servidor)
+    document.querySelectorAll('input[data-autocomplete-url]').forEach(input => {
+        const lista = document.createElement('datalist');
+        lista.id = `${input.id || input.name}-sugerencias`;
+        input.setAttribute('list', lista.id);
+        input.after(lista);
+
+        let temporizador = null;
+        let peticion = null;
+        input.addEventListener('input', function() {
+            clearTimeout(temporizador);
+            const q = this.value.trim();
+            if (q.length < 2) {
+                lista.replaceChildren();
+                return;
+            }
+            temporizador = setTimeout(() => {
+                if (peticion) peticion.abort();
+                peticion = new AbortController();
+                fetch(`${input.dataset.autocompleteUrl}?q=${encodeURIComponent(q)}`, { signal: peticion.signal })
+                    .then(resp => resp.json())
+                    .then(data => {
+                        lista.replaceChildren(...data.resultados.map(libro => {
+                            const opcion = document.createElement('option');
+                            opcion.value = libro.titulo;
+                            opcion.label = libro.autor;
+                            opcion.dataset.categoria = libro.categoria_id;
+                            return opcion;
+                        }));
+                    })
+                    .catch(() => {});
+            }, 120);
+        });
+
+        // Buscador de la barra: elegir una sugerencia (o Enter sobre ella) lleva a la categoría del libro
+        const formulario = input.closest('form[data-busqueda-url]');
+        if (formulario) {
+            const irALibro = () => {
+                const elegida = [...lista.options].find(opcion => opcion.value === input.value);
+                if (elegida) {
+                    window.location = formulario.dataset.busquedaUrl.replace('/0/', `/${elegida.dataset.categoria}/`);
+                }
+            };
+            input.addEventListener('change', irALibro);
+            formulario.addEventListener('submit', evento => {
+                evento.preventDefault();
+                irALibro();
+            });
+        }
+    });
+    
+    // Páginas pre-renderizadas: lo personal sale de la cookie 'tienda' ("carrito:admin:usuario")
+    if ('prerender' in document.body.dataset) {
+        const cookie = document.cookie.split('; ').find(c => c.startsWith('tienda='));
+        const [enCarrito, esAdmin, usuario] = (cookie ? cookie.slice(7) : '0:0:').split(':');
+        const nombre = usuario ? decodeURIComponent(usuario) : '';
+        const cantidad = parseInt(enCarrito, 10) || 0;
+
+        document.querySelectorAll('[data-carrito-badge]').forEach(badge => {
+            badge.textContent = cantidad;
+            badge.hidden = cantidad === 0;
+        });
+        document.querySelectorAll('[data-solo-sesion]').forEach(el => { el.hidden = !nombre; });
+        document.querySelectorAll('[data-solo-anonimo]').forEach(el => { el.hidden = !!nombre; });
+        document.querySelectorAll('[data-solo-admin]').forEach(el => { el.hidden = !(nombre && esAdmin === '1'); });
+        if (nombre) {
+            document.querySelectorAll('[data-usuario]').forEach(el => { el.textContent = nombre; });
+        }
+    }
+
+    // Inventario en vivo (Server-Sent Events): solo se parchan las filas que cambiaron
+    const tablasEventos = document.querySelectorAll('[data-eventos-url]');
+    if (tablasEventos.length && window.EventSource) {
+        const fuente = new EventSource(tablasEventos[0].dataset.eventosUrl);
+
+        const pintarFila = (fila, datos) => {
+            fila.querySelectorAll('[data-campo]').forEach(celda => {
+                const campo = celda.dataset.campo;
+                if (campo === 'estado') {
+                    celda.textContent = datos.bajo ? '**¡Bajo Stock!**' : 'Normal';
+                } else if (campo === 'reservado_texto') {
+                    celda.textContent = datos.reservado ? `(${datos.reservado} en carritos)` : '';
+                } else if (campo in datos) {
+                    celda.textContent = datos[campo];
+                }
+            });
+            fila.querySelectorAll('[data-color-bajo]').forEach(celda => {
+                celda.style.color = datos.bajo ? 'red' : 'green';
+            });
+        };
+
+        // Fila nueva para la tarjeta de stock bajo del dashboard (misma forma que la plantilla)
+        const filaBajoStock = datos => {
+            const fila = document.createElement('tr');
+            fila.dataset.inventarioId = datos.id;
+            const celdas = [0, 1, 2, 3].map(() => {
+                const td = document.createElement('td');
+                td.style.cssText = 'padding: 10px; border-bottom: 1px solid #eee;';
+                fila.append(td);
+                return td;
+            });
+            const cantidad = document.createElement('span');
+            cantidad.dataset.campo = 'cantidad';
+            celdas[0].textContent = datos.titulo;
+            celdas[1].append('**', cantidad, '**');
+            celdas[2].dataset.campo = 'stock_minimo';
+            const enlace = document.createElement('a');
+            enlace.href = datos.url_editar;
+            enlace.textContent = 'Ajustar';
+            celdas[3].append(enlace);
+            return fila;
+        };
+
+        const actualizarVacia = tabla => {
+            const vacia = !tabla.tBodies[0].rows.length;
+            tabla.hidden = vacia;
+            const aviso = document.querySelector('[data-sin-bajo-stock]');
+            if (aviso) aviso.hidden = !vacia;
+        };
+
+        fuente.addEventListener('inventario', e => {
+            const datos = JSON.parse(e.data);
+            tablasEventos.forEach(tabla => {
+                let fila = tabla.querySelector(`tr[data-inventario-id="${datos.id}"]`);
+                if ('bajoStock' in tabla.dataset) {
+                    // Cruces del umbral: la fila entra o sale de la tarjeta
+                    if (!datos.bajo && fila) {
+                        fila.remove();
+                        fila = null;
+                    } else if (datos.bajo && !fila) {
+                        fila = filaBajoStock(datos);
+                        tabla.tBodies[0].append(fila);
+                    }
+                    actualizarVacia(tabla);
+                }
+                if (fila) pintarFila(fila, datos);
+            });
+        });
+
+        fuente.addEventListener('inventario-borrado', e => {
+            const datos = JSON.parse(e.data);
+            tablasEventos.forEach(tabla => {
+                const fila = tabla.querySelector(`tr[data-inventario-id="${datos.id}"]`);
+                if (fila) fila.remove();
+                if ('bajoStock' in tabla.dataset) actualizarVacia(tabla);
+            });
+        });
+    }
+    
     // Funciones de ayuda
     function showAlert(message, type) {
         const alertDiv = document.createElement('div');